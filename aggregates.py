@@ -0,0 +1,121 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+
+# Dimensions of the aggregate cube. Every chart that only needs counts or
+# means over these keys is answered by rolling the cube up instead of
+# scanning the listings again.
+DIMENSIONS = ["Marketplace", "Brand", "Model", "Year", "Fuel_Type"]
+MEASURES = ["cleaned_Price", "Consumption"]
+
+MARKETPLACE_ORDER = ["Auto.de", "Autoscout24.de", "Mobile.de"]
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def build_cube(df):
+    # One row per observed dimension combination with the listing count and
+    # n / sum / sum of squares for each measure (enough for mean and variance)
+    work = df[DIMENSIONS].copy()
+    aggs = {"count": ("Marketplace", "size")}
+    for col in MEASURES:
+        values = df[col].astype(np.float64)
+        work[col + "_n"] = values.notna().astype(np.int64)
+        work[col + "_sum"] = values.fillna(0)
+        work[col + "_sumsq"] = values.fillna(0) ** 2
+        for stat in ("_n", "_sum", "_sumsq"):
+            aggs[col + stat] = (col + stat, "sum")
+    cube = work.groupby(DIMENSIONS, observed=True, dropna=False).agg(**aggs)
+    return cube.reset_index()
+
+
+def merge_cubes(*cubes):
+    # Cubes are additive: the cube of appended rows is merged cell by cell
+    merged = pd.concat(cubes, ignore_index=True)
+    for col in DIMENSIONS:
+        if isinstance(merged[col].dtype, pd.CategoricalDtype):
+            merged[col] = merged[col].astype(object)
+    merged = merged.groupby(DIMENSIONS, observed=True, dropna=False, sort=False).sum()
+    return merged.reset_index()
+
+
+def get_cube(df, version):
+    # Build the cube once per dataset version and share it across reruns. When
+    # the dataset only grew by ingested batches, just the new rows are added.
+    with _lock:
+        if version not in _cache:
+            previous = next(iter(_cache.items()), None)
+            delta = None if previous is None else data_loader.delta_since(previous[0], version)
+            if delta is not None and len(delta) < len(df):
+                cube = merge_cubes(previous[1], build_cube(delta))
+            else:
+                cube = build_cube(df)
+            _cache.clear()
+            _cache[version] = cube
+        return _cache[version]
+
+
+def rollup(cube, dims):
+    # Sum the additive cube columns over everything not in dims. Rows with a
+    # missing key are dropped, like a plain groupby on the raw listings.
+    value_cols = [c for c in cube.columns if c not in DIMENSIONS]
+    return cube.groupby(dims, observed=True)[value_cols].sum().reset_index()
+
+
+def _cells(cube, selection):
+    # Mask of the cells matching selection, e.g. Brand="BMW". A list value
+    # selects any of its entries.
+    mask = np.ones(len(cube), dtype=bool)
+    for col, value in selection.items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        mask &= cube[col].isin(values).to_numpy()
+    return mask
+
+
+def count_rows(cube, **selection):
+    # Number of listings in the cells matching selection
+    return int(cube["count"].to_numpy()[_cells(cube, selection)].sum())
+
+
+def brand_share(cube, top_n=10):
+    # Percentage of each of the top_n brands (by total count) within each
+    # marketplace, brands as rows sorted by their Auto.de share
+    grouped = rollup(cube, ["Marketplace", "Brand"])
+    top_brands = grouped.groupby("Brand", observed=True)["count"].sum().nlargest(top_n).index
+    grouped = grouped[grouped["Brand"].isin(top_brands)]
+    source_totals = grouped.groupby("Marketplace", observed=True)["count"].transform("sum")
+    grouped = grouped.assign(percentage=(grouped["count"] / source_totals * 100).round(2))
+    pivot = grouped.pivot(index="Brand", columns="Marketplace", values="percentage").fillna(0)
+    pivot.index = pivot.index.astype(str)
+    pivot.columns = pivot.columns.astype(str)
+    # marketplaces without listings (e.g. filtered out) get zero shares
+    pivot = pivot.reindex(columns=MARKETPLACE_ORDER, fill_value=0)
+    return pivot.sort_index().sort_values(by="Auto.de", ascending=True, kind="stable")
+
+
+def approval_year_counts(cube):
+    # Listing counts per marketplace (rows) and initial approval year (columns),
+    # covering every year between the first and last one seen
+    grouped = rollup(cube, ["Year", "Marketplace"])
+    pivot = grouped.pivot_table(index="Marketplace", columns="Year", values="count",
+                                fill_value=0, observed=True)
+    pivot.index = pivot.index.astype(str)
+    years = list(range(int(grouped["Year"].min()), int(grouped["Year"].max()) + 1))
+    return pivot.reindex(index=MARKETPLACE_ORDER, columns=years, fill_value=0)
+
+
+def fuel_type_share(cube):
+    # Percentage of each fuel type within each marketplace, sorted by Auto.de
+    grouped = rollup(cube, ["Marketplace", "Fuel_Type"])
+    marketplace_totals = grouped.groupby("Marketplace", observed=True)["count"].transform("sum")
+    grouped = grouped.assign(percentage=(grouped["count"] / marketplace_totals * 100).round(2))
+    pivot = grouped.pivot(index="Fuel_Type", columns="Marketplace", values="percentage").fillna(0)
+    pivot.index = pivot.index.astype(str)
+    pivot.columns = pivot.columns.astype(str)
+    # marketplaces without listings (e.g. filtered out) get zero shares
+    pivot = pivot.reindex(columns=MARKETPLACE_ORDER, fill_value=0)
+    return pivot.sort_index().sort_values(by="Auto.de", ascending=True, kind="stable")
@@ -0,0 +1,591 @@
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import aggregates
+from aggregates import DIMENSIONS, MEASURES, MARKETPLACE_ORDER
+from boxplot_stats import group_values, grouped_boxplot, sketch_boxplot
+from comparables import FEATURES as COMPARABLE_FEATURES, RESULT_COLUMNS, ComparableIndex, get_comparable_index
+import depreciation
+from data_loader import CSV_PATH, STORE_DIR, cache_path, dataset_version, load_dataset
+from duplicates import BLOCK_COLUMNS, MATCH_COLUMNS, duplicate_mask
+import fuel_costs
+import histograms
+from filter_index import (COLLAPSE_DUPLICATES, CATEGORY_FILTERS, RANGE_FILTERS, combine_specs, filter_key,
+                          get_filter_index)
+from model_index import SLICE_COLUMNS, ModelIndex, get_model_index
+from quantile_sketch import get_sketches, merge_cells
+
+try:
+    import duckdb
+except ImportError:  # only needed for the out-of-core backend
+    duckdb = None
+
+# "pandas" keeps the whole dataset in memory, "duckdb" queries parquet files
+# in place. CAR_APP_PARQUET points the duckdb backend at a parquet file,
+# directory or glob (default: the loader's parquet cache of the CSV plus the
+# ingested batches in the listings store).
+BACKEND = os.environ.get("CAR_APP_BACKEND", "pandas")
+PARQUET_SOURCE = os.environ.get("CAR_APP_PARQUET", "")
+
+# columns the SQL backend may interpolate into queries
+VALUE_COLUMNS = {
+    "cleaned_Price", "log_cleaned_price", "Consumption", "Kilometer", "Power_PS",
+    "CO2_g_km", "Price_per_km", "Annual_Fuel_Cost", "car_age",
+}
+KEY_COLUMNS = set(DIMENSIONS) | {"Gear_Type"}
+FILTER_COLUMNS = set(CATEGORY_FILTERS) | set(RANGE_FILTERS)
+
+# Filtered views (see filtered()) kept per process, most recently used last
+FILTERED_VIEWS = 16
+
+# Listing columns read by fuel_costs.cost_sums, gathered by filtered views
+FUEL_COST_COLUMNS = ["Marketplace", "Brand", "Fuel_Type", "Consumption", "CO2_g_km", "cleaned_Price"]
+
+_backends = {}
+_lock = threading.Lock()
+_views = OrderedDict()
+
+
+def _filtered_view(backend, spec, factory):
+    # The view of backend restricted to spec, shared by all sessions using the
+    # same filters on the same dataset version
+    key = (backend.name, backend.version(), filter_key(spec))
+    with _lock:
+        if key in _views:
+            _views.move_to_end(key)
+            return _views[key]
+    view = factory()
+    with _lock:
+        # views of older dataset versions are never asked for again
+        for stale in [k for k in _views if k[0] == key[0] and k[1] != key[1]]:
+            del _views[stale]
+        _views[key] = view
+        while len(_views) > FILTERED_VIEWS:
+            _views.popitem(last=False)
+    return view
+
+
+class PandasBackend:
+    # In-memory backend: typed frame, aggregate cube, quantile sketches and the
+    # brand/model/year index, all built once per dataset version.
+
+    name = "pandas"
+
+    def version(self):
+        return dataset_version()
+
+    def cube(self):
+        return aggregates.get_cube(load_dataset(), self.version())
+
+    def row_count(self, **selection):
+        return aggregates.count_rows(self.cube(), **selection)
+
+    def brand_share(self, top_n=10):
+        return aggregates.brand_share(self.cube(), top_n=top_n)
+
+    def approval_year_counts(self):
+        return aggregates.approval_year_counts(self.cube())
+
+    def fuel_type_share(self):
+        return aggregates.fuel_type_share(self.cube())
+
+    def boxplot(self, value_col, categories=MARKETPLACE_ORDER, whisker=1.5, **selection):
+        # Boxes per marketplace of value_col for the listings matching selection
+        # (Brand=..., Model=..., Year=... or a list of years). Quartiles come
+        # from the cell sketches; whisker ends and outliers from one exact
+        # pass over the values.
+        df = load_dataset()
+        sketches = get_sketches(df, self.version(), value_col)
+        values = codes = None
+        if whisker is not None:
+            values, codes = group_values(df, value_col, "Marketplace", list(categories), **selection)
+        return sketch_boxplot([merge_cells(sketches, Marketplace=m, **selection) for m in categories],
+                              categories, whisker, values, codes)
+
+    def _index(self):
+        return get_model_index(load_dataset(), self.version())
+
+    def brands(self):
+        return self._index().brands()
+
+    def models(self, brand):
+        return self._index().models(brand)
+
+    def years(self, brand, model):
+        return self._index().years(brand, model)
+
+    def marketplaces(self, brand, model, year=None):
+        # Marketplaces with listings of brand/model (and year) in display order
+        present = set(self._index().slice(brand, model, year)["Marketplace"].unique())
+        return [m for m in MARKETPLACE_ORDER if m in present]
+
+    def _frame(self, columns):
+        # Listings with (at least) the given columns
+        return load_dataset()
+
+    def fuel_costs(self, prices, annual_km, years, top_n=10):
+        # What-if running costs per marketplace and for the top_n brands
+        # (see fuel_costs.py), recomputed for every listing
+        frame = self._frame(FUEL_COST_COLUMNS)
+        return fuel_costs.summarize(fuel_costs.cost_sums(frame, prices, annual_km, years), top_n)
+
+    def depreciation(self):
+        # Depreciation fit and marketplace gap of every (Brand, Model,
+        # Marketplace), see depreciation.py
+        return depreciation.get_fits(load_dataset(), self.version())
+
+    def histogram(self, value_col, group_col, bins=histograms.DEFAULT_BINS, top_n=histograms.TOP_GROUPS):
+        # Bin counts and density of value_col per group (see histograms.py)
+        return histograms.binned_counts(self._frame([value_col, group_col]), value_col, group_col, bins, top_n)
+
+    def comparables(self, brand, model, year_month, kilometer, power, k=5):
+        # k most similar listings of brand/model per marketplace (comparables.py)
+        index = get_comparable_index(load_dataset(), self.version())
+        return index.find(brand, model, year_month, kilometer, power, k)
+
+    def _filter_index(self):
+        return get_filter_index(load_dataset(), self.version())
+
+    def filter_options(self):
+        # Values of the category filters and (min, max) of the range filters
+        index = self._filter_index()
+        return ({col: index.options(col) for col in CATEGORY_FILTERS},
+                {col: index.bounds(col) for col in RANGE_FILTERS})
+
+    def filtered(self, spec):
+        # Backend over the listings matching the filter spec (see filter_index.py)
+        def build():
+            mask = self._filter_index().select(spec)
+            rows = None if mask is None else np.flatnonzero(mask).astype(np.int32)
+            return FilteredPandasBackend(self, spec, load_dataset(), rows, self.version() + "|" + filter_key(spec))
+        return _filtered_view(self, spec, build)
+
+
+class FilteredPandasBackend(PandasBackend):
+    # PandasBackend over a subset of the listings. The view only keeps the row
+    # positions of the subset (None for all rows); every query gathers the
+    # columns it reads from the dataset. The subset's cube and index are built
+    # on first use; boxplots are exact (grouped_boxplot).
+
+    def __init__(self, parent, spec, source, rows, version):
+        self.parent = parent
+        self.spec = spec
+        self.source = source
+        self.rows = rows
+        self._version = version
+        self._cube = None
+        self._model_index = None
+        self._comparables = None
+        self._depreciation = None
+
+    def version(self):
+        return self._version
+
+    def _frame(self, columns):
+        frame = self.source[list(dict.fromkeys(columns))]
+        if self.rows is None:
+            return frame
+        return frame.iloc[self.rows].reset_index(drop=True)
+
+    def cube(self):
+        if self._cube is None:
+            self._cube = aggregates.build_cube(self._frame(DIMENSIONS + MEASURES))
+        return self._cube
+
+    def boxplot(self, value_col, categories=MARKETPLACE_ORDER, whisker=1.5, **selection):
+        frame = self._frame(["Marketplace", value_col] + list(selection))
+        for col, value in selection.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            frame = frame[frame[col].isin(values)]
+        return grouped_boxplot(frame, value_col, "Marketplace", order=list(categories), whisker=whisker)
+
+    def _index(self):
+        if self._model_index is None:
+            self._model_index = ModelIndex(self._frame(["Brand", "Model"] + SLICE_COLUMNS))
+        return self._model_index
+
+    def depreciation(self):
+        if self._depreciation is None:
+            columns = depreciation.GROUP_COLUMNS + ["car_age", "Kilometer", depreciation.TARGET]
+            self._depreciation = depreciation.fit(depreciation.moments(self._frame(columns)))
+        return self._depreciation
+
+    def comparables(self, brand, model, year_month, kilometer, power, k=5):
+        if self._comparables is None:
+            self._comparables = ComparableIndex(self._frame(RESULT_COLUMNS + COMPARABLE_FEATURES))
+        return self._comparables.find(brand, model, year_month, kilometer, power, k)
+
+    def filtered(self, spec):
+        # Listings matching this view's filters and spec
+        return self.parent.filtered(combine_specs(self.spec, spec))
+
+
+class DuckDBBackend:
+    # Out-of-core backend: every computation is pushed down to DuckDB scanning
+    # the parquet files, only small results (the aggregate cube, quantiles,
+    # outliers, option lists) are materialized in pandas. Boxplots are exact.
+
+    name = "duckdb"
+
+    def __init__(self, sources):
+        if duckdb is None:
+            raise ImportError("the duckdb backend needs the duckdb package")
+        if isinstance(sources, str):
+            sources = [sources]
+        self.sources = [os.path.join(s, "**", "*.parquet") if os.path.isdir(s) else s for s in sources]
+        self._con = duckdb.connect()
+        self._cube = None
+        self._cube_version = None
+        self._comparables = {}
+        self._depreciation = None
+        self._depreciation_version = None
+        self._duplicate_tables = set()
+
+    def _files(self):
+        # files are scanned in this order, which defines "first appearance"
+        return [path for pattern in self.sources for path in sorted(glob.glob(pattern, recursive=True))]
+
+    def version(self):
+        # Changes whenever a parquet file is added, removed or rewritten
+        sha = hashlib.sha1()
+        for path in self._files():
+            stat = os.stat(path)
+            sha.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+        return sha.hexdigest()
+
+    def _scan(self):
+        files = ", ".join("'" + path.replace("'", "''") + "'" for path in self._files())
+        return (f"read_parquet([{files}], union_by_name=true, hive_partitioning=false, "
+                "filename=true, file_row_number=true)")
+
+    def _query(self, sql, params=()):
+        # cursors are independent connections, safe to use from several sessions
+        return self._con.cursor().execute(sql, list(params)).df()
+
+    def _where(self, selection):
+        clauses, params = [], []
+        for col, value in selection.items():
+            if col not in KEY_COLUMNS:
+                raise ValueError(f"unknown column {col!r}")
+            if isinstance(value, (list, tuple, set)):
+                value = list(value)
+                if not value:
+                    clauses.append("false")
+                    continue
+                clauses.append(f'"{col}" IN ({", ".join("?" * len(value))})')
+                params.extend(value)
+            else:
+                clauses.append(f'"{col}" = ?')
+                params.append(value)
+        return (" AND ".join(clauses) or "true"), params
+
+    def cube(self):
+        # Same layout as aggregates.build_cube, computed by one grouped scan
+        version = self.version()
+        if self._cube_version != version:
+            measures = ", ".join(
+                f'count("{m}") AS "{m}_n", coalesce(sum("{m}"::DOUBLE), 0) AS "{m}_sum", '
+                f'coalesce(sum(("{m}"::DOUBLE) ^ 2), 0) AS "{m}_sumsq"'
+                for m in MEASURES)
+            dims = ", ".join(f'"{d}"' for d in DIMENSIONS)
+            cube = self._query(f"SELECT {dims}, count(*) AS count, {measures} "
+                               f"FROM {self._scan()} GROUP BY ALL")
+            cube["Year"] = cube["Year"].astype("Int16")
+            self._cube, self._cube_version = cube, version
+        return self._cube
+
+    def row_count(self, **selection):
+        return aggregates.count_rows(self.cube(), **selection)
+
+    def brand_share(self, top_n=10):
+        return aggregates.brand_share(self.cube(), top_n=top_n)
+
+    def approval_year_counts(self):
+        return aggregates.approval_year_counts(self.cube())
+
+    def fuel_type_share(self):
+        return aggregates.fuel_type_share(self.cube())
+
+    def boxplot(self, value_col, categories=MARKETPLACE_ORDER, whisker=1.5, **selection):
+        if value_col not in VALUE_COLUMNS:
+            raise ValueError(f"unknown column {value_col!r}")
+        categories = list(categories)
+        where, params = self._where(dict(selection, Marketplace=categories))
+        values = (f'SELECT "Marketplace" AS g, "{value_col}"::DOUBLE AS x FROM {self._scan()} '
+                  f'WHERE "{value_col}" IS NOT NULL AND {where}')
+        if whisker is None:
+            fences = "mn AS lo, mx AS hi"
+        else:
+            w = float(whisker)
+            fences = f"q1 - {w} * (q3 - q1) AS lo, q3 + {w} * (q3 - q1) AS hi"
+        # values, per-group quartiles and fences shared by both queries
+        ctes = f"""
+            WITH v AS ({values}),
+            q AS (SELECT g, count(*) AS n, min(x) AS mn, max(x) AS mx,
+                         quantile_cont(x, 0.25) AS q1, quantile_cont(x, 0.5) AS med,
+                         quantile_cont(x, 0.75) AS q3 FROM v GROUP BY g),
+            f AS (SELECT *, {fences} FROM q)"""
+        summary = self._query(f"""{ctes}
+            SELECT f.g, f.n, f.q1, f.med, f.q3, f.lo, f.hi,
+                   min(v.x) FILTER (WHERE v.x BETWEEN f.lo AND f.hi) AS wlo,
+                   max(v.x) FILTER (WHERE v.x BETWEEN f.lo AND f.hi) AS whi,
+                   count(*) FILTER (WHERE v.x < f.lo OR v.x > f.hi) AS outliers
+            FROM f JOIN v USING (g)
+            GROUP BY ALL""", params).set_index("g")
+        outliers = self._query(f"""{ctes}
+            SELECT g, x FROM v JOIN f USING (g) WHERE x < lo OR x > hi
+            ORDER BY g, x""", params)
+
+        box_data, fence_data, counts, outlier_counts = [], [], [], []
+        for category in categories:
+            if category not in summary.index:
+                box_data.append([None] * 5)
+                fence_data.append([None] * 2)
+                counts.append(0)
+                outlier_counts.append(0)
+                continue
+            row = summary.loc[category]
+            box_data.append([float(row.wlo), float(row.q1), float(row.med), float(row.q3), float(row.whi)])
+            fence_data.append([float(row.lo), float(row.hi)])
+            counts.append(int(row.n))
+            outlier_counts.append(int(row.outliers))
+        position = {category: i for i, category in enumerate(categories)}
+        return {
+            "categories": categories,
+            "box_data": box_data,
+            "outliers": [[position[g], x] for g, x in zip(outliers["g"], outliers["x"].tolist())],
+            "fences": fence_data,
+            "counts": counts,
+            "outlier_counts": outlier_counts,
+            "rank_error": [0.0] * len(categories),
+        }
+
+    def _first_seen(self, col, selection):
+        # Distinct values of col in order of first appearance in the files
+        where, params = self._where(selection)
+        result = self._query(f"""
+            SELECT "{col}" AS value FROM {self._scan()}
+            WHERE "Brand" IS NOT NULL AND "Model" IS NOT NULL AND {where}
+            GROUP BY 1 ORDER BY min(struct_pack(f := list_position(?, filename), r := file_row_number))""",
+            params + [self._files()])
+        return result["value"].tolist()
+
+    def brands(self):
+        return self._first_seen("Brand", {})
+
+    def models(self, brand):
+        return self._first_seen("Model", {"Brand": brand})
+
+    def years(self, brand, model):
+        result = self._query(f"""
+            SELECT DISTINCT "Year" FROM {self._scan()}
+            WHERE "Brand" = ? AND "Model" = ? AND "Year" IS NOT NULL ORDER BY 1""", [brand, model])
+        return [int(y) for y in result["Year"]]
+
+    def marketplaces(self, brand, model, year=None):
+        selection = {"Brand": brand, "Model": model}
+        if year is not None:
+            selection["Year"] = year
+        where, params = self._where(selection)
+        result = self._query(f"""
+            SELECT DISTINCT "Marketplace" FROM {self._scan()}
+            WHERE "Year" IS NOT NULL AND {where}""", params)
+        present = set(result["Marketplace"])
+        return [m for m in MARKETPLACE_ORDER if m in present]
+
+    def fuel_costs(self, prices, annual_km, years, top_n=10):
+        # Same sums as fuel_costs.cost_sums, computed in one grouped scan
+        cases = " ".join("WHEN ? THEN ?" for _ in prices)
+        params = [v for fuel, price in prices.items() for v in (fuel, float(price))]
+        price = f"CASE \"Fuel_Type\" {cases} END" if prices else "NULL"
+        annual_km, years = float(annual_km), float(years)
+        sums = self._query(f"""
+            WITH c AS (
+                SELECT "Marketplace", "Brand",
+                       "Consumption"::DOUBLE * ({price})::DOUBLE * {annual_km} / 100 AS fuel,
+                       "CO2_g_km"::DOUBLE * {annual_km} / 1000 AS co2,
+                       "cleaned_Price"::DOUBLE AS price
+                FROM {self._scan()} WHERE "Marketplace" IS NOT NULL AND "Brand" IS NOT NULL)
+            SELECT "Marketplace", "Brand", count(*) AS listings,
+                   count(fuel) AS fuel_n, coalesce(sum(fuel), 0) AS annual_fuel_cost_sum,
+                   count(price + {years} * fuel) AS total_cost_n,
+                   coalesce(sum(price + {years} * fuel), 0) AS total_cost_sum,
+                   count(co2) AS co2_n, coalesce(sum(co2), 0) AS co2_per_year_sum
+            FROM c GROUP BY ALL ORDER BY "Marketplace", "Brand"
+            """, params)
+        return fuel_costs.summarize(sums, top_n)
+
+    def depreciation(self):
+        # Same moments as depreciation.moments, computed by one grouped scan
+        version = self.version()
+        if self._depreciation_version != version:
+            factors = {"a": '"car_age"::DOUBLE', "k": f'"Kilometer"::DOUBLE / {depreciation.KM_UNIT}',
+                       "y": f'"{depreciation.TARGET}"::DOUBLE'}
+            sums = ", ".join(
+                f'sum({" * ".join(factors[f] for f in product)}) AS {col}' if product else f"count(*) AS {col}"
+                for col, product in depreciation.SUMS.items())
+            keys = ", ".join(f'"{c}"' for c in depreciation.GROUP_COLUMNS)
+            not_null = " AND ".join(f'"{c}" IS NOT NULL' for c in
+                                    depreciation.GROUP_COLUMNS + ["car_age", "Kilometer", depreciation.TARGET])
+            table = self._query(f"""
+                SELECT {keys}, {sums}, min("car_age")::DOUBLE AS age_min, max("car_age")::DOUBLE AS age_max
+                FROM {self._scan()} WHERE {not_null} GROUP BY ALL""")
+            self._depreciation = depreciation.fit(depreciation.merge_moments(table))
+            self._depreciation_version = version
+        return self._depreciation
+
+    def histogram(self, value_col, group_col, bins=histograms.DEFAULT_BINS, top_n=histograms.TOP_GROUPS):
+        # Same bins as histograms.binned_counts, counted by grouped scans
+        histograms.check_columns(value_col, group_col)
+        values = (f'SELECT "{group_col}"::VARCHAR AS g, "{value_col}"::DOUBLE AS x FROM {self._scan()} '
+                  f'WHERE isfinite("{value_col}"::DOUBLE)')
+        low, high = self._query(f"SELECT quantile_cont(x, {histograms.CLIP[0]!r}) AS low, "
+                                f"quantile_cont(x, {histograms.CLIP[1]!r}) AS high FROM ({values})").iloc[0]
+        if low != low:  # NULL without finite values
+            low = high = None
+        low, high = histograms.checked_range(low, high)
+        totals = self._query(f"SELECT g, count(*) AS n FROM ({values}) WHERE g IS NOT NULL GROUP BY g")
+        groups = histograms.show_groups(group_col, dict(zip(totals["g"], totals["n"].astype(int))), top_n)
+        width = (high - low) / bins
+        counts = self._query(f"""
+            SELECT g, CASE WHEN x < {low!r} THEN -1 WHEN x > {high!r} THEN {bins}
+                           ELSE least(floor((x - {low!r}) / {width!r}), {bins - 1}) END::INTEGER AS b,
+                   count(*) AS n
+            FROM ({values}) WHERE g IS NOT NULL GROUP BY ALL""")
+        table = [[0] * (bins + 2) for _ in groups]
+        position = {g: i for i, g in enumerate(groups)}
+        for g, b, n in zip(counts["g"], counts["b"], counts["n"]):
+            if g in position:
+                table[position[g]][b + 1] = n
+        return histograms.from_counts(groups, table, low, high, bins)
+
+    def comparables(self, brand, model, year_month, kilometer, power, k=5):
+        # The listings of brand/model are fetched once per dataset version and
+        # indexed in memory
+        key = (self.version(), brand, model)
+        with _lock:
+            index = self._comparables.get(key)
+        if index is None:
+            columns = ", ".join(f'"{c}"' for c in dict.fromkeys(RESULT_COLUMNS + COMPARABLE_FEATURES))
+            frame = self._query(f"""
+                SELECT {columns} FROM {self._scan()} WHERE "Brand" = ? AND "Model" = ?
+                ORDER BY list_position(?, filename), file_row_number""", [brand, model, self._files()])
+            index = ComparableIndex(frame)
+            with _lock:
+                self._comparables = {k: v for k, v in self._comparables.items() if k[0] == key[0]}
+                self._comparables[key] = index
+        return index.find(brand, model, year_month, kilometer, power, k)
+
+    def filter_options(self):
+        categories = {}
+        for col in CATEGORY_FILTERS:
+            result = self._query(f'SELECT DISTINCT "{col}" AS value FROM {self._scan()} '
+                                 f'WHERE "{col}" IS NOT NULL ORDER BY 1')
+            categories[col] = [v.item() if hasattr(v, "item") else v for v in result["value"]]
+        bounds = ", ".join(f'min("{c}")::DOUBLE AS "{c}_min", max("{c}")::DOUBLE AS "{c}_max"'
+                           for c in RANGE_FILTERS)
+        row = self._query(f"SELECT {bounds} FROM {self._scan()}").iloc[0]
+        ranges = {col: (float(row[col + "_min"]), float(row[col + "_max"])) for col in RANGE_FILTERS}
+        return categories, ranges
+
+    def filtered(self, spec):
+        return _filtered_view(self, spec, lambda: FilteredDuckDBBackend(self, spec))
+
+    def duplicates_table(self):
+        # Name of a table with the (filename, file_row_number) of the listings
+        # duplicates.py flags as duplicates, built once per dataset version
+        version = self.version()
+        name = f"duplicates_{version[:16]}"
+        with _lock:
+            if name in self._duplicate_tables:
+                return name
+        columns = BLOCK_COLUMNS + MATCH_COLUMNS + ["Kilometer", "Power_PS", "cleaned_Price", "Marketplace"]
+        frame = self._query(f"""
+            SELECT {", ".join(f'"{c}"' for c in columns)}, filename, file_row_number FROM {self._scan()}
+            ORDER BY list_position(?, filename), file_row_number""", [self._files()])
+        duplicates = frame.loc[duplicate_mask(frame), ["filename", "file_row_number"]]
+        cursor = self._con.cursor()
+        cursor.register("new_duplicates", duplicates)
+        cursor.execute(f"CREATE OR REPLACE TABLE {name} AS SELECT * FROM new_duplicates")
+        cursor.unregister("new_duplicates")
+        with _lock:
+            self._duplicate_tables.add(name)
+        return name
+
+
+def _sql_literal(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(float(value))
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class FilteredDuckDBBackend(DuckDBBackend):
+    # DuckDBBackend whose scan only returns the listings matching a filter
+    # spec; the filter is pushed down into every query
+
+    def __init__(self, parent, spec):
+        self.parent = parent
+        self.spec = spec
+        self.sources = parent.sources
+        self._con = parent._con
+        self._cube = None
+        self._cube_version = None
+        self._comparables = {}
+        self._depreciation = None
+        self._depreciation_version = None
+        self._duplicate_tables = set()
+        self._key = filter_key(spec)
+        self._anti_join = ""
+        if spec.get(COLLAPSE_DUPLICATES):
+            self._anti_join = f"ANTI JOIN {parent.duplicates_table()} USING (filename, file_row_number)"
+        clauses = []
+        for col, value in spec.items():
+            if col == COLLAPSE_DUPLICATES:
+                continue
+            if col not in FILTER_COLUMNS:
+                raise ValueError(f"unknown filter column {col!r}")
+            if col in RANGE_FILTERS:
+                clauses.append(f'"{col}" BETWEEN {_sql_literal(float(value[0]))} '
+                               f'AND {_sql_literal(float(value[1]))}')
+            elif value:
+                clauses.append(f'"{col}" IN ({", ".join(_sql_literal(v) for v in value)})')
+            else:
+                clauses.append("false")
+        self._filter_sql = " AND ".join(clauses) or "true"
+
+    def version(self):
+        return super().version() + "|" + self._key
+
+    def _scan(self):
+        return f"(SELECT * FROM {super()._scan()} {self._anti_join} WHERE {self._filter_sql})"
+
+    def filtered(self, spec):
+        # Listings matching this view's filters and spec
+        return self.parent.filtered(combine_specs(self.spec, spec))
+
+
+def get_backend(name=None):
+    # Configured backend instance, shared by all sessions of the process
+    name = name or BACKEND
+    with _lock:
+        if name not in _backends:
+            if name == "pandas":
+                _backends[name] = PandasBackend()
+            elif name == "duckdb":
+                if PARQUET_SOURCE:
+                    sources = [PARQUET_SOURCE]
+                else:
+                    if not os.path.exists(cache_path(CSV_PATH)):
+                        load_dataset()  # writes the parquet cache of the CSV
+                    sources = [cache_path(CSV_PATH), os.path.join(STORE_DIR, "**", "*.parquet")]
+                _backends[name] = DuckDBBackend(sources)
+            else:
+                raise ValueError(f"unknown backend {name!r}, expected 'pandas' or 'duckdb'")
+        return _backends[name]
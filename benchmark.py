@@ -0,0 +1,119 @@
+"""Per-section timings of the dashboard computations on synthetic listings.
+
+    python benchmark.py --rows 10000 100000 1000000 10000000 --json bench.json
+
+For every size a synthetic CSV with the imputed_output.csv schema is written
+to a temporary directory, then each compute stage of the app is run on it
+twice: once for its wall time and once under tracemalloc for its peak
+memory. The listings store is an empty temporary directory, so batches
+ingested into the local store never end up in the measured rows.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import aggregates
+from aggregates import MARKETPLACE_ORDER
+from boxplot_stats import group_values, sketch_boxplot
+import data_loader
+from data_loader import load_dataset
+from model_index import ModelIndex
+from quantile_sketch import build_sketches, merge_cells
+from synthetic_data import generate_listings, write_listings_csv
+
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000, 10_000_000]
+
+
+def _measure(stage, rows, func, reset=None):
+    # Wall time of an untraced run, then peak traced memory of a second run
+    # (tracing slows allocation-heavy stages down several times). reset, when
+    # given, undoes the caching of the first run before the second.
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    if reset is not None:
+        reset()
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {"stage": stage, "rows": rows, "seconds": seconds, "peak_mb": peak / 2 ** 20}
+
+
+def run_stages(csv_path, rows, store_dir):
+    # Time each compute stage of streamlit_app.py on the listings in csv_path
+    # (plus the batches of store_dir, normally an empty directory)
+    results = []
+
+    def stage(name, func, reset=None):
+        value, timing = _measure(name, rows, func, reset)
+        results.append(timing)
+        return value
+
+    def uncached():
+        # the memory run parses the CSV again, like the timed one
+        data_loader.clear_cache(csv_path)
+        if os.path.exists(data_loader.cache_path(csv_path)):
+            os.remove(data_loader.cache_path(csv_path))
+
+    df = stage("load (csv parse + parquet cache)", lambda: load_dataset(csv_path, store_dir), uncached)
+    cube = stage("aggregate cube", lambda: aggregates.build_cube(df))
+    stage("brand pivot", lambda: aggregates.brand_share(cube, top_n=10))
+    stage("approval-year pivot", lambda: aggregates.approval_year_counts(cube))
+
+    def marketplace_boxplot(value_col):
+        sketches = build_sketches(df, value_col)
+        values, codes = group_values(df, value_col, "Marketplace", MARKETPLACE_ORDER)
+        return sketch_boxplot([merge_cells(sketches, Marketplace=m) for m in MARKETPLACE_ORDER],
+                              MARKETPLACE_ORDER, values=values, codes=codes)
+
+    stage("log-price boxplot", lambda: marketplace_boxplot("log_cleaned_price"))
+
+    def drilldown():
+        # index build plus the two boxplots for the most listed model
+        index = ModelIndex(df)
+        sketches = build_sketches(df, "cleaned_Price")
+        brand = index.brands()[0]
+        model = index.models(brand)[0]
+        years = index.years(brand, model)
+        for selected_years in (years, years[-1:]):
+            sketch_boxplot([merge_cells(sketches, Marketplace=m, Brand=brand, Model=model, Year=selected_years)
+                            for m in MARKETPLACE_ORDER], MARKETPLACE_ORDER, whisker=None)
+
+    stage("model drilldown", drilldown)
+    stage("consumption boxplot", lambda: marketplace_boxplot("Consumption"))
+    stage("fuel-type pivot", lambda: aggregates.fuel_type_share(cube))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        store_dir = os.path.join(tmp, "store")  # never created: no batches
+        template = load_dataset(store_dir=store_dir)
+        for rows in args.rows:
+            csv_path = os.path.join(tmp, f"listings_{rows}.csv")
+            write_listings_csv(generate_listings(rows, seed=args.seed, template=template), csv_path)
+            for result in run_stages(csv_path, rows, store_dir):
+                results.append(result)
+                print(f"{result['rows']:>10,}  {result['stage']:<34} "
+                      f"{result['seconds']:>9.3f} s  {result['peak_mb']:>9.1f} MB")
+            data_loader.clear_cache(csv_path)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
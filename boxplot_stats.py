@@ -0,0 +1,232 @@
+import numpy as np
+import pandas as pd
+
+
+def _group_codes(df, group_cols, order):
+    # Integer group code per row (-1 for rows outside the requested groups or
+    # with a missing key) and the list of group labels in display order.
+    # Multi-column groups are labelled by tuples.
+    if isinstance(group_cols, str):
+        keys = df[group_cols].astype(object).where(df[group_cols].notna(), None)
+    else:
+        valid = df[group_cols].notna().all(axis=1).to_numpy()
+        tuples = zip(*(df[c].astype(object) for c in group_cols))
+        keys = pd.Series([t if ok else None for t, ok in zip(tuples, valid)],
+                         index=df.index, dtype=object)
+    if order is None:
+        order = sorted(keys.dropna().unique().tolist())
+    codes = pd.Categorical(keys, categories=order).codes.astype(np.int64)
+    return codes, list(order)
+
+
+def _interpolate(values, starts, counts, q):
+    # Linear-interpolated quantile q of each sorted segment (same as np.percentile)
+    pos = starts + q * (counts - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, starts + counts - 1)
+    frac = pos - lo
+    return values[lo] + (values[hi] - values[lo]) * frac
+
+
+def grouped_boxplot(df, value_col, group_cols, order=None, whisker=1.5):
+    # Five-number summaries, Tukey fences and outliers for value_col grouped by
+    # group_cols, computed in a single sort over all groups.
+    #
+    # With whisker=None the whiskers span the full range and there are no
+    # outliers (the plain min/Q1/median/Q3/max box). Groups without values get
+    # a box of Nones so the category axis stays aligned.
+    #
+    # Returns a dict with "categories", "box_data" ([[min, q1, median, q3, max]]),
+    # "outliers" ([[group index, value]], sorted per group), "fences"
+    # ([[lower, upper]]), "counts" (values per group) and "outlier_counts"
+    # (outliers per group).
+    values = df[value_col].to_numpy(dtype=np.float64, na_value=np.nan)
+    codes, categories = _group_codes(df, group_cols, order)
+    keep = (codes >= 0) & ~np.isnan(values)
+    values, codes = values[keep], codes[keep]
+
+    sort = np.lexsort((values, codes))
+    values, codes = values[sort], codes[sort]
+    n_groups = len(categories)
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    present = counts > 0
+
+    box = np.full((n_groups, 5), np.nan)
+    fences = np.full((n_groups, 2), np.nan)
+    outlier_mask = np.zeros(len(values), dtype=bool)
+    if present.any():
+        s, c = starts[present], counts[present]
+        q1 = _interpolate(values, s, c, 0.25)
+        median = _interpolate(values, s, c, 0.5)
+        q3 = _interpolate(values, s, c, 0.75)
+        if whisker is None:
+            lower = values[s]
+            upper = values[s + c - 1]
+        else:
+            iqr = q3 - q1
+            lower = q1 - whisker * iqr
+            upper = q3 + whisker * iqr
+        row_lower = np.full(n_groups, np.nan)
+        row_upper = np.full(n_groups, np.nan)
+        row_lower[present], row_upper[present] = lower, upper
+        inside = (values >= row_lower[codes]) & (values <= row_upper[codes])
+        outlier_mask = ~inside
+        # whisker ends are the most extreme values still inside the fences
+        lo = np.minimum.reduceat(np.where(inside, values, np.inf), s)
+        hi = np.maximum.reduceat(np.where(inside, values, -np.inf), s)
+        box[present] = np.column_stack([lo, q1, median, q3, hi])
+        fences[present] = np.column_stack([lower, upper])
+
+    outliers = np.column_stack([codes[outlier_mask], values[outlier_mask]])
+    return {
+        "categories": categories,
+        "box_data": [row.tolist() if p else [None] * 5 for p, row in zip(present, box)],
+        "outliers": [[int(i), v] for i, v in outliers.tolist()],
+        "fences": [row.tolist() if p else [None] * 2 for p, row in zip(present, fences)],
+        "counts": counts.tolist(),
+        "outlier_counts": np.bincount(codes[outlier_mask], minlength=n_groups).tolist(),
+    }
+
+
+def group_values(df, value_col, group_col, categories, **selection):
+    # value_col as float64 and the position of every row's group_col value in
+    # categories (-1 for other groups and rows outside selection, e.g.
+    # Brand="BMW" or Year=[2019, 2020]), for fence_tails
+    values = df[value_col].to_numpy(np.float64, na_value=np.nan)
+    groups = df[group_col]
+    if isinstance(groups.dtype, pd.CategoricalDtype):
+        # the extra last entry serves missing values (code -1)
+        lookup = np.array([categories.index(c) if c in categories else -1 for c in groups.cat.categories] + [-1],
+                          dtype=np.int64)
+        codes = lookup[groups.cat.codes.to_numpy()]
+    else:
+        codes, _ = _group_codes(df, group_col, list(categories))
+    for col, value in selection.items():
+        selected = value if isinstance(value, (list, tuple, set)) else [value]
+        codes = np.where(df[col].isin(selected).to_numpy(), codes, -1)
+    return values, codes
+
+
+def fence_tails(values, codes, fences):
+    # Whisker ends (most extreme values inside the fences), outliers sorted per
+    # group and outlier counts of the values with group codes (-1: none) for
+    # the given [lower, upper] fences per group. One vectorized pass, exact
+    # whatever the fences were estimated from.
+    n_groups = len(fences)
+    # the extra last entry serves code -1, whose rows are dropped anyway
+    lower = np.array([np.nan if f[0] is None else f[0] for f in fences] + [np.nan], dtype=np.float64)
+    upper = np.array([np.nan if f[1] is None else f[1] for f in fences] + [np.nan], dtype=np.float64)
+    keep = (codes >= 0) & ~np.isnan(values)
+    values, codes = values[keep], codes[keep]
+    inside = (values >= lower[codes]) & (values <= upper[codes])
+    lo = np.full(n_groups, np.inf)
+    hi = np.full(n_groups, -np.inf)
+    np.minimum.at(lo, codes[inside], values[inside])
+    np.maximum.at(hi, codes[inside], values[inside])
+    out_codes, out_values = codes[~inside], values[~inside]
+    order = np.lexsort((out_values, out_codes))
+    outliers = [[int(i), v] for i, v in zip(out_codes[order].tolist(), out_values[order].tolist())]
+    return lo, hi, outliers, np.bincount(out_codes, minlength=n_groups)
+
+
+def sketch_boxplot(sketches, categories, whisker=1.5, values=None, codes=None):
+    # Same payload as grouped_boxplot with the quartiles read from one quantile
+    # sketch per category (see quantile_sketch.py); they carry the sketch's
+    # "rank_error". With whisker=None the whiskers are the exact min and max
+    # the sketches track. Otherwise whisker ends and outliers are exact: they
+    # come from fence_tails over values/codes (see group_values), which
+    # compacted sketches need; exact sketches can answer from their items.
+    box_data, fences, counts, rank_error = [], [], [], []
+    quartiles = []
+    for sketch in sketches:
+        counts.append(int(sketch.n))
+        rank_error.append(sketch.rank_error())
+        if not sketch.n:
+            quartiles.append(None)
+            fences.append([None] * 2)
+            continue
+        q1, median, q3 = sketch.quantiles([0.25, 0.5, 0.75]).tolist()
+        quartiles.append((q1, median, q3))
+        if whisker is None:
+            fences.append([float(sketch.min), float(sketch.max)])
+        else:
+            fences.append([q1 - whisker * (q3 - q1), q3 + whisker * (q3 - q1)])
+
+    outliers, outlier_counts = [], np.zeros(len(sketches), dtype=np.int64)
+    if whisker is None:
+        lo = [f[0] for f in fences]
+        hi = [f[1] for f in fences]
+    else:
+        if values is None:
+            if not all(s.is_exact for s in sketches):
+                raise ValueError("exact whisker ends of compacted sketches need the values, see group_values")
+            items = [s.items()[0] for s in sketches]
+            values = np.concatenate([np.empty(0)] + items)
+            codes = np.repeat(np.arange(len(items)), [len(i) for i in items])
+        lo, hi, outliers, outlier_counts = fence_tails(values, codes, fences)
+    for i, q in enumerate(quartiles):
+        if q is None:
+            box_data.append([None] * 5)
+            continue
+        # no value inside the fences can only happen with approximate quartiles
+        low = float(lo[i]) if np.isfinite(lo[i]) else q[0]
+        high = float(hi[i]) if np.isfinite(hi[i]) else q[2]
+        box_data.append([low, *q, high])
+    return {
+        "categories": list(categories),
+        "box_data": box_data,
+        "outliers": outliers,
+        "fences": fences,
+        "counts": counts,
+        "outlier_counts": outlier_counts.tolist(),
+        "rank_error": rank_error,
+    }
+
+
+def downsample_outliers(outliers, n_groups, max_points, extremes=5, seed=0):
+    # At most max_points of the [[group index, value]] outliers (but never less
+    # than the lowest and highest one of each group). The budget is split over
+    # the groups in proportion to their outlier counts (largest remainder);
+    # every group keeps its `extremes` lowest and highest values and a seeded
+    # uniform sample of the rest. Returns (kept outliers sorted like the input,
+    # true outlier count per group).
+    if not outliers:
+        return [], [0] * n_groups
+    pairs = np.asarray(outliers, dtype=np.float64)
+    groups = pairs[:, 0].astype(np.int64)
+    totals = np.bincount(groups, minlength=n_groups)
+    if len(pairs) <= max_points:
+        return outliers, totals.tolist()
+
+    # every group keeps at least its lowest and highest outlier
+    base = np.minimum(totals, 2)
+    share = (totals - base) / max((totals - base).sum(), 1) * max(max_points - base.sum(), 0)
+    budget = np.floor(share).astype(np.int64)
+    remainder = max(max_points - base.sum(), 0) - budget.sum()
+    budget[np.argsort(-(share - budget), kind="stable")[:remainder]] += 1
+    budget += base
+
+    rng = np.random.default_rng(seed)
+    keep = []
+    for g in np.flatnonzero(totals):
+        rows = np.flatnonzero(groups == g)
+        if budget[g] >= len(rows):
+            keep.append(rows)
+            continue
+        by_value = rows[np.argsort(pairs[rows, 1], kind="stable")]
+        n_ext = max(min(extremes, budget[g] // 2), 1)
+        ends = np.concatenate([by_value[:n_ext], by_value[len(by_value) - n_ext:]])
+        middle = by_value[n_ext:len(by_value) - n_ext]
+        keep.append(ends)
+        keep.append(rng.choice(middle, size=budget[g] - len(ends), replace=False))
+    keep = np.sort(np.concatenate(keep))
+    return [outliers[i] for i in keep], totals.tolist()
+
+
+def rank_error_note(stats):
+    # Chart subtitle for sketch-based boxplots, empty when all boxes are exact
+    error = max(stats.get("rank_error", [0.0]), default=0.0)
+    if not error:
+        return ""
+    return f"Approximate quartiles (rank error ±{error:.1%})"
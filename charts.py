@@ -0,0 +1,436 @@
+import functools
+import os
+import threading
+from collections import OrderedDict
+
+from aggregates import MARKETPLACE_ORDER
+from boxplot_stats import downsample_outliers, rank_error_note
+from depreciation import marketplace_gaps, predict
+from histograms import DEFAULT_BINS
+
+# Headless chart layer: every function takes a query backend (see backends.py)
+# and returns echarts option dicts ready for st_echarts or any other echarts
+# frontend. Results are memoized on (backend, dataset version, parameters);
+# callers must not modify the returned dicts.
+
+MARKETPLACE_COLORS = {"Auto.de": "#8da0cb", "Autoscout24.de": "#fc8d62", "Mobile.de": "#66c2a5"}
+# colors of other groups, in group order (the echarts default palette)
+GROUP_COLORS = ["#5470c6", "#91cc75", "#fac858", "#ee6666", "#73c0de",
+                "#3ba272", "#fc8452", "#9a60b4", "#ea7ccc", "#91a3b0"]
+MEMO_SIZE = 512
+# Most outlier points sent per boxplot chart, beyond that they are sampled
+MAX_OUTLIER_POINTS = int(os.environ.get("CAR_APP_MAX_OUTLIERS", "2000"))
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def memoized(func):
+    @functools.wraps(func)
+    def wrapper(backend, *args, **kwargs):
+        key = (func.__name__, backend.name, backend.version(), args, tuple(sorted(kwargs.items())))
+        with _memo_lock:
+            if key in _memo:
+                _memo.move_to_end(key)
+                return _memo[key]
+        result = func(backend, *args, **kwargs)
+        with _memo_lock:
+            _memo[key] = result
+            while len(_memo) > MEMO_SIZE:
+                _memo.popitem(last=False)
+        return result
+    return wrapper
+
+
+def _share_bars(pivot, x_max, grid_left, axis_name):
+    # One horizontal bar chart per marketplace sharing the same y categories;
+    # only the first one shows the category labels
+    categories = pivot.index.tolist()
+    options = []
+    for i, (marketplace, x) in enumerate(zip(MARKETPLACE_ORDER, x_max)):
+        if i == 0:
+            y_axis = {
+                "type": "category",
+                "data": categories,
+                "show": True,
+                "axisLabel": {
+                    "interval": 0,  # Show every label
+                    "formatter": "{value}",  # Display the full label without truncation
+                    "align": "right",
+                    "padding": [0, 0, 0, 10]
+                }
+            }
+        else:
+            y_axis = {"type": "category", "data": categories, "show": True, "axisLabel": {"show": False}}
+        if i == 2:
+            y_axis["axisTick"] = {"show": True}
+        option = {
+            "title": {"text": marketplace, "x": "center"},
+            "tooltip": {"trigger": "axis"},
+            "xAxis": {
+                "type": "value",
+                "max": x,
+                "name": axis_name,
+                "nameLocation": "middle",  # Align axis title to the center of the axis
+                "nameGap": 30,
+            },
+            "yAxis": y_axis,
+            "series": [{
+                "type": "bar",
+                "data": pivot[marketplace].tolist(),
+                "itemStyle": {"color": MARKETPLACE_COLORS[marketplace]}
+            }],
+        }
+        if i == 0:
+            option["grid"] = {"left": grid_left}
+        options.append(option)
+    return options
+
+
+@memoized
+def brand_share(backend, top_n=10):
+    # Bar charts (Auto.de, Autoscout24.de, Mobile.de) of the top_n brands' share
+    pivot = backend.brand_share(top_n=top_n)
+    return _share_bars(pivot, x_max=[40, 20, 60], grid_left="25%", axis_name="Brand (%)")
+
+
+@memoized
+def fuel_type_share(backend):
+    # Bar charts (Auto.de, Autoscout24.de, Mobile.de) of the fuel type shares
+    pivot = backend.fuel_type_share()
+    return _share_bars(pivot, x_max=[60, 60, 80], grid_left="30%", axis_name="Brand (%)")
+
+
+@memoized
+def approval_year_counts(backend):
+    # Line chart of listing counts per initial approval year and marketplace
+    pivot = backend.approval_year_counts()
+    return {
+        "title": {"text": "Initial Approval Year by Marketplace"},
+        "tooltip": {"trigger": "axis"},
+        "legend": {"data": MARKETPLACE_ORDER},
+        "grid": {"left": "3%", "right": "4%", "bottom": "3%", "containLabel": True},
+        "xAxis": {
+            "type": "category",
+            "boundaryGap": False,
+            "data": pivot.columns.tolist()
+        },
+        "yAxis": {"type": "value",
+                  "name": "count"},
+        "series": [
+            {
+                "name": marketplace,
+                "type": "line",
+                "data": pivot.loc[marketplace].tolist(),
+                "itemStyle": {"color": MARKETPLACE_COLORS[marketplace]}
+            }
+            for marketplace in MARKETPLACE_ORDER
+        ],
+    }
+
+
+def _outlier_points(stats, max_points):
+    # Scatter data of the outliers, downsampled to max_points. Sampled points
+    # carry their marketplace's exact outlier count (from the backend's fence
+    # counts) for the tooltip.
+    points, _ = downsample_outliers(stats["outliers"], len(stats["categories"]), max_points)
+    if len(points) == len(stats["outliers"]):
+        return points
+    totals = stats["outlier_counts"]
+    shown = [0] * len(totals)
+    for i, _ in points:
+        shown[i] += 1
+    labels = [f"{category}: {shown[i]:,} of {totals[i]:,} outliers shown"
+              for i, category in enumerate(stats["categories"])]
+    return [{"name": labels[i], "value": [i, v]} for i, v in points]
+
+
+@memoized
+def boxplot_payload(backend, value_col, title, y_name, zoom=False, max_outliers=None):
+    # Boxplot per marketplace with Tukey outliers as a scatter series of at
+    # most max_outliers points (default MAX_OUTLIER_POINTS)
+    stats = backend.boxplot(value_col, MARKETPLACE_ORDER)
+    outliers = _outlier_points(stats, MAX_OUTLIER_POINTS if max_outliers is None else max_outliers)
+    option = {
+        "title": {
+            "text": title,
+            "subtext": rank_error_note(stats),
+            "left": "center"
+        },
+        "tooltip": {
+            "trigger": "item",
+            "axisPointer": {"type": "shadow"}
+        },
+        "grid": {
+            "left": "10%",
+            "right": "10%",
+            "bottom": "15%"
+        },
+        "xAxis": {
+            "type": "category",
+            "data": stats["categories"],
+            "boundaryGap": True,
+            "nameGap": 30,
+            "splitArea": {"show": False},
+            "splitLine": {"show": False}
+        },
+        "yAxis": {
+            "type": "value",
+            "name": y_name,
+            "splitArea": {"show": True}
+        },
+        "series": [
+            {
+                "name": "boxplot",
+                "type": "boxplot",
+                "data": stats["box_data"]
+            },
+            {
+                "name": "outlier",
+                "type": "scatter",
+                "data": outliers
+            }
+        ]
+    }
+    if outliers and isinstance(outliers[0], dict):
+        option["series"][1]["tooltip"] = {"formatter": "{b}<br/>{c}"}
+    if zoom:
+        option["dataZoom"] = [
+            {
+                "type": "inside",
+                "yAxisIndex": 0
+            },
+            {
+                "type": "slider",
+                "yAxisIndex": 0,
+                "orient": "vertical",
+                "left": "left",
+                "start": 20,
+                "height": "80%"
+            }
+        ]
+    return option
+
+
+@memoized
+def model_price(backend, brand, model, year=None):
+    # Price boxes (min/Q1/median/Q3/max) per marketplace for one model, over all
+    # its approval years or only the given one
+    marketplaces = backend.marketplaces(brand, model, year)
+    years = backend.years(brand, model) if year is None else [year]
+    stats = backend.boxplot("cleaned_Price", marketplaces, whisker=None,
+                            Brand=brand, Model=model, Year=years)
+    return {
+        "title": {"text": f"{model if year is None else year} Price Distribution"},
+        "xAxis": {
+            "type": "category",
+            "data": marketplaces,
+            "boundaryGap": True
+        },
+        "yAxis": {
+            "type": "value",
+            "name": "Price"
+        },
+        "series": [
+            {
+                "name": "Price Distribution",
+                "type": "boxplot",
+                "data": stats["box_data"],
+                "itemStyle": {
+                    "color": "#91cc75"
+                }
+            }
+        ]
+    }
+
+
+@memoized
+def depreciation_curves(backend, brand, model, points=20):
+    # Fitted price over car age per marketplace for one model at the model's
+    # mean mileage, each curve over the ages listed on its marketplace; None
+    # when no marketplace has enough listings for a fit
+    fits = backend.depreciation()
+    fits = fits[(fits["Brand"] == brand) & (fits["Model"] == model) & fits["intercept"].notna()]
+    if not len(fits):
+        return None
+    series = []
+    for _, row in fits.iterrows():
+        ages = [row["age_min"] + (row["age_max"] - row["age_min"]) * i / (points - 1) for i in range(points)]
+        prices = predict(fits.loc[[row.name]], ages, row["reference_km"])[0]
+        series.append({
+            "name": row["Marketplace"],
+            "type": "line",
+            "showSymbol": False,
+            "data": [[round(a, 2), round(float(p))] for a, p in zip(ages, prices)],
+            "itemStyle": {"color": MARKETPLACE_COLORS[row["Marketplace"]]}
+        })
+    return {
+        "title": {"text": f"{model} depreciation at {fits['reference_km'].iloc[0]:,.0f} km"},
+        "tooltip": {"trigger": "axis"},
+        "legend": {"data": [s["name"] for s in series], "bottom": 0},
+        "xAxis": {"type": "value", "name": "Age (years)", "nameLocation": "middle", "nameGap": 30},
+        "yAxis": {"type": "value", "name": "Price"},
+        "series": series,
+    }
+
+
+@memoized
+def depreciation_gaps(backend):
+    # Raw and age/mileage-adjusted price gap per marketplace, averaged over
+    # all models fitted on at least two marketplaces
+    gaps = marketplace_gaps(backend.depreciation())
+
+    def values(col):
+        return [None if v != v else round(float(v), 2) for v in gaps[col]]
+
+    return {
+        "title": {"text": "Price gap to the model average"},
+        "tooltip": {"trigger": "axis"},
+        "legend": {"data": ["Raw", "Age and mileage adjusted"], "bottom": 0},
+        "xAxis": {"type": "category", "data": MARKETPLACE_ORDER},
+        "yAxis": {"type": "value", "name": "%"},
+        "series": [
+            {"name": "Raw", "type": "bar", "data": values("raw_gap"), "itemStyle": {"color": "#b3b3b3"}},
+            {"name": "Age and mileage adjusted", "type": "bar", "data": values("adjusted_gap"),
+             "itemStyle": {"color": "#91cc75"}},
+        ],
+    }
+
+
+@memoized
+def distribution(backend, value_col, group_col, bins=DEFAULT_BINS, share=True, axis_name=None):
+    # Histogram bars and density curves of value_col per group from the
+    # backend's bin counts; share=True shows percentages of each group's
+    # listings so groups of different size compare
+    hist = backend.histogram(value_col, group_col, bins)
+    edges = hist["edges"]
+    labels = [f"{(low + high) / 2:.4g}" for low, high in zip(edges[:-1], edges[1:])]
+    series = []
+    for i, group in enumerate(hist["groups"]):
+        scale = 100 / hist["listings"][i] if share and hist["listings"][i] else 1
+        color = MARKETPLACE_COLORS.get(group) if group_col == "Marketplace" else None
+        color = color or GROUP_COLORS[i % len(GROUP_COLORS)]
+        series.append({
+            "name": group,
+            "type": "bar",
+            "barGap": "-100%",
+            "data": [round(c * scale, 3) for c in hist["counts"][i]],
+            "itemStyle": {"color": color, "opacity": 0.35},
+        })
+        series.append({
+            "name": group,
+            "type": "line",
+            "smooth": True,
+            "showSymbol": False,
+            "data": [round(d * scale, 3) for d in hist["density"][i]],
+            "itemStyle": {"color": color},
+        })
+    outside = sum(hist["underflow"]) + sum(hist["overflow"])
+    total = sum(hist["listings"])
+    return {
+        "title": {
+            "text": f"{axis_name or value_col} by {group_col}",
+            "subtext": f"{outside:,} of {total:,} listings outside the range shown" if outside else "",
+        },
+        "tooltip": {"trigger": "axis"},
+        "legend": {"data": hist["groups"], "bottom": 0, "type": "scroll"},
+        "grid": {"left": "3%", "right": "4%", "bottom": "12%", "containLabel": True},
+        "xAxis": {"type": "category", "data": labels, "name": axis_name or value_col,
+                  "nameLocation": "middle", "nameGap": 30},
+        "yAxis": {"type": "value", "name": "% of listings" if share else "listings"},
+        "series": series,
+    }
+
+
+def feature_importance(rows, title, top_n=10):
+    # Horizontal bars of the top_n features (see feature_importance.py) with
+    # their 95% confidence intervals drawn as whiskers
+    rows = rows[:top_n][::-1]
+    return {
+        "title": {"text": title, "left": "center"},
+        "tooltip": {"trigger": "item"},
+        "grid": {"left": "3%", "right": "6%", "containLabel": True},
+        "xAxis": {"type": "value", "name": "Importance", "nameLocation": "middle", "nameGap": 30},
+        "yAxis": {"type": "category", "data": [r["feature"] for r in rows]},
+        "series": [
+            {
+                "name": "importance",
+                "type": "bar",
+                "data": [round(r["importance"], 4) for r in rows],
+                "itemStyle": {"color": "#5470c6"}
+            },
+            {
+                "name": "95% CI",
+                "type": "boxplot",
+                "boxWidth": [0, 0],
+                "data": [[round(v, 4) for v in (r["ci"][0], r["ci"][0], r["importance"], r["ci"][1], r["ci"][1])]
+                         for r in rows],
+                "itemStyle": {"color": "#333", "borderColor": "#333"}
+            }
+        ]
+    }
+
+
+def price_trend(pivot, title):
+    # Median price per crawl (pivot: crawl dates x marketplaces, see
+    # crawl_store.median_prices) as one line per marketplace
+    return {
+        "title": {"text": title},
+        "tooltip": {"trigger": "axis"},
+        "legend": {"data": list(pivot.columns), "bottom": 0},
+        "grid": {"left": "3%", "right": "4%", "bottom": "12%", "containLabel": True},
+        "xAxis": {"type": "category", "data": [str(d) for d in pivot.index]},
+        "yAxis": {"type": "value", "name": "€", "scale": True},
+        "series": [
+            {
+                "name": marketplace,
+                "type": "line",
+                "connectNulls": False,
+                "data": [None if v != v else round(float(v), 0) for v in pivot[marketplace]],
+                "itemStyle": {"color": MARKETPLACE_COLORS.get(marketplace)}
+            }
+            for marketplace in pivot.columns
+        ]
+    }
+
+
+@memoized
+def running_costs(backend, prices, annual_km, years, top_n=10):
+    # What-if running costs (prices: tuple of (fuel type, EUR per litre)):
+    # bars of the mean annual fuel cost and CO2 per marketplace, and of the
+    # mean total cost of ownership of the top_n brands per marketplace
+    by_marketplace, by_brand = backend.fuel_costs(dict(prices), annual_km, years, top_n=top_n)
+
+    def values(series):
+        return [None if v != v else round(float(v), 2) for v in series]
+
+    marketplace_option = {
+        "title": {"text": "Mean running costs by Marketplace"},
+        "tooltip": {"trigger": "axis"},
+        "legend": {"data": ["Annual fuel cost (€)", "CO₂ per year (kg)"], "bottom": 0},
+        "xAxis": {"type": "category", "data": MARKETPLACE_ORDER},
+        "yAxis": [{"type": "value", "name": "€"}, {"type": "value", "name": "kg"}],
+        "series": [
+            {"name": "Annual fuel cost (€)", "type": "bar", "data": values(by_marketplace["annual_fuel_cost"])},
+            {"name": "CO₂ per year (kg)", "type": "bar", "yAxisIndex": 1,
+             "data": values(by_marketplace["co2_per_year"])},
+        ],
+    }
+    brand_option = {
+        "title": {"text": f"Mean total cost of ownership over {years} years"},
+        "tooltip": {"trigger": "axis"},
+        "legend": {"data": MARKETPLACE_ORDER, "bottom": 0},
+        "grid": {"left": "3%", "right": "4%", "bottom": "12%", "containLabel": True},
+        "xAxis": {"type": "category", "data": by_brand.index.tolist(), "axisLabel": {"interval": 0, "rotate": 30}},
+        "yAxis": {"type": "value", "name": "€"},
+        "series": [
+            {
+                "name": marketplace,
+                "type": "bar",
+                "data": values(by_brand[marketplace]),
+                "itemStyle": {"color": MARKETPLACE_COLORS[marketplace]}
+            }
+            for marketplace in MARKETPLACE_ORDER
+        ],
+    }
+    return marketplace_option, brand_option
@@ -0,0 +1,121 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregates import MARKETPLACE_ORDER
+from derived_columns import REFERENCE_DATE
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # brute force distances without scipy
+    cKDTree = None
+
+# Similarity of listings of the same brand and model: euclidean distance on
+# car age, mileage and power, each divided by its standard deviation within
+# the model so no feature dominates because of its unit.
+FEATURES = ["car_age", "Kilometer", "Power_PS"]
+RESULT_COLUMNS = ["Marketplace", "Brand", "Model", "YearMonth", "Kilometer", "Power_PS", "cleaned_Price"]
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def car_age(year_month):
+    # Age in years on REFERENCE_DATE, as in the car_age column
+    return (REFERENCE_DATE - pd.Timestamp(year_month)).days / 365
+
+
+class _ModelTrees:
+    # Nearest-neighbour structures of one brand/model: one KD-tree per
+    # marketplace over the scaled features of its listings with a price
+
+    def __init__(self, frame):
+        points = frame[FEATURES].to_numpy(np.float64, na_value=np.nan)
+        scale = np.nanstd(points, axis=0) if len(points) else np.ones(len(FEATURES))
+        self.scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+        valid = ~np.isnan(points).any(axis=1) & frame["cleaned_Price"].notna().to_numpy()
+        marketplaces = frame["Marketplace"].astype(object).to_numpy()
+        self.trees = {}
+        for marketplace in MARKETPLACE_ORDER:
+            rows = np.flatnonzero(valid & (marketplaces == marketplace))
+            if not len(rows):
+                continue
+            scaled = points[rows] / self.scale
+            tree = cKDTree(scaled) if cKDTree is not None else scaled
+            self.trees[marketplace] = (tree, rows)
+
+    def query(self, point, k):
+        # {marketplace: (distances, row positions)} of the k nearest listings
+        point = np.asarray(point, dtype=np.float64) / self.scale
+        result = {}
+        for marketplace, (tree, rows) in self.trees.items():
+            n = min(k, len(rows))
+            if cKDTree is not None:
+                distances, found = tree.query(point, k=n)
+                distances, found = np.atleast_1d(distances), np.atleast_1d(found)
+            else:
+                all_distances = np.sqrt(((tree - point) ** 2).sum(axis=1))
+                found = np.argsort(all_distances, kind="stable")[:n]
+                distances = all_distances[found]
+            result[marketplace] = (distances, rows[found])
+        return result
+
+
+class ComparableIndex:
+    # Per-(Brand, Model) nearest-neighbour index over a listings frame. The
+    # row groups are found in one pass; each model's trees are built on its
+    # first lookup and kept.
+
+    def __init__(self, df):
+        self.frame = df
+        self._groups = df.groupby(["Brand", "Model"], observed=True, sort=False).indices
+        self._trees = {}
+        self._lock = threading.Lock()
+
+    def _model_trees(self, brand, model):
+        with self._lock:
+            if (brand, model) not in self._trees:
+                rows = self._groups.get((brand, model), np.array([], dtype=np.int64))
+                trees = _ModelTrees(self.frame.iloc[rows])
+                self._trees[(brand, model)] = (trees, rows)
+            return self._trees[(brand, model)]
+
+    def find(self, brand, model, year_month, kilometer, power, k=5):
+        # The k listings of brand/model most similar to the given car on each
+        # marketplace, with their distance, closest first per marketplace
+        trees, rows = self._model_trees(brand, model)
+        parts = []
+        for marketplace, (distances, found) in trees.query([car_age(year_month), kilometer, power], k).items():
+            part = self.frame.iloc[rows[found]][RESULT_COLUMNS].copy()
+            part["distance"] = distances
+            parts.append(part)
+        if not parts:
+            return pd.DataFrame(columns=RESULT_COLUMNS + ["distance"])
+        result = pd.concat(parts, ignore_index=True)
+        for col in ("Marketplace", "Brand", "Model"):
+            result[col] = result[col].astype(object)
+        return result
+
+
+def price_spread(comparables):
+    # Price summary of comparable listings per marketplace, cheapest median first
+    if not len(comparables):
+        return pd.DataFrame(columns=["listings", "min", "median", "max"])
+    grouped = comparables.groupby("Marketplace")["cleaned_Price"]
+    spread = pd.DataFrame({
+        "listings": grouped.size(),
+        "min": grouped.min(),
+        "median": grouped.median(),
+        "max": grouped.max(),
+    })
+    return spread.sort_values("median", kind="stable")
+
+
+def get_comparable_index(df, version):
+    # Build the index once per dataset version and share it across sessions
+    with _lock:
+        if version not in _cache:
+            _cache.clear()
+            _cache[version] = ComparableIndex(df)
+        return _cache[version]
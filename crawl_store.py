@@ -0,0 +1,260 @@
+"""Crawl-versioned listings store for price trends across crawls.
+
+    python crawl_store.py add imputed_output.csv --date 2024-05-01
+    python crawl_store.py list
+
+Every crawl is a complete snapshot of the marketplaces and is stored as its
+own partition crawl_date=YYYY-MM-DD of a parquet dataset (CAR_APP_CRAWLS,
+default ./crawl_store), sorted by marketplace and brand so the row group
+statistics let readers skip the row groups of other marketplaces. Queries
+name the partitions and columns they need and read nothing else. Each
+partition also gets a small summary (listings and median/mean price per
+marketplace and brand) when it is written, so the price trend over dozens of
+crawls reads only the summaries.
+"""
+import argparse
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from aggregates import MARKETPLACE_ORDER
+from data_loader import BASE_DIR, pa, pq
+from ingest import type_batch, validate_batch
+
+try:
+    import pyarrow.dataset as ds
+except ImportError:  # the store needs pyarrow, like the listings store
+    ds = None
+
+CRAWL_DIR = os.environ.get("CAR_APP_CRAWLS", os.path.join(BASE_DIR, "crawl_store"))
+# Listings are matched across crawls on ID_COLUMN when the crawl has it (e.g.
+# the listing URL), else on a hash of the KEY_COLUMNS of the listing. Keys
+# that occur more than once in a crawl are ambiguous and never matched.
+ID_COLUMN = "Listing_ID"
+KEY_COLUMNS = ["Marketplace", "Brand", "Model", "YearMonth", "Kilometer", "Power_PS", "Fuel_Type", "Gear_Type"]
+ROW_GROUP_SIZE = 128 * 1024
+ALL_BRANDS = ""  # Brand of the marketplace-wide summary rows
+PRICE_CHANGE_COLUMNS = ["Marketplace", "Brand", "Model", "YearMonth", "Kilometer", "Power_PS"]
+PRICE_CHANGES = 32  # price change results kept per process
+
+_cache = {}
+_changes = OrderedDict()
+_lock = threading.Lock()
+
+
+def _require_pyarrow():
+    if ds is None:
+        raise ImportError("the crawl store needs pyarrow")
+
+
+def partition_dir(crawl_date, crawl_dir=CRAWL_DIR):
+    return os.path.join(crawl_dir, f"crawl_date={crawl_date}")
+
+
+def list_crawls(crawl_dir=CRAWL_DIR):
+    # Crawl dates in the store, oldest first
+    if not os.path.isdir(crawl_dir):
+        return []
+    return sorted(name[len("crawl_date="):] for name in os.listdir(crawl_dir)
+                  if name.startswith("crawl_date=")
+                  and os.path.exists(os.path.join(crawl_dir, name, "part-0.parquet")))
+
+
+def listing_keys(df):
+    # Identity of every listing across crawls (see ID_COLUMN)
+    if ID_COLUMN in df.columns:
+        return pd.util.hash_pandas_object(df[ID_COLUMN].astype(str), index=False).to_numpy()
+    return pd.util.hash_pandas_object(df[KEY_COLUMNS], index=False).to_numpy()
+
+
+def summarize_crawl(df):
+    # Listings and median/mean price per marketplace and brand of one crawl,
+    # plus one row per marketplace over all brands (Brand == ALL_BRANDS)
+    prices = df[["Marketplace", "Brand", "cleaned_Price"]].astype({"Marketplace": object, "Brand": object})
+    by_brand = prices.groupby(["Marketplace", "Brand"])["cleaned_Price"]
+    by_marketplace = prices.groupby("Marketplace")["cleaned_Price"]
+    parts = []
+    for grouped, brand in ((by_brand, None), (by_marketplace, ALL_BRANDS)):
+        part = pd.DataFrame({"listings": grouped.size(), "priced": grouped.count(),
+                             "median_price": grouped.median(), "mean_price": grouped.mean()}).reset_index()
+        if brand is not None:
+            part["Brand"] = brand
+        parts.append(part)
+    summary = pd.concat(parts, ignore_index=True)[["Marketplace", "Brand", "listings", "priced",
+                                                   "median_price", "mean_price"]]
+    return summary.astype({"median_price": np.float64, "mean_price": np.float64})
+
+
+def _arrow_table(df):
+    # Arrow table of df with the categorical columns as plain values: pyarrow
+    # does not prune row groups on the statistics of dictionary columns
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    fields = []
+    for field in table.schema:
+        if pa.types.is_dictionary(field.type):
+            value_type = field.type.value_type
+            is_text = pa.types.is_string(value_type) or pa.types.is_large_string(value_type)
+            field = field.with_type(pa.string() if is_text else value_type)
+        fields.append(field)
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+def _write_parquet(table, path):
+    # write then rename, readers never see a partial file
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp_path, path)
+
+
+def add_crawl(raw, crawl_date, crawl_dir=CRAWL_DIR):
+    # Validate and type a crawl like an ingested batch and store it as the
+    # partition of crawl_date (replacing an earlier crawl of that date)
+    _require_pyarrow()
+    crawl_date = pd.Timestamp(crawl_date).strftime("%Y-%m-%d")
+    validate_batch(raw)
+    df = type_batch(raw)
+    if ID_COLUMN in raw.columns:
+        df[ID_COLUMN] = raw[ID_COLUMN].astype(str).to_numpy()
+    df["listing_key"] = listing_keys(df)
+    df = df.sort_values(["Marketplace", "Brand"], kind="stable").reset_index(drop=True)
+    directory = partition_dir(crawl_date, crawl_dir)
+    os.makedirs(directory, exist_ok=True)
+    # the summary starts with "_" so dataset discovery skips it
+    _write_parquet(_arrow_table(summarize_crawl(df)), os.path.join(directory, "_summary.parquet"))
+    _write_parquet(_arrow_table(df), os.path.join(directory, "part-0.parquet"))
+    return crawl_date
+
+
+def _dataset(crawl_dir):
+    partitioning = ds.partitioning(pa.schema([("crawl_date", pa.string())]), flavor="hive")
+    return ds.dataset(crawl_dir, format="parquet", partitioning=partitioning)
+
+
+def _expression(crawls, selection):
+    # Dataset filter of the given crawls (None: all) and selection, None when
+    # nothing is filtered
+    expression = None
+    conditions = [("crawl_date", crawls)] + list(selection.items())
+    for col, value in conditions:
+        if value is None:
+            continue
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        condition = ds.field(col).isin(values)
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def read_crawls(columns, crawls=None, crawl_dir=CRAWL_DIR, **selection):
+    # The given columns (plus crawl_date) of the listings of the given crawls
+    # (default: all) matching selection, e.g. Marketplace="Mobile.de" or a
+    # list of values. Only those partitions, columns and the row groups whose
+    # statistics can match are read.
+    _require_pyarrow()
+    table = _dataset(crawl_dir).to_table(columns=list(dict.fromkeys(list(columns) + ["crawl_date"])),
+                                         filter=_expression(crawls, selection))
+    return table.to_pandas()
+
+
+def _summary(crawl_date, crawl_dir):
+    # Summary of a partition, rebuilt from the partition when it is missing
+    path = os.path.join(partition_dir(crawl_date, crawl_dir), "_summary.parquet")
+    if os.path.exists(path):
+        return pq.read_table(path).to_pandas()
+    summary = summarize_crawl(read_crawls(["Marketplace", "Brand", "cleaned_Price"], [crawl_date], crawl_dir))
+    _write_parquet(_arrow_table(summary), path)
+    return summary
+
+
+def _signature(crawl_dir):
+    # Changes whenever a crawl partition is added, removed or rewritten
+    signature = []
+    for crawl_date in list_crawls(crawl_dir):
+        stat = os.stat(os.path.join(partition_dir(crawl_date, crawl_dir), "part-0.parquet"))
+        signature.append((crawl_date, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def price_trend(crawl_dir=CRAWL_DIR):
+    # Summaries of every crawl, one row per crawl date, marketplace and brand;
+    # shared across sessions until a partition changes
+    _require_pyarrow()
+    signature = _signature(crawl_dir)
+    with _lock:
+        if _cache.get(crawl_dir, (None,))[0] == signature:
+            return _cache[crawl_dir][1]
+    parts = []
+    for crawl_date, _, _ in signature:
+        summary = _summary(crawl_date, crawl_dir)
+        summary.insert(0, "crawl_date", crawl_date)
+        parts.append(summary)
+    columns = ["crawl_date", "Marketplace", "Brand", "listings", "priced", "median_price", "mean_price"]
+    trend = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns)
+    with _lock:
+        _cache[crawl_dir] = (signature, trend)
+    return trend
+
+
+def median_prices(trend, brand=ALL_BRANDS):
+    # Median price per crawl date (rows) and marketplace (columns) of a brand
+    # (default: all brands)
+    rows = trend[trend["Brand"] == brand]
+    pivot = rows.pivot(index="crawl_date", columns="Marketplace", values="median_price")
+    return pivot.reindex(columns=MARKETPLACE_ORDER)
+
+
+def _unique_listings(frame):
+    # Listings of a crawl by key, without the keys that occur more than once
+    duplicated = frame["listing_key"].duplicated(keep=False)
+    return frame[~duplicated & frame["cleaned_Price"].notna()].set_index("listing_key")
+
+
+def price_changes(before, after, crawl_dir=CRAWL_DIR, **selection):
+    # Listings in both crawls whose price changed, with the old and new price
+    # and the change in percent, biggest drop first. Only the two partitions
+    # and the needed columns are read; results are kept per crawl signature.
+    key = (crawl_dir, _signature(crawl_dir), before, after, tuple(sorted(selection.items())))
+    with _lock:
+        if key in _changes:
+            _changes.move_to_end(key)
+            return _changes[key]
+    frame = read_crawls(["listing_key", "cleaned_Price"] + PRICE_CHANGE_COLUMNS, [before, after],
+                        crawl_dir, **selection)
+    old = _unique_listings(frame[frame["crawl_date"] == before])
+    new = _unique_listings(frame[frame["crawl_date"] == after])
+    joined = old[PRICE_CHANGE_COLUMNS + ["cleaned_Price"]].join(new[["cleaned_Price"]], how="inner",
+                                                                   rsuffix="_new")
+    joined = joined.rename(columns={"cleaned_Price": "old_price", "cleaned_Price_new": "new_price"})
+    joined = joined[joined["new_price"] != joined["old_price"]]
+    joined["change_percent"] = (joined["new_price"] / joined["old_price"] - 1) * 100
+    result = joined.sort_values("change_percent", kind="stable").reset_index(drop=True)
+    with _lock:
+        _changes[key] = result
+        while len(_changes) > PRICE_CHANGES:
+            _changes.popitem(last=False)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--store", default=CRAWL_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="store a crawl CSV (imputed_output.csv schema) as one partition")
+    add.add_argument("file")
+    add.add_argument("--date", required=True, help="crawl date, YYYY-MM-DD")
+    commands.add_parser("list", help="list the stored crawls")
+    args = parser.parse_args()
+    if args.command == "add":
+        crawl_date = add_crawl(pd.read_csv(args.file, sep=";"), args.date, args.store)
+        print(f"{args.file}: stored as crawl {crawl_date}")
+    else:
+        trend = price_trend(args.store)
+        for crawl_date in list_crawls(args.store):
+            rows = trend[(trend["crawl_date"] == crawl_date) & (trend["Brand"] == ALL_BRANDS)]
+            print(f"{crawl_date}: {int(rows['listings'].sum()):,} listings")
+
+
+if __name__ == "__main__":
+    main()
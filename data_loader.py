@@ -0,0 +1,227 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from derived_columns import FUEL_PRICES
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # fall back to parsing the CSV on every cold start
+    pa = None
+    pq = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CSV_PATH = os.path.join(BASE_DIR, 'imputed_output.csv')
+# Append-only store of ingested crawl batches, one parquet partition each
+STORE_DIR = os.environ.get("CAR_APP_STORE", os.path.join(BASE_DIR, "listings_store"))
+
+CATEGORICAL_COLUMNS = ["Brand", "Model", "Marketplace", "Fuel_Type", "Gear_Type"]
+FLOAT_COLUMNS = [
+    "cleaned_Price", "Kilometer", "Consumption", "CO2_g_km", "Power_PS",
+    "Price_per_km", "Fuel_Cost_per_100km", "Annual_Fuel_Cost", "CO2_per_year",
+    "log_cleaned_price", "log_price_per_km", "log_CO2_Emission",
+    "log_CO2_per_year", "car_age",
+]
+
+# True on the rows whose Consumption was imputed rather than scraped
+IMPUTED_FLAG = "Consumption_imputed"
+
+# bump when the typed layout changes so old cache files get rebuilt
+SCHEMA_VERSION = "2"
+
+# The loaded frame is shared by every session of the server process, so code
+# must never modify it in place. With copy-on-write (always on from pandas 3)
+# any derived frame or column assignment gets its own data instead of
+# writing through to the shared one.
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def cache_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+def _file_hash(path):
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def prepare_frame(raw):
+    # Turn the raw semicolon CSV frame into the typed layout used by the app
+    df = raw.drop(columns=[c for c in raw.columns if c.startswith("Unnamed")])
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype("category")
+    for col in FLOAT_COLUMNS:
+        df[col] = df[col].astype(np.float32)
+    df["CO2_Emission_Category"] = df["CO2_Emission_Category"].astype(bool)
+    df["YearMonth"] = pd.to_datetime(df["YearMonth"])
+    df["Year"] = df["YearMonth"].dt.year.astype("Int16")
+    return df.reset_index(drop=True)
+
+
+def csv_imputed_flags(df):
+    # Consumption of imputed_output.csv was imputed after the fuel cost columns
+    # had been derived, so listings with a missing fuel cost carry imputed
+    # values. Fuel types without a price in FUEL_PRICES (CNG, "Sonstige") have
+    # no fuel cost at all; their scraped and imputed values cannot be told
+    # apart, so all of them count as imputed (and are never used to train the
+    # imputation models).
+    fuel_type = df["Fuel_Type"].astype(object)
+    unpriced = fuel_type.notna() & ~fuel_type.isin(list(FUEL_PRICES))
+    imputed = df["Consumption"].notna() & (df["Fuel_Cost_per_100km"].isna() | unpriced)
+    return imputed.to_numpy(np.bool_)
+
+
+def _read_cache(path, source_hash):
+    # Returns the cached frame if it was built from the same source, else None
+    if pq is None or not os.path.exists(path):
+        return None
+    meta = pq.read_schema(path).metadata or {}
+    if meta.get(b"source_hash", b"").decode() != source_hash:
+        return None
+    if meta.get(b"schema_version", b"").decode() != SCHEMA_VERSION:
+        return None
+    return pq.read_table(path).to_pandas()
+
+
+def _write_cache(df, path, source_hash):
+    if pa is None:
+        return
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    meta = dict(table.schema.metadata or {})
+    meta[b"source_hash"] = source_hash.encode()
+    meta[b"schema_version"] = SCHEMA_VERSION.encode()
+    tmp_path = path + ".tmp"
+    pq.write_table(table.replace_schema_metadata(meta), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def list_batches(store_dir=STORE_DIR):
+    # Ingested batch ids in ingest order (see ingest.py)
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(name[len("batch="):] for name in os.listdir(store_dir)
+                  if name.startswith("batch=") and os.path.exists(batch_path(name[len("batch="):], store_dir)))
+
+
+def batch_path(batch_id, store_dir=STORE_DIR):
+    return os.path.join(store_dir, f"batch={batch_id}", "part-0.parquet")
+
+
+def append_frames(df, delta):
+    # Concatenate typed frames, keeping categorical columns categorical
+    if not len(delta):
+        return df
+    df, delta = df.copy(deep=False), delta.copy(deep=False)
+    for col in CATEGORICAL_COLUMNS:
+        categories = df[col].cat.categories.union(delta[col].cat.categories)
+        df[col] = df[col].cat.set_categories(categories)
+        delta[col] = delta[col].cat.set_categories(categories)
+    return pd.concat([df, delta], ignore_index=True)
+
+
+def _read_batch(batch_id, store_dir):
+    df = pq.read_table(batch_path(batch_id, store_dir)).to_pandas()
+    if IMPUTED_FLAG not in df:
+        # written without an imputer by an older ingest.py
+        df[IMPUTED_FLAG] = np.zeros(len(df), dtype=np.bool_)
+    return df
+
+
+def _version(source_hash, batches):
+    if not batches:
+        return source_hash
+    return source_hash + "+" + hashlib.sha1("\n".join(batches).encode()).hexdigest()[:16]
+
+
+def _load_base(csv_path, source_hash):
+    parquet_path = cache_path(csv_path)
+    df = _read_cache(parquet_path, source_hash)
+    if df is None:
+        df = prepare_frame(pd.read_csv(csv_path, sep=";"))
+        df[IMPUTED_FLAG] = csv_imputed_flags(df)
+        _write_cache(df, parquet_path, source_hash)
+    return df
+
+
+def load_dataset(csv_path=CSV_PATH, store_dir=STORE_DIR):
+    # Process-wide typed dataset, one instance shared by all sessions; treat it
+    # as read-only and filter with slices or row positions.
+    #
+    # The dataset is the CSV followed by every batch ingested into store_dir.
+    # The CSV is only parsed when it changed since the columnar cache next to
+    # it was written. Within a process the frame is reused until the CSV
+    # changes; batches ingested since the last call are appended without
+    # reloading the rest (see delta_since).
+    stat = os.stat(csv_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    batches = list_batches(store_dir)
+    with _lock:
+        entry = _cache.get(csv_path)
+        if entry is not None and entry["signature"] != signature:
+            source_hash = _file_hash(csv_path)
+            if source_hash == entry["source_hash"]:
+                # touched but not modified
+                entry["signature"] = signature
+            else:
+                entry = None
+        if entry is None:
+            source_hash = _file_hash(csv_path)
+            df = _load_base(csv_path, source_hash)
+            entry = {"signature": signature, "source_hash": source_hash, "batches": [],
+                     "df": df, "version": source_hash, "rows": {source_hash: len(df)}}
+            _cache[csv_path] = entry
+
+        if batches != entry["batches"]:
+            loaded = entry["batches"]
+            if batches[:len(loaded)] == loaded:
+                new = batches[len(loaded):]
+                df = entry["df"]
+            else:
+                # a batch was removed or inserted before loaded ones: start over
+                new = batches
+                df = _load_base(csv_path, entry["source_hash"])
+                entry["rows"] = {}
+            if new and pq is None:
+                raise ImportError("reading ingested batches needs pyarrow")
+            for batch_id in new:
+                df = append_frames(df, _read_batch(batch_id, store_dir))
+            entry["df"], entry["batches"] = df, batches
+            entry["version"] = _version(entry["source_hash"], batches)
+            entry["rows"][entry["version"]] = len(df)
+        return entry["df"]
+
+
+def dataset_version(csv_path=CSV_PATH, store_dir=STORE_DIR):
+    # Content version of the currently loaded dataset, usable as a cache key
+    load_dataset(csv_path, store_dir)
+    return _cache[csv_path]["version"]
+
+
+def delta_since(version, current=None, csv_path=CSV_PATH):
+    # Rows appended to the dataset since it was at `version`, or None when the
+    # dataset did not grow from that version by appending batches, or is no
+    # longer at `current` (callers then rebuild from scratch)
+    with _lock:
+        entry = _cache.get(csv_path)
+        if entry is None or version not in entry["rows"]:
+            return None
+        if current is not None and current != entry["version"]:
+            return None
+        return entry["df"].iloc[entry["rows"][version]:]
+
+
+def clear_cache(csv_path=CSV_PATH):
+    # Drop the in-process copy of a dataset (the parquet cache stays on disk)
+    with _lock:
+        _cache.pop(csv_path, None)
@@ -0,0 +1,163 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+from aggregates import MARKETPLACE_ORDER
+
+# Depreciation curves: log_cleaned_price ~ car_age + Kilometer, fitted by
+# least squares for every (Brand, Model, Marketplace) group. A group's fit
+# only needs the sums of its 1, age, km, price products (the normal
+# equations), so the listings are reduced to one row of moments per group
+# (additive like the aggregate cube) and all groups are solved at once with a
+# batched np.linalg.solve. The marketplace gap of a model compares each
+# marketplace's fit at the model's mean age and mileage, i.e. for the same
+# car, with the model's mean log price over all marketplaces.
+GROUP_COLUMNS = ["Brand", "Model", "Marketplace"]
+TARGET = "log_cleaned_price"
+KM_UNIT = 10_000  # Kilometer is fitted per 10,000 km
+MIN_LISTINGS = 8  # fewer listings per group give no fit
+
+# (column, factors): the sum of the product of factors over a group's rows,
+# "1" is the intercept, "a" car_age, "k" Kilometer / KM_UNIT and "y" the target
+SUMS = {"n": "", "s_a": "a", "s_k": "k", "s_y": "y", "s_aa": "aa", "s_ak": "ak", "s_kk": "kk",
+        "s_ay": "ay", "s_ky": "ky", "s_yy": "yy"}
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def moments(df):
+    # One row per (Brand, Model, Marketplace) with the sums of SUMS and the
+    # age range, over the listings with age, mileage and price
+    values = {
+        "a": df["car_age"].to_numpy(np.float64, na_value=np.nan),
+        "k": df["Kilometer"].to_numpy(np.float64, na_value=np.nan) / KM_UNIT,
+        "y": df[TARGET].to_numpy(np.float64, na_value=np.nan),
+    }
+    valid = ~(np.isnan(values["a"]) | np.isnan(values["k"]) | np.isnan(values["y"]))
+    work = df.loc[valid, GROUP_COLUMNS].copy()
+    values = {name: v[valid] for name, v in values.items()}
+    for col, factors in SUMS.items():
+        product = np.ones(len(work))
+        for factor in factors:
+            product = product * values[factor]
+        work[col] = product
+    work["age_min"] = work["age_max"] = values["a"]
+    aggs = {col: (col, "sum") for col in SUMS}
+    aggs["age_min"], aggs["age_max"] = ("age_min", "min"), ("age_max", "max")
+    result = work.groupby(GROUP_COLUMNS, observed=True).agg(**aggs).reset_index()
+    return _tidy(result)
+
+
+def merge_moments(*tables):
+    # Moments are additive: the moments of appended rows are merged per group
+    merged = pd.concat(tables, ignore_index=True)
+    for col in GROUP_COLUMNS:
+        merged[col] = merged[col].astype(object)
+    aggs = {col: "sum" for col in SUMS}
+    aggs["age_min"], aggs["age_max"] = "min", "max"
+    return _tidy(merged.groupby(GROUP_COLUMNS).agg(aggs).reset_index())
+
+
+def _tidy(table):
+    for col in GROUP_COLUMNS:
+        table[col] = table[col].astype(object)
+    table["n"] = table["n"].astype(np.int64)
+    return table.sort_values(GROUP_COLUMNS, kind="stable").reset_index(drop=True)
+
+
+def _solve(sums):
+    # Coefficients (intercept, age, km) and R² of every row of sums, NaN for
+    # groups that are too small or whose age and mileage are collinear
+    n = sums["n"].to_numpy(np.float64)
+    s = {col: sums[col].to_numpy(np.float64) for col in SUMS if col != "n"}
+    xtx = np.stack([
+        np.stack([n, s["s_a"], s["s_k"]], axis=-1),
+        np.stack([s["s_a"], s["s_aa"], s["s_ak"]], axis=-1),
+        np.stack([s["s_k"], s["s_ak"], s["s_kk"]], axis=-1),
+    ], axis=1)
+    xty = np.stack([s["s_y"], s["s_ay"], s["s_ky"]], axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var_a = s["s_aa"] / n - (s["s_a"] / n) ** 2
+        var_k = s["s_kk"] / n - (s["s_k"] / n) ** 2
+        cov_ak = s["s_ak"] / n - s["s_a"] / n * s["s_k"] / n
+        usable = ((n >= MIN_LISTINGS) & (var_a > 1e-9) & (var_k > 1e-9)
+                  & (cov_ak ** 2 < (1 - 1e-6) * var_a * var_k))
+    beta = np.full((len(n), 3), np.nan)
+    beta[usable] = np.linalg.solve(xtx[usable], xty[usable][..., None])[..., 0]
+    sse = s["s_yy"] - 2 * (beta * xty).sum(axis=1) + np.einsum("gi,gij,gj->g", beta, xtx, beta)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sst = s["s_yy"] - s["s_y"] ** 2 / n
+        r2 = np.where(sst > 0, 1 - sse / sst, np.nan)
+    return beta, r2
+
+
+def fit(table):
+    # Depreciation fit per (Brand, Model, Marketplace) from its moments:
+    # yearly and per-10,000-km depreciation, R², and the model's raw and
+    # age/mileage-adjusted price gap of the marketplace (in %)
+    beta, r2 = _solve(table)
+    pooled = table.groupby(["Brand", "Model"], sort=False)[list(SUMS)].sum()
+    pooled = pooled.reindex(pd.MultiIndex.from_frame(table[["Brand", "Model"]]))
+    n = table["n"].to_numpy(np.float64)
+    pooled_n = pooled["n"].to_numpy(np.float64)
+    ref_age = pooled["s_a"].to_numpy() / pooled_n
+    ref_km = pooled["s_k"].to_numpy() / pooled_n
+    ref_y = pooled["s_y"].to_numpy() / pooled_n
+    adjusted_y = beta[:, 0] + beta[:, 1] * ref_age + beta[:, 2] * ref_km
+    result = table[GROUP_COLUMNS + ["n", "age_min", "age_max"]].rename(columns={"n": "listings"})
+    result["intercept"], result["age_coef"], result["km_coef"] = beta[:, 0], beta[:, 1], beta[:, 2]
+    result["yearly_depreciation"] = (1 - np.exp(beta[:, 1])) * 100
+    result["depreciation_per_10000_km"] = (1 - np.exp(beta[:, 2])) * 100
+    result["r2"] = r2
+    result["reference_age"], result["reference_km"] = ref_age, ref_km * KM_UNIT
+    result["adjusted_price"] = np.exp(adjusted_y)
+    result["raw_gap"] = (np.exp(table["s_y"].to_numpy() / n - ref_y) - 1) * 100
+    result["adjusted_gap"] = (np.exp(adjusted_y - ref_y) - 1) * 100
+    return result
+
+
+def predict(fits, ages, km):
+    # Fitted price of every fit row at the given ages (years) and mileage (km),
+    # one row per fit and one column per age
+    ages = np.asarray(ages, dtype=np.float64)
+    log_price = (fits["intercept"].to_numpy()[:, None] + fits["age_coef"].to_numpy()[:, None] * ages
+                 + fits["km_coef"].to_numpy()[:, None] * (km / KM_UNIT))
+    return np.exp(log_price)
+
+
+def marketplace_gaps(fits):
+    # Listing-weighted mean raw and adjusted gap per marketplace over the
+    # models fitted on at least two marketplaces
+    fitted = fits[fits["intercept"].notna()]
+    fitted = fitted[fitted.groupby(["Brand", "Model"])["Marketplace"].transform("size") >= 2]
+    rows = {}
+    for marketplace in MARKETPLACE_ORDER:
+        part = fitted[fitted["Marketplace"] == marketplace]
+        weights = part["listings"].to_numpy(np.float64)
+        row = {"models": len(part), "listings": int(weights.sum())}
+        for col in ("raw_gap", "adjusted_gap"):
+            # averaged on the log scale, like the fits
+            log_gap = np.log1p(part[col].to_numpy() / 100)
+            row[col] = (np.expm1((log_gap * weights).sum() / weights.sum()) * 100) if len(part) else np.nan
+        rows[marketplace] = row
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def get_fits(df, version):
+    # Moments and fits once per dataset version, shared across sessions. When
+    # the dataset only grew by ingested batches, just the new rows are reduced
+    # and merged before refitting.
+    with _lock:
+        if version not in _cache:
+            previous = next(iter(_cache.items()), None)
+            delta = None if previous is None else data_loader.delta_since(previous[0], version)
+            if delta is not None and len(delta) < len(df):
+                table = merge_moments(previous[1][0], moments(delta))
+            else:
+                table = moments(df)
+            _cache.clear()
+            _cache[version] = (table, fit(table))
+        return _cache[version][1]
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+# Assumptions the derived columns of imputed_output.csv were computed with
+FUEL_PRICES = {  # EUR per litre
+    "Benzin": 1.77,
+    "Diesel": 1.65,
+    "Autogas (LPG)": 0.229,
+    "Keine Information": 0.0,
+}
+# listings without a fuel type were costed at this price
+MISSING_FUEL_PRICE = 1.5
+ANNUAL_KM = 18507.46
+REFERENCE_DATE = pd.Timestamp("2025-01-01")
+
+
+def fuel_price_per_row(fuel_type, prices=FUEL_PRICES, missing=MISSING_FUEL_PRICE):
+    # Price per litre for each listing, NaN for fuel types without a price
+    fuel_type = pd.Series(fuel_type).astype(object)
+    price = fuel_type.map(prices).astype(np.float64).to_numpy()
+    return np.where(fuel_type.isna().to_numpy(), missing, price)
+
+
+def add_derived_columns(df, columns=None):
+    # Recompute the columns derived from the raw listing fields, in place.
+    # columns limits which ones are recomputed (default: all of them).
+    price = df["cleaned_Price"].to_numpy(np.float64, na_value=np.nan)
+    km = df["Kilometer"].to_numpy(np.float64, na_value=np.nan)
+    consumption = df["Consumption"].to_numpy(np.float64, na_value=np.nan)
+    co2 = df["CO2_g_km"].to_numpy(np.float64, na_value=np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        price_per_km = np.round(price / km, 2)
+        fuel_cost = consumption * fuel_price_per_row(df["Fuel_Type"])
+        annual_fuel_cost = np.round(fuel_cost * ANNUAL_KM / 100, 2)
+        co2_per_year = np.round(co2 * ANNUAL_KM / 1000, 2)
+        derived = {
+            "Price_per_km": price_per_km,
+            "Fuel_Cost_per_100km": fuel_cost,
+            "Annual_Fuel_Cost": annual_fuel_cost,
+            "CO2_per_year": co2_per_year,
+            "log_cleaned_price": np.log(price),
+            "log_price_per_km": np.log1p(price_per_km),
+            "log_CO2_Emission": np.log1p(co2),
+            "log_CO2_per_year": np.log1p(co2_per_year),
+            "car_age": ((REFERENCE_DATE - pd.to_datetime(df["YearMonth"])).dt.days / 365).to_numpy(),
+        }
+    for col in columns or derived:
+        dtype = df[col].dtype if col in df else np.float64
+        df[col] = derived[col].astype(dtype)
+    return df
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+# Cross-marketplace duplicate detection. Listings are blocked on brand, model
+# and first registration month; within a block they are sorted by mileage and
+# each one is compared with the next WINDOW listings (sorted neighbourhood),
+# so the cost is one sort plus WINDOW vectorized comparisons instead of all
+# pairs. Two listings of different marketplaces match when mileage, power and
+# price are within the tolerances below and fuel and gear type agree (an
+# unknown value agrees with anything, Mobile.de never shows the gear type);
+# matches are merged transitively into groups.
+BLOCK_COLUMNS = ["Brand", "Model", "YearMonth"]
+MATCH_COLUMNS = ["Fuel_Type", "Gear_Type"]
+UNKNOWN = "Keine Information"
+WINDOW = 8
+KILOMETER_TOLERANCE = 1_000  # km
+POWER_TOLERANCE = 2  # PS
+PRICE_TOLERANCE = 0.05  # relative to the lower price
+
+
+def _codes(df, col):
+    # Integer code per row, -1 for missing (and unknown) values
+    values = df[col]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy().astype(np.int64)
+        labels = values.cat.categories
+    else:
+        codes, labels = pd.factorize(values, use_na_sentinel=True)
+        codes = codes.astype(np.int64)
+    if UNKNOWN in labels:
+        codes[codes == labels.get_loc(UNKNOWN)] = -1
+    return codes
+
+
+def _components(n, left, right):
+    # Smallest row position of the connected group of every row, given the
+    # matched pairs (min-label propagation with pointer jumping)
+    labels = np.arange(n, dtype=np.int64)
+    while len(left):
+        low = np.minimum(labels[left], labels[right])
+        before = labels.copy()
+        np.minimum.at(labels, left, low)
+        np.minimum.at(labels, right, low)
+        labels = labels[labels]
+        if np.array_equal(labels, before):
+            break
+    return labels
+
+
+def duplicate_groups(df):
+    # Group id per row: the position of the group's first listing, the row's
+    # own position for listings without a duplicate
+    n = len(df)
+    block = [_codes(df, col) for col in BLOCK_COLUMNS]
+    attributes = [_codes(df, col) for col in MATCH_COLUMNS]
+    km = df["Kilometer"].to_numpy(np.float64, na_value=np.nan)
+    power = df["Power_PS"].to_numpy(np.float64, na_value=np.nan)
+    price = df["cleaned_Price"].to_numpy(np.float64, na_value=np.nan)
+    marketplace = _codes(df, "Marketplace")
+    valid = ~(np.isnan(km) | np.isnan(power) | np.isnan(price))
+    for codes in block:
+        valid &= codes >= 0
+
+    rows = np.flatnonzero(valid)
+    order = rows[np.lexsort([km[rows]] + [codes[rows] for codes in reversed(block)])]
+    same_block = np.ones(len(order), dtype=bool)
+    left, right = [], []
+    for offset in range(1, WINDOW + 1):
+        a, b = order[:-offset], order[offset:]
+        same_block = same_block[:-1] & np.logical_and.reduce([codes[a] == codes[b] for codes in block])
+        if not same_block.any():
+            break
+        low_price = np.minimum(price[a], price[b])
+        compatible = np.logical_and.reduce([(codes[a] == codes[b]) | (codes[a] < 0) | (codes[b] < 0)
+                                            for codes in attributes])
+        match = (same_block
+                 & compatible
+                 & (marketplace[a] != marketplace[b])
+                 & (np.abs(km[a] - km[b]) <= KILOMETER_TOLERANCE)
+                 & (np.abs(power[a] - power[b]) <= POWER_TOLERANCE)
+                 & (np.abs(price[a] - price[b]) <= PRICE_TOLERANCE * low_price))
+        left.append(a[match])
+        right.append(b[match])
+    if not left:
+        return np.arange(n, dtype=np.int64)
+    return _components(n, np.concatenate(left), np.concatenate(right))
+
+
+def duplicate_mask(df):
+    # True for listings that duplicate an earlier listing of another
+    # marketplace; dropping them keeps one listing per car
+    groups = duplicate_groups(df)
+    return groups != np.arange(len(df))
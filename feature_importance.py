@@ -0,0 +1,143 @@
+"""Feature importance of the Consumption imputation model.
+
+    python feature_importance.py --workers 16
+
+Impurity-based importance of the one-hot encoded features and permutation
+importance of the input columns, both with 95% confidence intervals, for a
+model cross-validated by imputation_models.py. Permutation repeats run on a
+process pool and are scored on a fixed-size sample of the training rows, so
+the cost does not grow with the dataset. Results are stored next to the
+model they describe and reused until that model is retrained.
+"""
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+
+import data_loader
+import imputation_models
+from imputation_models import TARGET, feature_frame, training_frame
+
+DEFAULT_MODEL = "Random Forest"
+REPEATS = 10
+SAMPLE_ROWS = 5_000
+Z_95 = 1.96
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def _interval(samples):
+    # mean and 95% normal confidence interval of the mean, per row of samples
+    samples = np.asarray(samples, dtype=np.float64)
+    mean = samples.mean(axis=1)
+    half = Z_95 * samples.std(axis=1, ddof=1) / np.sqrt(samples.shape[1])
+    return mean, mean - half, mean + half
+
+
+def _ranked(names, mean, low, high):
+    order = np.argsort(-mean, kind="stable")
+    return [{"feature": names[i], "importance": float(mean[i]),
+             "ci": [float(low[i]), float(high[i])]} for i in order]
+
+
+def impurity_importance(pipeline):
+    # Mean decrease in impurity per encoded feature. Forests get an interval
+    # from the spread over their trees; boosted models only a point estimate.
+    model = pipeline.named_steps["model"]
+    if not hasattr(model, "feature_importances_"):
+        return None
+    names = [name.split("__", 1)[1] for name in pipeline.named_steps["features"].get_feature_names_out()]
+    trees = getattr(model, "estimators_", None)
+    if trees is not None and np.ndim(trees) == 1 and hasattr(trees[0], "feature_importances_"):
+        return _ranked(names, *_interval(np.stack([t.feature_importances_ for t in trees], axis=1)))
+    mean = np.asarray(model.feature_importances_, dtype=np.float64)
+    return _ranked(names, mean, mean, mean)
+
+
+def permutation_importance(pipeline, frame, repeats=REPEATS, workers=None, seed=0):
+    # Drop in R² when one input column is shuffled, per column
+    from sklearn.inspection import permutation_importance as sk_permutation_importance
+
+    if len(frame) > SAMPLE_ROWS:
+        frame = frame.sample(SAMPLE_ROWS, random_state=seed)
+    X = feature_frame(frame)
+    y = frame[TARGET].to_numpy(np.float64)
+    result = sk_permutation_importance(pipeline, X, y, scoring="r2", n_repeats=repeats,
+                                       n_jobs=workers or -1, random_state=seed)
+    return _ranked(list(X.columns), *_interval(result.importances))
+
+
+def _result_path(version, name, model_dir):
+    return os.path.join(os.path.dirname(imputation_models.model_path(version, name, model_dir=model_dir)),
+                        "importance.json")
+
+
+def cached_importance(version, name=DEFAULT_MODEL, model_dir=imputation_models.MODEL_DIR):
+    # Stored result, kept in memory until the file changes (a retrained model
+    # removes it, see imputation_models.evaluate_models)
+    path = _result_path(version, name, model_dir)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        if key in _cache:
+            return _cache[key]
+    with open(path) as f:
+        result = json.load(f)
+    with _lock:
+        for stale in [k for k in _cache if k[0] == path]:
+            del _cache[stale]
+        _cache[key] = result
+    return result
+
+
+def compute_importance(df=None, version=None, name=DEFAULT_MODEL, repeats=REPEATS, workers=None,
+                       model_dir=imputation_models.MODEL_DIR):
+    # Importance of the cached model name for dataset version; None when that
+    # model has not been evaluated yet
+    if df is None:
+        df = data_loader.load_dataset()
+        version = data_loader.dataset_version()
+    cached = cached_importance(version, name, model_dir)
+    if cached is not None and cached["repeats"] == repeats:
+        return cached
+    pipeline = imputation_models.load_model(version, name, model_dir=model_dir)
+    if pipeline is None:
+        return None
+    result = {
+        "model": name,
+        "version": version,
+        "repeats": repeats,
+        "impurity": impurity_importance(pipeline),
+        "permutation": permutation_importance(pipeline, training_frame(df), repeats, workers),
+    }
+    path = _result_path(version, name, model_dir)
+    with open(path + ".tmp", "w") as f:
+        json.dump(result, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=DEFAULT_MODEL, choices=list(imputation_models.MODEL_SPECS))
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--workers", type=int, help="pool size (default: number of cores)")
+    args = parser.parse_args()
+    result = compute_importance(name=args.model, repeats=args.repeats, workers=args.workers)
+    if result is None:
+        parser.error(f"{args.model} has not been evaluated yet, run imputation_models.py first")
+    for kind in ("impurity", "permutation"):
+        print(kind)
+        for row in (result[kind] or [])[:10]:
+            print(f"  {row['feature']:<32} {row['importance']:.4f}  "
+                  f"[{row['ci'][0]:.4f}, {row['ci'][1]:.4f}]")
+
+
+if __name__ == "__main__":
+    main()
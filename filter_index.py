@@ -0,0 +1,172 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+from duplicates import duplicate_mask
+
+# Global sidebar filters: value lists on the categorical columns, (low, high)
+# ranges on the numeric ones and COLLAPSE_DUPLICATES=True to keep one listing
+# per car listed on several marketplaces (see duplicates.py). A filter spec is
+# a dict such as {"Fuel_Type": ["Diesel"], "cleaned_Price": (0, 15000)}; an
+# empty spec selects every listing.
+CATEGORY_FILTERS = ["Fuel_Type", "Gear_Type", "CO2_Emission_Category", "Marketplace"]
+RANGE_FILTERS = ["cleaned_Price", "Kilometer", "Power_PS", "car_age"]
+COLLAPSE_DUPLICATES = "collapse_duplicates"
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def filter_key(spec):
+    # Stable text form of a spec, part of the version of filtered views
+    parts = []
+    for col in sorted(spec):
+        value = spec[col]
+        if col in RANGE_FILTERS:
+            parts.append(f"{col}={float(value[0])!r}..{float(value[1])!r}")
+        elif col == COLLAPSE_DUPLICATES:
+            parts.append(f"{col}={bool(value)}")
+        else:
+            parts.append(f"{col}=" + ",".join(sorted(repr(v) for v in value)))
+    return "&".join(parts)
+
+
+def combine_specs(spec, other):
+    # Spec of the listings matching both spec and other
+    combined = dict(spec)
+    for col, value in other.items():
+        if col not in combined:
+            combined[col] = value
+        elif col in RANGE_FILTERS:
+            combined[col] = (max(combined[col][0], value[0]), min(combined[col][1], value[1]))
+        elif col == COLLAPSE_DUPLICATES:
+            combined[col] = bool(combined[col]) or bool(value)
+        else:
+            combined[col] = [v for v in combined[col] if v in value]
+    return combined
+
+
+def _append_bits(bits, n, mask):
+    # Packed bitmap of n rows followed by the rows of the boolean mask
+    tail = n % 8
+    if not tail:
+        return np.concatenate([bits, np.packbits(mask)])
+    head = np.unpackbits(bits[-1:], count=tail).astype(bool)
+    return np.concatenate([bits[:-1], np.packbits(np.concatenate([head, mask]))])
+
+
+class FilterIndex:
+    # Bitmaps (np.packbits, one bit per row) for every value of the category
+    # filters and the row order sorted by value for the range filters, built
+    # once per dataset version. A spec resolves to a row mask with a few
+    # bitwise ORs/ANDs over n/8 bytes and one binary search per range. The
+    # bitmap of non-duplicate listings is built on first use.
+    #
+    # With `base`, an index of the first base.n rows of df (the dataset before
+    # ingested batches were appended), only the rows after them are indexed:
+    # their bits are appended to the bitmaps of base and their values merged
+    # into its sorted ranges. The result equals FilterIndex(df).
+
+    def __init__(self, df, base=None):
+        start = 0 if base is None else base.n
+        delta = df.iloc[start:]
+        self.frame = df
+        self.n = len(df)
+        self._unique = None
+        self._lock = threading.Lock()
+        self._bitmaps = {}
+        self._options = {}
+        for col in CATEGORY_FILTERS:
+            codes, labels = pd.factorize(delta[col].astype(object), sort=True)
+            labels = [v.item() if isinstance(v, np.generic) else v for v in labels]
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+            rows = {label: order[a:b] for label, a, b in zip(labels, bounds[:-1], bounds[1:])}
+            old = {} if base is None else base._bitmaps[col]
+            self._options[col] = labels if base is None else sorted(set(old) | set(labels))
+            self._bitmaps[col] = {}
+            for label in self._options[col]:
+                mask = np.zeros(len(delta), dtype=bool)
+                mask[rows.get(label, [])] = True
+                bits = old.get(label, np.zeros((start + 7) // 8, dtype=np.uint8))
+                self._bitmaps[col][label] = _append_bits(bits, start, mask)
+        self._sorted = {}
+        for col in RANGE_FILTERS:
+            values = delta[col].to_numpy(np.float64, na_value=np.nan)
+            order = np.argsort(values, kind="stable")  # NaNs last
+            valid = int(np.count_nonzero(~np.isnan(values)))
+            values, rows = values[order[:valid]], (order[:valid] + start).astype(np.int32)
+            if base is None:
+                self._sorted[col] = (values, rows)
+            else:
+                # equal values keep their row order: the old rows come first
+                old_values, old_rows = base._sorted[col]
+                at = np.searchsorted(old_values, values, side="right")
+                self._sorted[col] = (np.insert(old_values, at, values), np.insert(old_rows, at, rows))
+
+    def _pack(self, rows):
+        mask = np.zeros(self.n, dtype=bool)
+        mask[rows] = True
+        return np.packbits(mask)
+
+    def _unique_bits(self):
+        with self._lock:
+            if self._unique is None:
+                self._unique = np.packbits(~duplicate_mask(self.frame))
+            return self._unique
+
+    def options(self, col):
+        # Values of a category filter, sorted, without missing values
+        return list(self._options[col])
+
+    def bounds(self, col):
+        # (min, max) of a range filter column
+        values, _ = self._sorted[col]
+        if not len(values):
+            return 0.0, 0.0
+        return float(values[0]), float(values[-1])
+
+    def select(self, spec):
+        # Boolean row mask of the listings matching every filter of spec, None
+        # when spec filters nothing
+        bits = None
+        for col, value in spec.items():
+            if col in RANGE_FILTERS:
+                values, order = self._sorted[col]
+                start = np.searchsorted(values, value[0], side="left")
+                stop = np.searchsorted(values, value[1], side="right")
+                col_bits = self._pack(order[start:stop])
+            elif col == COLLAPSE_DUPLICATES:
+                if not value:
+                    continue
+                col_bits = self._unique_bits()
+            elif col in CATEGORY_FILTERS:
+                col_bits = np.zeros((self.n + 7) // 8, dtype=np.uint8)
+                for v in value:
+                    if v in self._bitmaps[col]:
+                        col_bits |= self._bitmaps[col][v]
+            else:
+                raise ValueError(f"unknown filter column {col!r}")
+            bits = col_bits if bits is None else bits & col_bits
+        if bits is None:
+            return None
+        return np.unpackbits(bits, count=self.n).astype(bool)
+
+
+def get_filter_index(df, version):
+    # Build the index once per dataset version and share it across sessions.
+    # When the dataset only grew by ingested batches, just the new rows are
+    # added.
+    with _lock:
+        if version not in _cache:
+            previous = next(iter(_cache.items()), None)
+            delta = None if previous is None else data_loader.delta_since(previous[0], version)
+            if delta is not None and len(delta) < len(df) and previous[1].n == len(df) - len(delta):
+                index = FilterIndex(df, base=previous[1])
+            else:
+                index = FilterIndex(df)
+            _cache.clear()
+            _cache[version] = index
+        return _cache[version]
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import MARKETPLACE_ORDER
+from derived_columns import ANNUAL_KM, FUEL_PRICES
+
+# What-if running costs: fuel cost, CO2 and total cost of ownership of every
+# listing for user-chosen fuel prices (EUR per litre, by Fuel_Type) and
+# annual mileage. Total cost of ownership is the listing price plus the fuel
+# of `years` years; taxes, insurance and resale value are left out. Fuel
+# types without a price (e.g. "Keine Information") get no cost.
+DEFAULT_PRICES = {fuel: price for fuel, price in FUEL_PRICES.items() if price > 0}
+DEFAULT_ANNUAL_KM = round(ANNUAL_KM)
+DEFAULT_YEARS = 5
+
+# additive per-(Marketplace, Brand) columns of cost_sums
+SUM_COLUMNS = ["listings", "fuel_n", "annual_fuel_cost_sum", "total_cost_n", "total_cost_sum",
+               "co2_n", "co2_per_year_sum"]
+
+
+def _codes(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy().astype(np.int64), list(values.cat.categories)
+    codes, labels = pd.factorize(values)
+    return codes.astype(np.int64), list(labels)
+
+
+def listing_costs(df, prices, annual_km, years):
+    # Per-listing arrays for the given assumptions, in one vectorized pass:
+    # fuel cost per 100 km, annual fuel cost, CO2 per year (kg) and total cost
+    codes, categories = _codes(df["Fuel_Type"])
+    # price per category code, the extra last entry serves missing values (-1)
+    price_by_code = np.array([prices.get(c, np.nan) for c in categories] + [np.nan], dtype=np.float64)
+    consumption = df["Consumption"].to_numpy(np.float64, na_value=np.nan)
+    fuel_cost = consumption * price_by_code[codes]
+    annual_fuel_cost = fuel_cost * annual_km / 100
+    co2 = df["CO2_g_km"].to_numpy(np.float64, na_value=np.nan)
+    return {
+        "fuel_cost_per_100km": fuel_cost,
+        "annual_fuel_cost": annual_fuel_cost,
+        "co2_per_year": co2 * annual_km / 1000,
+        "total_cost": df["cleaned_Price"].to_numpy(np.float64, na_value=np.nan) + years * annual_fuel_cost,
+    }
+
+
+def cost_sums(df, prices, annual_km, years):
+    # Counts and sums of the listing costs per (Marketplace, Brand)
+    costs = listing_costs(df, prices, annual_km, years)
+    marketplace_codes, marketplaces = _codes(df["Marketplace"])
+    brand_codes, brands = _codes(df["Brand"])
+    valid = (marketplace_codes >= 0) & (brand_codes >= 0)
+    group = marketplace_codes * len(brands) + brand_codes
+    size = len(marketplaces) * len(brands)
+
+    def sums(values):
+        present = valid & ~np.isnan(values)
+        return (np.bincount(group[present], minlength=size),
+                np.bincount(group[present], weights=values[present], minlength=size))
+
+    result = pd.DataFrame({
+        "Marketplace": np.repeat(np.array(marketplaces, dtype=object), len(brands)),
+        "Brand": np.tile(np.array(brands, dtype=object), len(marketplaces)),
+        "listings": np.bincount(group[valid], minlength=size),
+    })
+    result["fuel_n"], result["annual_fuel_cost_sum"] = sums(costs["annual_fuel_cost"])
+    result["total_cost_n"], result["total_cost_sum"] = sums(costs["total_cost"])
+    result["co2_n"], result["co2_per_year_sum"] = sums(costs["co2_per_year"])
+    return result[result["listings"] > 0].reset_index(drop=True)
+
+
+def summarize(sums, top_n=10):
+    # Means per marketplace and the mean total cost of the top_n brands (by
+    # listing count) per marketplace
+    by_marketplace = sums.groupby("Marketplace")[SUM_COLUMNS].sum().reindex(MARKETPLACE_ORDER, fill_value=0)
+    marketplace = pd.DataFrame({
+        "listings": by_marketplace["listings"],
+        "annual_fuel_cost": by_marketplace["annual_fuel_cost_sum"] / by_marketplace["fuel_n"].replace(0, np.nan),
+        "total_cost": by_marketplace["total_cost_sum"] / by_marketplace["total_cost_n"].replace(0, np.nan),
+        "co2_per_year": by_marketplace["co2_per_year_sum"] / by_marketplace["co2_n"].replace(0, np.nan),
+    })
+    top_brands = sums.groupby("Brand")["listings"].sum().sort_values(ascending=False, kind="stable").index[:top_n]
+    brands = sums[sums["Brand"].isin(top_brands)]
+    brand_cost = (brands["total_cost_sum"] / brands["total_cost_n"].replace(0, np.nan)).rename("total_cost")
+    by_brand = (pd.concat([brands[["Brand", "Marketplace"]], brand_cost], axis=1)
+                .pivot(index="Brand", columns="Marketplace", values="total_cost")
+                .reindex(index=list(top_brands), columns=MARKETPLACE_ORDER))
+    return marketplace, by_brand
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import MARKETPLACE_ORDER
+
+# Binned distributions of a numeric column per group. Only the bin counts of
+# each group leave the backend, so the payload depends on bins x groups and
+# not on the number of listings. The bins cover the central CLIP quantile
+# range of the column; values outside it are counted as under/overflow. The
+# density curve is a Gaussian KDE evaluated on the binned counts (a binned
+# KDE) with Silverman's bandwidth. Missing and infinite values are left out.
+VALUE_COLUMNS = ["CO2_g_km", "Power_PS", "Kilometer", "Price_per_km", "Annual_Fuel_Cost", "car_age"]
+GROUP_COLUMNS = ["Marketplace", "Fuel_Type", "Brand"]
+DEFAULT_BINS = 40
+CLIP = (0.005, 0.995)
+TOP_GROUPS = 10  # groups shown at most (the largest ones), Marketplace shows all
+
+
+def check_columns(value_col, group_col):
+    if value_col not in VALUE_COLUMNS:
+        raise ValueError(f"unknown value column {value_col!r}")
+    if group_col not in GROUP_COLUMNS:
+        raise ValueError(f"unknown group column {group_col!r}")
+
+
+def bin_range(values, clip=CLIP):
+    # (low, high) of the bins for the finite values
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return checked_range(None, None)
+    low, high = np.quantile(values, clip)
+    return checked_range(low, high)
+
+
+def checked_range(low, high):
+    # A non-empty bin range from the clip quantiles (None without values)
+    if low is None or high is None:
+        return 0.0, 1.0
+    if high <= low:
+        high = low + 1.0
+    return float(low), float(high)
+
+
+def bin_index(values, low, high, bins):
+    # Bin of every value, -1 below low, bins above high, values equal to high
+    # fall into the last bin (the same arithmetic as the duckdb backend)
+    width = (high - low) / bins
+    with np.errstate(invalid="ignore"):
+        index = np.minimum(np.floor((values - low) / width), bins - 1)
+    index = np.where(values < low, -1, np.where(values > high, bins, index))
+    return index
+
+
+def show_groups(group_col, totals, top_n=TOP_GROUPS):
+    # Groups to show given {group: listings}: every marketplace in display
+    # order, otherwise the top_n largest groups
+    if group_col == "Marketplace":
+        return [m for m in MARKETPLACE_ORDER if totals.get(m, 0)]
+    ranked = sorted(totals.items(), key=lambda item: (-item[1], str(item[0])))
+    return [group for group, _ in ranked[:top_n]]
+
+
+def binned_counts(df, value_col, group_col, bins=DEFAULT_BINS, top_n=TOP_GROUPS):
+    # Bin counts per group of value_col from the listings in df
+    check_columns(value_col, group_col)
+    values = df[value_col].to_numpy(np.float64, na_value=np.nan)
+    low, high = bin_range(values)
+    groups = df[group_col]
+    if isinstance(groups.dtype, pd.CategoricalDtype):
+        codes, labels = groups.cat.codes.to_numpy().astype(np.int64), list(groups.cat.categories)
+    else:
+        codes, labels = pd.factorize(groups)
+        codes, labels = codes.astype(np.int64), list(labels)
+    valid = (codes >= 0) & np.isfinite(values)  # Price_per_km is inf at 0 km
+    totals = np.bincount(codes[valid], minlength=len(labels))
+    shown = show_groups(group_col, {label: int(total) for label, total in zip(labels, totals) if total})
+    position = np.full(len(labels) + 1, -1, dtype=np.int64)  # last entry serves code -1
+    for i, label in enumerate(shown):
+        position[labels.index(label)] = i
+    group = position[codes]
+    keep = valid & (group >= 0)
+    index = bin_index(values[keep], low, high, bins).astype(np.int64) + 1  # underflow first
+    counts = np.bincount(group[keep] * (bins + 2) + index, minlength=len(shown) * (bins + 2))
+    return from_counts(shown, counts.reshape(len(shown), bins + 2), low, high, bins)
+
+
+def from_counts(groups, counts, low, high, bins):
+    # Distribution payload from the (groups x (underflow, bins..., overflow))
+    # counts, shared by the backends
+    counts = np.asarray(counts, dtype=np.int64).reshape(len(groups), bins + 2)
+    edges = low + (high - low) / bins * np.arange(bins + 1)
+    centers = (edges[:-1] + edges[1:]) / 2
+    inner = counts[:, 1:-1]
+    return {
+        "groups": [str(g) for g in groups],
+        "edges": edges.tolist(),
+        "counts": inner.tolist(),
+        "underflow": counts[:, 0].tolist(),
+        "overflow": counts[:, -1].tolist(),
+        "listings": counts.sum(axis=1).tolist(),
+        "density": [binned_kde(row, centers).tolist() for row in inner],
+    }
+
+
+def binned_kde(counts, centers):
+    # Gaussian KDE of the binned counts at the bin centers, in listings per
+    # bin so it overlays the histogram
+    counts = np.asarray(counts, dtype=np.float64)
+    n = counts.sum()
+    if n < 2 or len(centers) < 2:
+        return np.zeros(len(centers))
+    width = centers[1] - centers[0]
+    mean = (counts * centers).sum() / n
+    std = np.sqrt((counts * (centers - mean) ** 2).sum() / (n - 1))
+    bandwidth = max(1.06 * std * n ** -0.2, width / 2)
+    offsets = np.arange(-len(centers) + 1, len(centers)) * width
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    kernel /= kernel.sum()
+    # kernel index len(centers) - 1 is the zero offset
+    return np.convolve(counts, kernel)[len(centers) - 1:2 * len(centers) - 1]
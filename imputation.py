@@ -0,0 +1,138 @@
+"""Consumption imputation for ingested listings.
+
+    python imputation.py --publish "XGBoost"
+
+--publish copies a model cross-validated by imputation_models.py on the
+current dataset to the imputer artifact (CAR_APP_IMPUTER, default
+model_cache/consumption_imputer.joblib). ingest.py then fills the missing
+Consumption values of every new batch with it and recomputes the columns
+derived from Consumption. The artifact is loaded once per process with its
+arrays memory-mapped.
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+import data_loader
+from derived_columns import add_derived_columns
+import imputation_models
+from imputation_models import IMPUTED_FLAG, MODEL_DIR, TARGET, feature_frame
+
+ARTIFACT_PATH = os.environ.get("CAR_APP_IMPUTER", os.path.join(MODEL_DIR, "consumption_imputer.joblib"))
+DEFAULT_MODEL = "XGBoost"
+BATCH_SIZE = 100_000
+
+# Recomputed after imputation; CO2_per_year only depends on CO2_g_km but is
+# refreshed with the others so a batch never mixes old and new derivations
+DEPENDENT_COLUMNS = ["Fuel_Cost_per_100km", "Annual_Fuel_Cost", "CO2_per_year", "log_CO2_per_year"]
+
+_imputers = {}
+_lock = threading.Lock()
+
+
+def _metadata_path(path):
+    return path + ".json"
+
+
+def publish_model(name=DEFAULT_MODEL, version=None, path=ARTIFACT_PATH, model_dir=MODEL_DIR,
+                  folds=None, seed=None):
+    # Copy the cached model of dataset version (default: current) to path.
+    # The model must have been evaluated by imputation_models first, with
+    # folds and seed (default: the settings of its last run).
+    version = version or data_loader.dataset_version()
+    folds, seed = imputation_models.cv_settings(folds, seed, model_dir)
+    scores = imputation_models.cached_result(version, name, folds=folds, seed=seed, model_dir=model_dir)
+    if scores is None:
+        raise FileNotFoundError(f"{name} has not been evaluated on dataset version {version} with "
+                                f"{folds} folds and seed {seed}, run imputation_models.py first")
+    source = imputation_models.model_path(version, name, folds=folds, seed=seed, model_dir=model_dir)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    shutil.copyfile(source, path + ".tmp")
+    with open(_metadata_path(path), "w") as f:
+        json.dump(scores, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return scores
+
+
+class ConsumptionImputer:
+    def __init__(self, pipeline, metadata=None):
+        self.pipeline = pipeline
+        self.metadata = metadata or {}
+        # use every core for the prediction, the artifact was fitted single-threaded
+        model = pipeline.named_steps["model"]
+        if "n_jobs" in model.get_params():
+            model.set_params(n_jobs=-1)
+
+    @classmethod
+    def load(cls, path=ARTIFACT_PATH):
+        import joblib
+
+        metadata = None
+        if os.path.exists(_metadata_path(path)):
+            with open(_metadata_path(path)) as f:
+                metadata = json.load(f)
+        return cls(joblib.load(path, mmap_mode="r"), metadata)
+
+    def predict(self, df, batch_size=BATCH_SIZE):
+        # Predicted Consumption for every row of df, float64
+        features = feature_frame(df)
+        predicted = np.empty(len(features), dtype=np.float64)
+        for start in range(0, len(features), batch_size):
+            chunk = features.iloc[start:start + batch_size]
+            predicted[start:start + len(chunk)] = self.pipeline.predict(chunk)
+        return predicted
+
+    def impute(self, df, batch_size=BATCH_SIZE):
+        # Fill the missing Consumption values of df in place, flag them and
+        # recompute the dependent columns; returns the number of filled rows
+        missing = df[TARGET].isna().to_numpy()
+        flags = np.zeros(len(df), dtype=np.bool_)
+        if missing.any():
+            # a copy: for a float64 column to_numpy returns a read-only view
+            values = df[TARGET].to_numpy(np.float64, na_value=np.nan, copy=True)
+            values[missing] = np.round(self.predict(df.loc[missing], batch_size), 1)
+            df[TARGET] = values.astype(df[TARGET].dtype)
+            flags[missing] = True
+        df[IMPUTED_FLAG] = flags
+        add_derived_columns(df, DEPENDENT_COLUMNS)
+        return int(missing.sum())
+
+
+def get_imputer(path=ARTIFACT_PATH):
+    # The published imputer, loaded once per process and artifact revision;
+    # None when nothing was published or scikit-learn is missing
+    if not os.path.exists(path) or not imputation_models.sklearn_available():
+        return None
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        if key not in _imputers:
+            _imputers.clear()
+            _imputers[key] = ConsumptionImputer.load(path)
+        return _imputers[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--publish", metavar="MODEL", nargs="?", const=DEFAULT_MODEL,
+                        choices=list(imputation_models.MODEL_SPECS))
+    parser.add_argument("--artifact", default=ARTIFACT_PATH)
+    parser.add_argument("--folds", type=int, help="CV folds the model was evaluated with "
+                                                  "(default: those of the last imputation_models.py run)")
+    parser.add_argument("--seed", type=int, help="CV seed the model was evaluated with (same default)")
+    args = parser.parse_args()
+    if args.publish:
+        scores = publish_model(args.publish, path=args.artifact, folds=args.folds, seed=args.seed)
+        print(f"published {args.publish} (RMSE {scores['rmse']:.2f}, R² {scores['r2']:.2f}) "
+              f"to {args.artifact}")
+    else:
+        imputer = get_imputer(args.artifact)
+        print("no imputer published" if imputer is None else json.dumps(imputer.metadata, indent=2))
+
+
+if __name__ == "__main__":
+    main()
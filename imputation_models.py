@@ -0,0 +1,325 @@
+"""Cross-validated evaluation of the Consumption imputation models.
+
+    python imputation_models.py --workers 16
+
+Trains the regressors of research question 3 on the listings whose
+Consumption was scraped (not imputed) with k-fold cross-validation. Every
+(model, fold) fit is an independent task on a process pool. Scores and the
+model refitted on all rows are cached in MODEL_DIR under a key made of the
+dataset version, the model's hyperparameters and the CV settings, so a
+rerun only trains what changed. The CV settings of the last run are kept in
+MODEL_DIR/cv_settings.json; the dashboard and imputation.py read the models
+of those settings. Needs scikit-learn (and xgboost for the XGBoost row,
+which is skipped without it).
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+
+MODEL_DIR = os.environ.get("CAR_APP_MODEL_DIR", os.path.join(data_loader.BASE_DIR, "model_cache"))
+# Cross-validation settings of the cached models the app, feature_importance.py
+# and imputation.py read (see cv_settings)
+SETTINGS_FILE = "cv_settings.json"
+DEFAULT_FOLDS = 5
+DEFAULT_SEED = 0
+# The dashboard only offers retraining when this is set: a run keeps every
+# core of the server busy for about a minute
+RETRAIN_FLAG = "CAR_APP_ALLOW_RETRAIN"
+
+NUMERIC_FEATURES = ["CO2_g_km", "CO2_per_year", "Kilometer", "cleaned_Price", "car_age", "Power_PS"]
+CATEGORICAL_FEATURES = ["Marketplace", "Brand", "Model", "Fuel_Type", "Gear_Type"]
+TARGET = "Consumption"
+# True on the rows of the CSV (see data_loader.csv_imputed_flags) and of
+# ingested batches (imputation.py) whose Consumption was imputed
+IMPUTED_FLAG = data_loader.IMPUTED_FLAG
+
+# Display name -> (module, estimator class, hyperparameters, scale numeric features)
+MODEL_SPECS = {
+    "Ridge Regression": ("sklearn.linear_model", "Ridge", {"alpha": 1.0}, True),
+    "Lasso": ("sklearn.linear_model", "Lasso", {"alpha": 0.01}, True),
+    "Random Forest": ("sklearn.ensemble", "RandomForestRegressor",
+                      {"n_estimators": 200, "min_samples_leaf": 2, "random_state": 0}, False),
+    "KNN": ("sklearn.neighbors", "KNeighborsRegressor", {"n_neighbors": 10, "weights": "distance"}, True),
+    "Gradient Boosting": ("sklearn.ensemble", "GradientBoostingRegressor",
+                          {"n_estimators": 300, "max_depth": 3, "random_state": 0}, False),
+    "SVR": ("sklearn.svm", "SVR", {"C": 3.0, "epsilon": 0.1}, True),
+    "XGBoost": ("xgboost", "XGBRegressor",
+                {"n_estimators": 400, "max_depth": 6, "learning_rate": 0.05, "subsample": 0.8,
+                 "random_state": 0, "n_jobs": 1}, False),
+    "MLP Regressor": ("sklearn.neural_network", "MLPRegressor",
+                      {"hidden_layer_sizes": [64, 32], "max_iter": 500, "early_stopping": True,
+                       "random_state": 0}, True),
+}
+
+# Set in each pool worker by _init_worker so the training rows are sent once
+# per process instead of once per task
+_frame = None
+
+
+def sklearn_available():
+    try:
+        importlib.import_module("sklearn")
+    except ImportError:
+        return False
+    return True
+
+
+def available_models():
+    # Names of MODEL_SPECS whose library is installed
+    names = []
+    for name, (module, _, _, _) in MODEL_SPECS.items():
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def observed_consumption(df):
+    # Rows with a scraped Consumption value
+    if IMPUTED_FLAG in df:
+        imputed = df[IMPUTED_FLAG].to_numpy(np.bool_)
+    else:
+        imputed = data_loader.csv_imputed_flags(df)
+    return df[TARGET].notna() & ~imputed
+
+
+def training_frame(df):
+    # Feature and target columns of the rows with scraped Consumption
+    rows = df.loc[observed_consumption(df), NUMERIC_FEATURES + CATEGORICAL_FEATURES + [TARGET]]
+    return rows.reset_index(drop=True)
+
+
+def feature_frame(df):
+    # Model input for any listings, in the layout the pipelines were fitted on
+    features = df[NUMERIC_FEATURES + CATEGORICAL_FEATURES].copy()
+    for col in CATEGORICAL_FEATURES:
+        features[col] = features[col].astype(object).where(features[col].notna(), "missing")
+    return features
+
+
+def make_pipeline(name, params=None):
+    # Median imputation (+ scaling) of the numeric features, one-hot encoding
+    # of the categorical ones, then the regressor
+    from sklearn.compose import ColumnTransformer
+    from sklearn.impute import SimpleImputer
+    from sklearn.pipeline import Pipeline, make_pipeline as sk_make_pipeline
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    module, cls, defaults, scale = MODEL_SPECS[name]
+    params = dict(defaults, **(params or {}))
+    if "hidden_layer_sizes" in params:
+        params["hidden_layer_sizes"] = tuple(params["hidden_layer_sizes"])
+    estimator = getattr(importlib.import_module(module), cls)(**params)
+    numeric = [SimpleImputer(strategy="median")] + ([StandardScaler()] if scale else [])
+    columns = ColumnTransformer([
+        ("numeric", sk_make_pipeline(*numeric), NUMERIC_FEATURES),
+        ("categorical", OneHotEncoder(handle_unknown="ignore", min_frequency=5), CATEGORICAL_FEATURES),
+    ])
+    return Pipeline([("features", columns), ("model", estimator)])
+
+
+def cache_key(version, name, params, folds, seed):
+    payload = json.dumps({
+        "version": version, "model": name, "params": params, "folds": folds, "seed": seed,
+        "features": NUMERIC_FEATURES + CATEGORICAL_FEATURES,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def retrain_allowed():
+    return os.environ.get(RETRAIN_FLAG, "") not in ("", "0")
+
+
+def cv_settings(folds=None, seed=None, model_dir=MODEL_DIR):
+    # (folds, seed) with the ones not given taken from the settings of the
+    # last command line evaluation in model_dir, else the defaults
+    try:
+        with open(os.path.join(model_dir, SETTINGS_FILE)) as f:
+            settings = json.load(f)
+    except (OSError, ValueError):
+        settings = {}
+    folds = int(settings.get("folds", DEFAULT_FOLDS)) if folds is None else folds
+    seed = int(settings.get("seed", DEFAULT_SEED)) if seed is None else seed
+    return folds, seed
+
+
+def save_cv_settings(folds, seed, model_dir=MODEL_DIR):
+    os.makedirs(model_dir, exist_ok=True)
+    path = os.path.join(model_dir, SETTINGS_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"folds": folds, "seed": seed}, f)
+    os.replace(path + ".tmp", path)
+
+
+def _init_worker(frame):
+    global _frame
+    _frame = frame
+
+
+def _fit_fold(name, params, train, test):
+    # Fit on the train positions, return (rmse, r2) on the test positions.
+    # With test=None the model is fitted on all rows and returned instead.
+    from sklearn.metrics import mean_squared_error, r2_score
+
+    X = feature_frame(_frame)
+    y = _frame[TARGET].to_numpy(np.float64)
+    pipeline = make_pipeline(name, params)
+    if test is None:
+        return pipeline.fit(X, y)
+    pipeline.fit(X.iloc[train], y[train])
+    predicted = pipeline.predict(X.iloc[test])
+    return float(np.sqrt(mean_squared_error(y[test], predicted))), float(r2_score(y[test], predicted))
+
+
+def _entry_dir(key, model_dir):
+    return os.path.join(model_dir, key)
+
+
+def cached_result(version, name, params=None, folds=None, seed=None, model_dir=MODEL_DIR):
+    # Scores of a previous evaluation with the same settings, or None
+    params = dict(MODEL_SPECS[name][2], **(params or {}))
+    folds, seed = cv_settings(folds, seed, model_dir)
+    path = os.path.join(_entry_dir(cache_key(version, name, params, folds, seed), model_dir), "scores.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def cached_results(version, models=None, folds=None, seed=None, model_dir=MODEL_DIR):
+    # {name: scores} of the models with default hyperparameters already
+    # evaluated on this dataset version
+    results = {}
+    for name in models or available_models():
+        result = cached_result(version, name, None, folds, seed, model_dir)
+        if result is not None:
+            results[name] = result
+    return results
+
+
+def model_path(version, name, params=None, folds=None, seed=None, model_dir=MODEL_DIR):
+    # Where evaluate_models stores the model refitted on all training rows
+    params = dict(MODEL_SPECS[name][2], **(params or {}))
+    folds, seed = cv_settings(folds, seed, model_dir)
+    return os.path.join(_entry_dir(cache_key(version, name, params, folds, seed), model_dir), "model.joblib")
+
+
+def load_model(version, name, params=None, folds=None, seed=None, model_dir=MODEL_DIR):
+    # Pipeline refitted on all training rows by evaluate_models, or None
+    import joblib
+
+    path = model_path(version, name, params, folds, seed, model_dir)
+    return joblib.load(path) if os.path.exists(path) else None
+
+
+def _write_entry(key, scores, model, model_dir):
+    import joblib
+
+    directory = _entry_dir(key, model_dir)
+    os.makedirs(directory, exist_ok=True)
+    # results derived from a replaced model (e.g. its feature importance) are stale
+    for name in os.listdir(directory):
+        if name not in ("model.joblib", "scores.json"):
+            os.remove(os.path.join(directory, name))
+    joblib.dump(model, os.path.join(directory, "model.joblib"))
+    tmp = os.path.join(directory, "scores.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(scores, f, indent=2)
+    os.replace(tmp, os.path.join(directory, "scores.json"))
+
+
+def evaluate_models(df=None, version=None, models=None, params=None, folds=None, seed=None,
+                    workers=None, model_dir=MODEL_DIR, refresh=False):
+    # Cross-validated RMSE / R² per model, {name: scores}. params maps model
+    # names to hyperparameter overrides; folds and seed default to
+    # cv_settings(). Cached models are not retrained unless refresh is set,
+    # which retrains them and replaces their entries.
+    from sklearn.model_selection import KFold
+
+    folds, seed = cv_settings(folds, seed, model_dir)
+
+    if df is None:
+        df = data_loader.load_dataset()
+        version = data_loader.dataset_version()
+    params = params or {}
+    models = models or available_models()
+    results, pending = {}, {}
+    for name in models:
+        model_params = dict(MODEL_SPECS[name][2], **params.get(name, {}))
+        cached = None if refresh else cached_result(version, name, params.get(name), folds, seed, model_dir)
+        if cached is not None:
+            results[name] = cached
+        else:
+            pending[name] = model_params
+    if not pending:
+        return results
+
+    frame = training_frame(df)
+    splits = list(KFold(n_splits=folds, shuffle=True, random_state=seed).split(frame))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(frame,)) as pool:
+        futures = {
+            name: ([pool.submit(_fit_fold, name, p, train, test) for train, test in splits],
+                   pool.submit(_fit_fold, name, p, None, None))
+            for name, p in pending.items()
+        }
+        for name, (fold_futures, final_future) in futures.items():
+            scores = np.array([f.result() for f in fold_futures])
+            result = {
+                "model": name,
+                "params": pending[name],
+                "version": version,
+                "folds": folds,
+                "seed": seed,
+                "rows": len(frame),
+                "rmse": float(scores[:, 0].mean()),
+                "rmse_std": float(scores[:, 0].std(ddof=1)),
+                "r2": float(scores[:, 1].mean()),
+                "r2_std": float(scores[:, 1].std(ddof=1)),
+            }
+            key = cache_key(version, name, pending[name], folds, seed)
+            _write_entry(key, result, final_future.result(), model_dir)
+            results[name] = result
+    return {name: results[name] for name in models}
+
+
+def results_table(results):
+    # One row per model in MODEL_SPECS order, for st.table / printing
+    rows = [
+        {"Model": name,
+         "RMSE": f"{r['rmse']:.2f} ± {r['rmse_std']:.2f}",
+         "R²": f"{r['r2']:.2f} ± {r['r2_std']:.2f}"}
+        for name, r in results.items()
+    ]
+    return pd.DataFrame(rows).set_index("Model")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", nargs="+", choices=list(MODEL_SPECS))
+    parser.add_argument("--folds", type=int, help=f"default: the last run's, else {DEFAULT_FOLDS}")
+    parser.add_argument("--seed", type=int, help=f"default: the last run's, else {DEFAULT_SEED}")
+    parser.add_argument("--workers", type=int, help="pool size (default: number of cores)")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--refresh", action="store_true", help="retrain models that are already cached")
+    args = parser.parse_args()
+
+    folds, seed = cv_settings(args.folds, args.seed, args.model_dir)
+    results = evaluate_models(models=args.models, folds=folds, seed=seed,
+                              workers=args.workers, model_dir=args.model_dir, refresh=args.refresh)
+    # the app and imputation.py look the models up with these settings
+    save_cv_settings(folds, seed, args.model_dir)
+    print(results_table(results).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Append crawl batches to the listings store.
+
+    python ingest.py new_listings.csv [more.csv ...]
+
+Each batch file must have the schema of imputed_output.csv. It is validated,
+typed like the main dataset, has its missing Consumption values imputed when
+an imputer was published (see imputation.py) and is written as its own
+partition of the store (CAR_APP_STORE, default ./listings_store). A running dashboard picks the
+batch up on its next rerun and updates its aggregates from the new rows only.
+"""
+import argparse
+import os
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from data_loader import (CATEGORICAL_COLUMNS, FLOAT_COLUMNS, IMPUTED_FLAG, STORE_DIR, batch_path,
+                         pa, pq, prepare_frame)
+from imputation import get_imputer
+
+REQUIRED_COLUMNS = CATEGORICAL_COLUMNS + FLOAT_COLUMNS + ["YearMonth", "CO2_Emission_Category"]
+
+
+def validate_batch(raw):
+    # Raise ValueError listing every problem that would stop the batch from
+    # being typed like the main dataset
+    problems = []
+    missing = [c for c in REQUIRED_COLUMNS if c not in raw.columns]
+    if missing:
+        problems.append(f"missing columns: {', '.join(missing)}")
+    for col in FLOAT_COLUMNS:
+        if col in raw.columns:
+            bad = pd.to_numeric(raw[col], errors="coerce").isna() & raw[col].notna()
+            if bad.any():
+                problems.append(f"{col}: {int(bad.sum())} non-numeric values")
+    if "YearMonth" in raw.columns:
+        bad = pd.to_datetime(raw["YearMonth"], errors="coerce").isna() & raw["YearMonth"].notna()
+        if bad.any():
+            problems.append(f"YearMonth: {int(bad.sum())} unparseable dates")
+    if "Marketplace" in raw.columns and raw["Marketplace"].isna().any():
+        problems.append(f"Marketplace: {int(raw['Marketplace'].isna().sum())} missing values")
+    if "CO2_Emission_Category" in raw.columns:
+        values = raw["CO2_Emission_Category"].dropna().astype(str).str.lower()
+        if not values.isin(["true", "false", "1", "0"]).all():
+            problems.append("CO2_Emission_Category: values other than True/False")
+    if problems:
+        raise ValueError("invalid batch: " + "; ".join(problems))
+
+
+def type_batch(raw):
+    raw = raw.copy()
+    for col in FLOAT_COLUMNS:
+        raw[col] = pd.to_numeric(raw[col], errors="coerce")
+    flags = raw["CO2_Emission_Category"].astype(str).str.lower().isin(["true", "1"])
+    raw["CO2_Emission_Category"] = flags.to_numpy(dtype=np.bool_)
+    return prepare_frame(raw)
+
+
+def new_batch_id():
+    # Sorts in ingest order
+    return time.strftime("%Y%m%dT%H%M%S") + f"-{time.time_ns() % 10**9:09d}-{uuid.uuid4().hex[:6]}"
+
+
+def ingest_batch(raw, store_dir=STORE_DIR, batch_id=None, impute=True):
+    # Validate, type, impute and append a batch of listings, returns its batch id
+    if pq is None:
+        raise ImportError("the listings store needs pyarrow")
+    validate_batch(raw)
+    df = type_batch(raw)
+    imputer = get_imputer() if impute else None
+    if imputer is not None:
+        imputer.impute(df)
+    else:
+        df[IMPUTED_FLAG] = np.zeros(len(df), dtype=np.bool_)
+    batch_id = batch_id or new_batch_id()
+    path = batch_path(batch_id, store_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write then rename, readers never see a partial file
+    tmp_path = path + ".tmp"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    os.replace(tmp_path, path)
+    return batch_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="+", help="semicolon separated batch CSV files")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--no-impute", action="store_true", help="keep missing Consumption values")
+    args = parser.parse_args()
+    for path in args.files:
+        batch_id = ingest_batch(pd.read_csv(path, sep=";"), store_dir=args.store,
+                                impute=not args.no_impute)
+        print(f"{path}: ingested as batch {batch_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Opt-in profiling of the app sections. Enabled with CAR_APP_PROFILE=1 or the
+# ?profile=1 query parameter; every section then reports wall time, rows
+# processed, memory allocated and the size of the echarts payloads it sent,
+# as one JSON log line on the "car_app.profile" logger and in the diagnostics
+# panel of the page.
+
+ENV_FLAG = "CAR_APP_PROFILE"
+# numeric fields of every record; the others are details such as the
+# selection of a widget, shown as text in the panel
+RECORD_FIELDS = ["section", "seconds", "rows", "alloc_mb", "payload_bytes"]
+
+log = logging.getLogger("car_app.profile")
+
+# tracemalloc is process-wide: it runs while any profiled section of any
+# session is active and is stopped after the last one. Its peak can only be
+# attributed to a section that ran alone, overlapping sections report no
+# alloc_mb.
+_tracing = {"active": 0, "started": 0}
+_tracing_lock = threading.Lock()
+
+
+def _start_tracing():
+    # Returns (sequence number of the section, whether it starts alone)
+    with _tracing_lock:
+        alone = _tracing["active"] == 0
+        if alone:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+        _tracing["active"] += 1
+        _tracing["started"] += 1
+        return _tracing["started"], alone
+
+
+def _stop_tracing(number, alone, start_memory):
+    # Memory allocated at the peak of a section in MB, None when other
+    # sections overlapped it
+    with _tracing_lock:
+        alone = alone and _tracing["active"] == 1 and _tracing["started"] == number
+        _, peak = tracemalloc.get_traced_memory()
+        _tracing["active"] -= 1
+        if not _tracing["active"]:
+            tracemalloc.stop()
+    return round((peak - start_memory) / 2 ** 20, 3) if alone else None
+
+
+def profiling_requested(query_params=None):
+    if os.environ.get(ENV_FLAG, "") not in ("", "0"):
+        return True
+    return query_params is not None and query_params.get("profile", "0") not in ("", "0")
+
+
+class SectionRecord:
+    def __init__(self, name, enabled):
+        self.enabled = enabled
+        self.fields = {"section": name, "rows": None, "payload_bytes": 0}
+
+    @property
+    def rows(self):
+        return self.fields["rows"]
+
+    @rows.setter
+    def rows(self, value):
+        self.fields["rows"] = value
+
+    def payload(self, option):
+        # Count the serialized size of an echarts option, returns it unchanged
+        if self.enabled:
+            self.fields["payload_bytes"] += len(json.dumps(option, default=str))
+        return option
+
+    def info(self, **fields):
+        # Extra fields for the log line, e.g. the selection of a widget
+        if self.enabled:
+            self.fields.update(fields)
+
+
+class Profiler:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.records = []
+        if enabled and not log.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            log.addHandler(handler)
+            log.setLevel(logging.INFO)
+
+    @contextmanager
+    def section(self, name):
+        record = SectionRecord(name, self.enabled)
+        if not self.enabled:
+            yield record
+            return
+        number, alone = _start_tracing()
+        start_memory, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            record.fields["seconds"] = round(seconds, 6)
+            record.fields["alloc_mb"] = _stop_tracing(number, alone, start_memory)
+            self.records.append(record.fields)
+            log.info(json.dumps(record.fields, default=str))
+
+    @contextmanager
+    def fragment_section(self, name):
+        # Section of an st.fragment. A fragment rerun does not run the rest of
+        # the page, so the section is profiled on a profiler of its own and
+        # rendered inside the fragment.
+        profiler = Profiler(self.enabled)
+        with profiler.section(name) as record:
+            yield record
+        profiler.render(f"Diagnostics: {name}")
+
+    def render(self, title="Diagnostics"):
+        # Collapsible diagnostics panel with one row per profiled section
+        if not self.enabled or not self.records:
+            return
+        import pandas as pd
+        import streamlit as st
+
+        table = pd.DataFrame(self.records)
+        details = [c for c in table.columns if c not in RECORD_FIELDS]
+        # details mix types (filter specs, year lists, ...), which Arrow cannot serialize
+        table[details] = table[details].map(
+            lambda v: "" if v is None else v if isinstance(v, str) else json.dumps(v, default=str))
+        with st.expander(title, expanded=False):
+            total = table["seconds"].sum()
+            st.markdown(f"{len(table)} sections, {total:.3f} s in total")
+            st.dataframe(table[RECORD_FIELDS + details], hide_index=True)
@@ -0,0 +1,267 @@
+"""Rerun latency of the dashboard under concurrent sessions.
+
+    python loadtest.py --sessions 32 --servers 2 --steps 20 --json load.json
+
+Starts --servers local `streamlit run streamlit_app.py` processes (or uses
+the running servers given with --url) and connects --sessions headless
+websocket clients, spread round-robin over the servers. Every session loads
+the page, then clicks through the model drilldown like a user: switch brand,
+pick a model, drag the year slider, with a random think time in between.
+Reports p50/p95/p99 rerun latency per action and the CPU time, CPU
+utilization and peak RSS of every server process (read from /proc, Linux).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+
+try:
+    from websockets.asyncio.client import connect
+except ImportError:  # installed with streamlit's server
+    connect = None
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+BASE_PORT = 8600
+PERCENTILES = [50, 95, 99]
+SAMPLE_INTERVAL = 0.25  # seconds between server resource samples
+WIDGET_TYPES = ("selectbox", "slider")
+# (action, widget key or label) of the scripted session steps
+ACTIONS = [("brand", "col1_brand"), ("model", "col1_model"), ("year", "Select Year")]
+
+
+class Session:
+    # One browser tab: tracks the widgets the server sent and the values this
+    # session set, and times every rerun until its script_finished message
+
+    def __init__(self, ws, timeout):
+        self.ws = ws
+        self.timeout = timeout
+        self.widgets = {}  # widget id -> (type, label, options, fragment id)
+        self.states = {}  # widget id -> WidgetState proto
+        self.errors = 0
+
+    def find(self, name):
+        # Widget id by user key (the id suffix) or, for unkeyed widgets, label
+        for widget_id, (_, label, _, _) in self.widgets.items():
+            if widget_id.endswith("-" + name) or label == name:
+                return widget_id
+        raise KeyError(name)
+
+    async def rerun(self, fragment_id=""):
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.fragment_id = fragment_id
+        msg.rerun_script.widget_states.widgets.extend(self.states.values())
+        start = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        seen = {}
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await asyncio.wait_for(self.ws.recv(), self.timeout))
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "exception":
+                    self.errors += 1
+                elif element_type in WIDGET_TYPES:
+                    widget = getattr(element, element_type)
+                    seen[widget.id] = (element_type, widget.label, list(widget.options), forward.delta.fragment_id)
+            elif kind == "script_finished":
+                if forward.script_finished == forward.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                break
+        seconds = time.perf_counter() - start
+        if fragment_id:
+            # a fragment run only resends the fragment's widgets
+            self.widgets = {k: v for k, v in self.widgets.items() if v[3] != fragment_id}
+            self.widgets.update(seen)
+        else:
+            self.widgets = seen
+        # values of widgets that are gone (e.g. the model box of another
+        # brand) are no longer sent, like the browser does
+        self.states = {k: v for k, v in self.states.items() if k in self.widgets}
+        return seconds
+
+    async def set_value(self, name, value):
+        widget_id = self.find(name)
+        widget_type, _, _, fragment_id = self.widgets[widget_id]
+        state = WidgetState(id=widget_id)
+        if widget_type == "selectbox":
+            state.string_value = value
+        else:  # select_slider
+            state.string_array_value.data.append(value)
+        self.states[widget_id] = state
+        return await self.rerun(fragment_id)
+
+
+async def run_session(url, index, args, results):
+    rng = random.Random(args.seed * 100_003 + index)
+    await asyncio.sleep(args.ramp * index / max(args.sessions, 1))
+    async with connect(url, max_size=None) as ws:
+        session = Session(ws, args.timeout)
+        results.append({"session": index, "url": url, "action": "load", "seconds": await session.rerun()})
+        for _ in range(args.steps):
+            await asyncio.sleep(rng.uniform(0, args.think))
+            action, name = rng.choice(ACTIONS)
+            options = session.widgets[session.find(name)][2]
+            seconds = await session.set_value(name, rng.choice(options))
+            results.append({"session": index, "url": url, "action": action, "seconds": seconds})
+        if session.errors:
+            results.append({"session": index, "url": url, "action": "errors", "count": session.errors})
+
+
+def _cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")  # utime + stime
+
+
+def _rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+async def sample_servers(servers, samples, stop):
+    # Peak RSS of every server process until stop is set
+    while not stop.is_set():
+        for server in servers:
+            try:
+                samples[server["pid"]] = max(samples.get(server["pid"], 0), _rss_mb(server["pid"]))
+            except OSError:
+                pass
+        try:
+            await asyncio.wait_for(stop.wait(), SAMPLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_servers(count, port, backend):
+    env = dict(os.environ)
+    if backend:
+        env["CAR_APP_BACKEND"] = backend
+    servers = []
+    for i in range(count):
+        process = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", APP, "--server.headless", "true",
+             "--server.port", str(port + i), "--browser.gatherUsageStats", "false"],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        servers.append({"pid": process.pid, "process": process, "url": f"ws://localhost:{port + i}/_stcore/stream"})
+    for i, server in enumerate(servers):
+        health = f"http://localhost:{port + i}/_stcore/health"
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                with urllib.request.urlopen(health, timeout=1) as response:
+                    if response.status == 200:
+                        break
+            except OSError:
+                if time.monotonic() > deadline or server["process"].poll() is not None:
+                    for started in servers:
+                        started["process"].terminate()
+                    raise RuntimeError(f"streamlit server on port {port + i} did not start")
+                time.sleep(0.2)
+    return servers
+
+
+def summarize(results):
+    # Rerun latency percentiles per action and over all interactions
+    rows = []
+    actions = [a for a in ["load"] + [a for a, _ in ACTIONS] if any(r["action"] == a for r in results)]
+    for action in actions + ["all interactions"]:
+        if action == "all interactions":
+            seconds = [r["seconds"] for r in results if r["action"] not in ("load", "errors")]
+        else:
+            seconds = [r["seconds"] for r in results if r["action"] == action]
+        if not seconds:
+            continue
+        row = {"action": action, "reruns": len(seconds), "mean": float(np.mean(seconds))}
+        for p, value in zip(PERCENTILES, np.percentile(seconds, PERCENTILES)):
+            row[f"p{p}"] = float(value)
+        rows.append(row)
+    return rows
+
+
+async def main_async(args):
+    if connect is None:
+        raise ImportError("the load test needs the websockets package")
+    servers = [{"pid": None, "url": url} for url in args.url]
+    if not servers:
+        servers = start_servers(args.servers, args.port, args.backend)
+    results, samples = [], {}
+    stop = asyncio.Event()
+    local = [s for s in servers if s["pid"] is not None]
+    sampler = asyncio.create_task(sample_servers(local, samples, stop))
+    cpu_before = {s["pid"]: _cpu_seconds(s["pid"]) for s in local}
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_session(servers[i % len(servers)]["url"], i, args, results)
+                               for i in range(args.sessions)))
+    finally:
+        wall = time.perf_counter() - start
+        stop.set()
+        await sampler
+        cpu = {s["pid"]: _cpu_seconds(s["pid"]) - cpu_before[s["pid"]] for s in local}
+        for server in local:
+            server["process"].terminate()
+            server["process"].wait()
+    workers = [{
+        "url": s["url"],
+        "sessions": len(range(i, args.sessions, len(servers))),
+        "cpu_seconds": cpu[s["pid"]],
+        "cpu_percent": cpu[s["pid"]] / wall * 100,
+        "peak_rss_mb": samples.get(s["pid"], float("nan")),
+    } for i, s in enumerate(servers) if s["pid"] is not None]
+    errors = sum(r["count"] for r in results if r["action"] == "errors")
+    return {"sessions": args.sessions, "servers": len(servers), "wall_seconds": wall, "errors": errors,
+            "latency": summarize(results), "workers": workers,
+            "reruns": [r for r in results if r["action"] != "errors"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions")
+    parser.add_argument("--servers", type=int, default=1, help="local server processes to start")
+    parser.add_argument("--url", action="append", default=[],
+                        help="websocket URL of a running server (ws://host:port/_stcore/stream), repeatable")
+    parser.add_argument("--steps", type=int, default=10, help="interactions per session after the page load")
+    parser.add_argument("--think", type=float, default=1.0, help="max think time between interactions (s)")
+    parser.add_argument("--ramp", type=float, default=0.0, help="spread the session starts over this many seconds")
+    parser.add_argument("--timeout", type=float, default=120.0, help="max seconds to wait for one rerun")
+    parser.add_argument("--backend", help="CAR_APP_BACKEND of the started servers")
+    parser.add_argument("--port", type=int, default=BASE_PORT, help="port of the first started server")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the summary and every rerun to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    print(f"{report['sessions']} sessions on {report['servers']} server(s), "
+          f"{report['wall_seconds']:.1f} s, {report['errors']} app exceptions")
+    print(f"{'action':<18} {'reruns':>7} {'mean':>8} " + " ".join(f"{'p' + str(p):>8}" for p in PERCENTILES))
+    for row in report["latency"]:
+        print(f"{row['action']:<18} {row['reruns']:>7} {row['mean']:>7.3f}s "
+              + " ".join(f"{row['p' + str(p)]:>7.3f}s" for p in PERCENTILES))
+    for worker in report["workers"]:
+        print(f"{worker['url']}: {worker['sessions']} sessions, {worker['cpu_seconds']:.1f} s CPU "
+              f"({worker['cpu_percent']:.0f}%), peak RSS {worker['peak_rss_mb']:.0f} MB")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
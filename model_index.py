@@ -0,0 +1,152 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+
+# Columns of the listings kept in the index, the columns of its slices
+SLICE_COLUMNS = ["Marketplace", "Year", "cleaned_Price"]
+
+# Bit layout of the sort keys: model codes above the 16 year bits, brand codes
+# above bit 42; MISSING_YEAR sorts rows without a Year after the known years
+YEAR_MASK = (1 << 16) - 1
+MODEL_MASK = (1 << 26) - 1
+MISSING_YEAR = YEAR_MASK
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def _run_starts(*keys):
+    # Positions where any of the (already sorted) key arrays changes value
+    change = np.zeros(len(keys[0]), dtype=bool)
+    if len(change):
+        change[0] = True
+    for key in keys:
+        change[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(change)
+
+
+def _codes(values, codes):
+    # Codes of values in `codes` (label -> code, numbered by first appearance),
+    # adding the labels not seen before; -1 for missing values
+    new_codes, labels = pd.factorize(values.astype(object))
+    mapping = np.array([codes.setdefault(label, len(codes)) for label in labels] + [-1], dtype=np.int64)
+    return mapping[new_codes]
+
+
+class ModelIndex:
+    # Brand -> Model -> Year index over the listings. The index keeps the
+    # SLICE_COLUMNS of the listings physically sorted by those keys (`positions`
+    # holds the original row numbers), so the option lists of the cascading
+    # selectboxes are dict lookups and every selection is a contiguous,
+    # zero-copy slice of `frame`.
+    #
+    # Brands and models keep the order in which they first appear in the data
+    # (same as df[...].unique()); years are ascending. Rows without a Year are
+    # sorted to the end of their model and left out of the slices.
+    #
+    # With `base`, an index of the first base.n rows of df (the dataset before
+    # ingested batches were appended), only the rows after them are sorted and
+    # merged into the keys of base; the result equals ModelIndex(df).
+
+    def __init__(self, df, base=None):
+        start = 0 if base is None else base.n
+        self.n = len(df)
+        self._brand_codes = {} if base is None else dict(base._brand_codes)
+        self._model_codes = {} if base is None else dict(base._model_codes)
+        delta = df.iloc[start:]
+        b = _codes(delta["Brand"], self._brand_codes)
+        m = _codes(delta["Model"], self._model_codes)
+        years = delta["Year"].to_numpy(dtype=np.float64, na_value=np.nan)
+        year_key = np.where(np.isnan(years), MISSING_YEAR, years).astype(np.int64)
+
+        # one sortable int64 per row: brand, model and year codes side by side
+        # (factorize numbers labels by first appearance, so sorting on the
+        # codes keeps brands in their original order)
+        rows = np.flatnonzero((b >= 0) & (m >= 0))
+        keys = (b[rows] << 42) | (m[rows] << 16) | year_key[rows]
+        order = np.argsort(keys, kind="stable")
+        keys, rows = keys[order], (rows[order] + start).astype(np.int32)
+        if base is None:
+            self._keys, self.positions = keys, rows
+        else:
+            # equal keys keep their row order: the old rows come first
+            at = np.searchsorted(base._keys, keys, side="right")
+            self._keys = np.insert(base._keys, at, keys)
+            self.positions = np.insert(base.positions, at, rows)
+        self.frame = df[SLICE_COLUMNS].iloc[self.positions].reset_index(drop=True)
+
+        brand_labels = list(self._brand_codes)
+        model_labels = list(self._model_codes)
+        self._brands = []
+        self._models = {}
+        self._ranges = {}
+        self._years = {}
+        first_row = {}
+        starts = _run_starts(self._keys)
+        stops = np.append(starts[1:], len(self._keys))
+        firsts = np.minimum.reduceat(self.positions, starts) if len(starts) else starts
+        run_keys = self._keys[starts]
+        runs = zip(
+            (run_keys >> 42).tolist(),
+            ((run_keys >> 16) & MODEL_MASK).tolist(),
+            (run_keys & YEAR_MASK).tolist(),
+            starts.tolist(),
+            stops.tolist(),
+            firsts.tolist(),
+        )
+        for brand_code, model_code, year, run_start, run_stop, first in runs:
+            brand = brand_labels[brand_code]
+            model = model_labels[model_code]
+            if brand not in self._models:
+                self._brands.append(brand)
+                self._models[brand] = []
+            if (brand, model) not in self._ranges:
+                self._models[brand].append(model)
+                self._ranges[(brand, model)] = [run_start, run_start]
+                self._years[(brand, model)] = {}
+                first_row[(brand, model)] = first
+            first_row[(brand, model)] = min(first_row[(brand, model)], first)
+            if year == MISSING_YEAR:
+                continue
+            self._ranges[(brand, model)][1] = run_stop
+            self._years[(brand, model)][year] = (run_start, run_stop)
+
+        # models of a brand in the order they first appear for that brand
+        for brand, models in self._models.items():
+            models.sort(key=lambda model: first_row[(brand, model)])
+
+    def brands(self):
+        return list(self._brands)
+
+    def models(self, brand):
+        return list(self._models.get(brand, []))
+
+    def years(self, brand, model):
+        return list(self._years.get((brand, model), {}))
+
+    def slice(self, brand, model, year=None):
+        # Listings of brand/model (optionally of one year) with a known Year
+        if year is None:
+            start, stop = self._ranges.get((brand, model), (0, 0))
+        else:
+            start, stop = self._years.get((brand, model), {}).get(year, (0, 0))
+        return self.frame.iloc[start:stop]
+
+
+def get_model_index(df, version):
+    # Build the index once per dataset version and share it across reruns. When
+    # the dataset only grew by ingested batches, just the new rows are added.
+    with _lock:
+        if version not in _cache:
+            previous = next(iter(_cache.items()), None)
+            delta = None if previous is None else data_loader.delta_since(previous[0], version)
+            if delta is not None and len(delta) < len(df) and previous[1].n == len(df) - len(delta):
+                index = ModelIndex(df, base=previous[1])
+            else:
+                index = ModelIndex(df)
+            _cache.clear()
+            _cache[version] = index
+        return _cache[version]
@@ -0,0 +1,180 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+
+# Cells the sketches are kept for. Any filter selection over these keys is
+# answered by merging cell sketches, without touching the listings.
+CELL_DIMENSIONS = ["Marketplace", "Brand", "Model", "Year"]
+
+# Sketches stay exact (all values retained) up to this many values, so small
+# groups and the current crawl size give the same boxes as the exact engine.
+EXACT_LIMIT = 50_000
+
+_cache = {}
+_lock = threading.Lock()
+
+
+class QuantileSketch:
+    # Mergeable KLL quantile sketch.
+    #
+    # Values live in levels; an item on level h stands for 2**h values. When a
+    # level outgrows its capacity it is sorted and every other item (random
+    # offset) is promoted to the next level. Ranks are then off by at most
+    # rank_error() * n with high probability. Until the sketch holds more than
+    # exact_limit values nothing is compacted and all answers are exact.
+
+    def __init__(self, k=200, exact_limit=EXACT_LIMIT, seed=0):
+        self.k = k
+        self.exact_limit = exact_limit
+        self.n = 0
+        self.min = np.nan
+        self.max = np.nan
+        self.levels = [np.empty(0)]
+        self.seed = seed
+        self._rng = None
+
+    @classmethod
+    def from_values(cls, values, **kwargs):
+        sketch = cls(**kwargs)
+        sketch.update(values)
+        return sketch
+
+    @classmethod
+    def merge_all(cls, sketches, **kwargs):
+        # Merge any number of sketches in one compaction pass
+        merged = cls(**kwargs)
+        sketches = [s for s in sketches if s.n]
+        if not sketches:
+            return merged
+        depth = max(len(s.levels) for s in sketches)
+        merged.levels = [
+            np.concatenate([s.levels[h] for s in sketches if h < len(s.levels)])
+            for h in range(depth)
+        ]
+        merged.n = sum(s.n for s in sketches)
+        merged.min = min(s.min for s in sketches)
+        merged.max = max(s.max for s in sketches)
+        merged._compress()
+        return merged
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.n += len(values)
+        self.min = min(self.min, values.min()) if self.n > len(values) else values.min()
+        self.max = max(self.max, values.max()) if self.n > len(values) else values.max()
+        self.levels[0] = np.concatenate([self.levels[0], values]) if len(self.levels[0]) else values
+        self._compress()
+
+    def merge(self, other):
+        merged = QuantileSketch.merge_all([self, other], k=self.k, exact_limit=self.exact_limit)
+        self.levels, self.n, self.min, self.max = merged.levels, merged.n, merged.min, merged.max
+
+    @property
+    def is_exact(self):
+        return len(self.levels) == 1
+
+    def rank_error(self):
+        # Normalized rank error bound (about 99% confidence) of quantile answers
+        if self.is_exact:
+            return 0.0
+        return 2.296 / self.k ** 0.9723
+
+    def _capacity(self, h):
+        depth = len(self.levels)
+        return max(int(np.ceil(self.k * (2 / 3) ** (depth - 1 - h))), 2)
+
+    def _compress(self):
+        if self.is_exact and self.n <= self.exact_limit:
+            return
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) > self._capacity(h):
+                level = np.sort(level)
+                # an odd item out stays behind so weights add up
+                keep = level[len(level) - len(level) % 2:]
+                level = level[:len(level) - len(level) % 2]
+                if self._rng is None:
+                    self._rng = np.random.default_rng(self.seed)
+                promoted = level[self._rng.integers(2)::2]
+                self.levels[h] = keep
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+                # adding a level shrinks the capacities below it, start over
+                h = 0
+                continue
+            h += 1
+
+    def items(self):
+        # Retained values (sorted) and the number of values each stands for
+        weights = np.concatenate([np.full(len(level), 2 ** h) for h, level in enumerate(self.levels)])
+        values = np.concatenate(self.levels)
+        order = np.argsort(values, kind="stable")
+        return values[order], weights[order]
+
+    def quantiles(self, qs):
+        qs = np.asarray(qs, dtype=np.float64)
+        if not self.n:
+            return np.full(qs.shape, np.nan)
+        if self.is_exact:
+            # same linear interpolation as np.percentile
+            return np.quantile(self.levels[0], qs)
+        values, weights = self.items()
+        cum = np.cumsum(weights)
+        idx = np.searchsorted(cum, qs * cum[-1], side="left")
+        return values[np.clip(idx, 0, len(values) - 1)]
+
+
+def build_sketches(df, value_col, dims=CELL_DIMENSIONS, **kwargs):
+    # One sketch of value_col per observed cell of dims, keyed by the tuple of
+    # cell keys (None for a missing key). Rows without a value are skipped.
+    work = df.loc[df[value_col].notna(), dims + [value_col]]
+    values = work[value_col].to_numpy(np.float64)
+    sketches = {}
+    for key, rows in work.groupby(dims, observed=True, sort=False, dropna=False).indices.items():
+        key = tuple(None if pd.isna(k) else k for k in key)
+        sketches[key] = QuantileSketch.from_values(values[rows], **kwargs)
+    return sketches
+
+
+def merge_sketch_maps(sketches, delta):
+    # Cell sketches of the dataset with the rows summarized by delta appended
+    merged = dict(sketches)
+    for key, sketch in delta.items():
+        merged[key] = QuantileSketch.merge_all([merged[key], sketch]) if key in merged else sketch
+    return merged
+
+
+def merge_cells(sketches, dims=CELL_DIMENSIONS, **selection):
+    # Merge all cell sketches matching selection, e.g. Brand="BMW", Model="320".
+    # A list value selects any of its entries, e.g. Year=[2019, 2020].
+    positions = [(dims.index(d), v if isinstance(v, (list, tuple, set)) else [v])
+                 for d, v in selection.items()]
+    matching = [s for key, s in sketches.items() if all(key[i] in v for i, v in positions)]
+    return QuantileSketch.merge_all(matching)
+
+
+def get_sketches(df, version, value_col):
+    # Build the cell sketches of value_col once per dataset version. When the
+    # dataset only grew by ingested batches, just the new rows are sketched.
+    with _lock:
+        if _cache.get("version") != version:
+            delta = None
+            if "version" in _cache:
+                delta = data_loader.delta_since(_cache["version"], version)
+            previous = {col: sketches for col, sketches in _cache.items() if col != "version"}
+            _cache.clear()
+            _cache["version"] = version
+            if delta is not None and len(delta) < len(df):
+                for col, sketches in previous.items():
+                    _cache[col] = merge_sketch_maps(sketches, build_sketches(delta, col))
+        if value_col not in _cache:
+            _cache[value_col] = build_sketches(df, value_col)
+        return _cache[value_col]
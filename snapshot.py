@@ -0,0 +1,138 @@
+"""Pre-render the static charts of the dashboard to a snapshot file.
+
+    python snapshot.py
+
+The payloads of the charts that do not depend on any widget (brand shares,
+approval years, log-price and Consumption boxplots, fuel type shares and the
+depreciation gaps) are written to SNAPSHOT_PATH together with the sidebar
+filter options and the listing count. The dashboard renders them from there
+for the unfiltered view without importing pandas or touching the data, as
+long as the snapshot's fingerprint of the data files still matches. The
+background warm-up (warmup.py) rewrites a stale snapshot.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+# This module only uses the standard library so the app can read a snapshot
+# before the data stack is imported. The paths follow data_loader.py and
+# backends.py.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CSV_PATH = os.path.join(BASE_DIR, "imputed_output.csv")
+STORE_DIR = os.environ.get("CAR_APP_STORE", os.path.join(BASE_DIR, "listings_store"))
+SNAPSHOT_PATH = os.environ.get("CAR_APP_SNAPSHOT", os.path.join(BASE_DIR, "chart_snapshot.json"))
+# bump when the layout of the snapshot or of a snapshotted chart changes
+SNAPSHOT_FORMAT = "1"
+# settings that change the snapshotted payloads
+SETTINGS = ["CAR_APP_BACKEND", "CAR_APP_PARQUET", "CAR_APP_MAX_OUTLIERS"]
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def data_files():
+    # Files read by the configured backend (see backends.get_backend): the
+    # CSV or its parquet cache plus the batches of the listings store, or the
+    # CAR_APP_PARQUET file, directory or glob of the duckdb backend
+    backend = os.environ.get("CAR_APP_BACKEND", "pandas")
+    source = os.environ.get("CAR_APP_PARQUET", "")
+    store = os.path.join(STORE_DIR, "**", "*.parquet")
+    if backend == "duckdb" and source:
+        patterns = [os.path.join(source, "**", "*.parquet") if os.path.isdir(source) else source]
+    elif backend == "duckdb":
+        patterns = [os.path.splitext(CSV_PATH)[0] + ".parquet", store]
+    else:
+        patterns = [CSV_PATH, store]
+    return [path for pattern in patterns for path in sorted(glob.glob(pattern, recursive=True))]
+
+
+def fingerprint():
+    # Changes whenever a file of data_files() is added, removed or rewritten,
+    # or a setting in SETTINGS changes
+    sha = hashlib.sha1(SNAPSHOT_FORMAT.encode())
+    for path in data_files():
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        sha.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+    for name in SETTINGS:
+        sha.update(f"{name}={os.environ.get(name, '')};".encode())
+    return sha.hexdigest()
+
+
+def build_snapshot(backend):
+    # Static chart payloads, filter options and listing count of the
+    # unfiltered backend
+    import charts
+
+    categories, ranges = backend.filter_options()
+    return {
+        "rows": backend.row_count(),
+        "filter_options": [categories, {col: list(bounds) for col, bounds in ranges.items()}],
+        "charts": {
+            "brand_share": charts.brand_share(backend, top_n=10),
+            "approval_year_counts": charts.approval_year_counts(backend),
+            "log_price_boxplot": charts.boxplot_payload(
+                backend, "log_cleaned_price", "Boxplot of Log Price by Marketplace", "log(price)"),
+            "consumption_boxplot": charts.boxplot_payload(
+                backend, "Consumption", "Boxplot of Consumption by Marketplace", "l/km", zoom=True),
+            "fuel_type_share": charts.fuel_type_share(backend),
+            "depreciation_gaps": charts.depreciation_gaps(backend),
+        },
+    }
+
+
+def write_snapshot(backend, path=SNAPSHOT_PATH):
+    # Build and atomically replace the snapshot; the fingerprint is taken
+    # first so data changing during the build leaves the snapshot stale
+    current = fingerprint()
+    content = dict(build_snapshot(backend), fingerprint=current)
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as f:
+        json.dump(content, f, default=str)
+    os.chmod(f.name, 0o644)
+    os.replace(f.name, path)
+    return content
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    # The snapshot when it matches the current data files, else None. The
+    # parsed file is kept until it is rewritten.
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        content = _cache.get(key)
+    if content is None:
+        try:
+            with open(path) as f:
+                content = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with _lock:
+            _cache.clear()
+            _cache[key] = content
+    if content.get("fingerprint") != fingerprint():
+        return None
+    return content
+
+
+def main():
+    from backends import get_backend
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+    content = write_snapshot(get_backend(), args.output)
+    print(f"wrote {len(content['charts'])} charts of {content['rows']:,} listings to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,144 @@
 import streamlit as st
 from streamlit_echarts import st_echarts
-import os 
-import pandas as pd
-import numpy as np
-from pyecharts.charts import Boxplot
-from pyecharts import options as opts
-from pyecharts.charts import Line
+import datetime
+import logging
+import math
+from instrumentation import Profiler, profiling_requested
+import snapshot
+import warmup
 
 st.set_page_config(layout="wide")
 
-# Load the dataset
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-file_path = os.path.join(BASE_DIR, 'imputed_output.csv')
-df = pd.read_csv(file_path, sep= ";")
+log = logging.getLogger("car_app")
+
+# Opt-in section timings (CAR_APP_PROFILE=1 or ?profile=1), see instrumentation.py
+profiler = Profiler(profiling_requested(st.query_params))
+
+# The static charts of the unfiltered view are rendered from the snapshot
+# (see snapshot.py) while it matches the data, so the page starts without
+# importing pandas or loading the listings. The first session of a server
+# process starts the background warm-up of the interactive caches.
+warmup.start()
+static = snapshot.load_snapshot()
+
+
+def query_backend():
+    # Query backend (in-memory pandas or out-of-core DuckDB, see backends.py)
+    from backends import get_backend
+    return get_backend()
+
+
+with profiler.section("load") as section:
+    backend = version = None
+    if static is None:
+        backend = query_backend()
+        version = backend.version()
+        section.rows = backend.row_count()
+        section.info(backend=backend.name)
+    else:
+        section.rows = static["rows"]
+        section.info(backend="snapshot")
+
+
+FILTER_LABELS = {
+    "Fuel_Type": "Fuel type",
+    "Gear_Type": "Gear type",
+    "CO2_Emission_Category": "CO₂ emission category",
+    "Marketplace": "Marketplace",
+    "cleaned_Price": "Price (€)",
+    "Kilometer": "Kilometer",
+    "Power_PS": "Power (PS)",
+    "car_age": "Car age (years)",
+}
+
+# Columns of the depreciation table of the model drilldown
+DEPRECIATION_COLUMNS = {
+    "listings": "Listings",
+    "yearly_depreciation": "Loss per year (%)",
+    "depreciation_per_10000_km": "Loss per 10,000 km (%)",
+    "r2": "R²",
+    "adjusted_price": "Price at model average (€)",
+    "adjusted_gap": "Adjusted gap (%)",
+    "raw_gap": "Raw gap (%)",
+}
+
+
+# Columns and groupings of the distribution explorer (see histograms.py)
+DISTRIBUTION_COLUMNS = {
+    "CO2_g_km": "CO₂ (g/km)",
+    "Power_PS": "Power (PS)",
+    "Kilometer": "Kilometer",
+    "Price_per_km": "Price per km (€)",
+    "Annual_Fuel_Cost": "Annual fuel cost (€)",
+    "car_age": "Car age (years)",
+}
+DISTRIBUTION_GROUPS = {"Marketplace": "Marketplace", "Fuel_Type": "Fuel type", "Brand": "Brand"}
+
+
+@st.cache_data
+def filter_options(version):
+    return backend.filter_options()
+
+
+def filter_sidebar(categories, ranges):
+    # Global filters applied to every chart; returns the filter spec of the
+    # widgets that differ from "everything" (see filter_index.py)
+    spec = {}
+    st.sidebar.header("Filters")
+    for col, options in categories.items():
+        selected = st.sidebar.multiselect(FILTER_LABELS[col], options, default=options, key=f"filter_{col}")
+        if set(selected) != set(options):
+            spec[col] = selected
+    for col, (low, high) in ranges.items():
+        if col == "car_age":
+            low, high, step = float(math.floor(low)), float(math.ceil(high)), 0.5
+        else:
+            low, high, step = int(math.floor(low)), int(math.ceil(high)), None
+        value = st.sidebar.slider(FILTER_LABELS[col], low, high, (low, high), step=step, key=f"filter_{col}")
+        if tuple(value) != (low, high):
+            spec[col] = tuple(value)
+    if st.sidebar.checkbox("Collapse cross-marketplace duplicates", key="filter_duplicates",
+                           help="Count a car listed on several marketplaces once (see duplicates.py)"):
+        from filter_index import COLLAPSE_DUPLICATES
+        spec[COLLAPSE_DUPLICATES] = True
+    return spec
+
+
+# Sidebar filters narrow the backend to the matching listings for all sections
+with profiler.section("filters") as section:
+    filters = filter_sidebar(*(filter_options(version) if static is None else static["filter_options"]))
+    snapshot_charts = None if static is None else static["charts"]
+    if filters:
+        if backend is None:
+            backend = query_backend()
+        filtered = backend.filtered(filters)
+        if filtered.row_count():
+            backend = filtered
+            snapshot_charts = None
+        else:
+            st.sidebar.warning("No listings match these filters, showing all listings.")
+        version = backend.version()
+    listings = static["rows"] if snapshot_charts is not None else backend.row_count()
+    st.sidebar.caption(f"{listings:,} listings")
+    section.rows = listings
+    section.info(filters=filters)
+
+
+def static_chart(key, name, *args, **kwargs):
+    # Payload of the static chart charts.<name>(backend, ...): the snapshot's
+    # entry key for the unfiltered view, else built from the backend
+    if snapshot_charts is not None:
+        return snapshot_charts[key]
+    import charts
+    return getattr(charts, name)(backend, *args, **kwargs)
+
+
+@st.cache_data
+def drilldown_options(version, kind, *keys):
+    # Option lists of the drilldown: brands(), models(brand), years(brand, model)
+    # and marketplaces(brand, model, year)
+    return getattr(backend, kind)(*keys)
+
 
 st.title("Comparing German Car Marketplaces")
 st.subheader("Over 10'000 cars were scrapped using Selenium and BeautifulSoup. For all the following interpretation of data we assume that crawling the marketplaces was succesful with no systematic errors. Furhter, we assume that the crawled output is representativ of the individual marketplaces.")
@@ -29,213 +155,23 @@ st.markdown("First let's get an overview of the percentage of scrapped car brand
 col1, col2, col3 = st.columns(3)
 
 
-#prepare data 
-
-# Group by "source" and "Brand" and count occurrences
-grouped = df.groupby(["Marketplace", "Brand"]).size().reset_index(name="count")
-
-# Calculate the total count per brand across all sources
-brand_totals = grouped.groupby("Brand")["count"].transform("sum")
-
-# Get the top 15 brands based on total count across all sources
-top_10_brands = grouped.groupby("Brand")["count"].sum().nlargest(10).index.tolist()
-
-# Filter for the top 15 brands only
-grouped_top_10 = grouped[grouped["Brand"].isin(top_10_brands)]
-
-# Calculate the total count per source
-source_totals = grouped_top_10.groupby("Marketplace")["count"].transform("sum")
-
-# Calculate percentage of each brand within each source
-grouped_top_10["percentage"] = (grouped_top_10["count"] / source_totals) * 100
-
-# Round the percentages to 2 decimal places
-grouped_top_10["percentage"] = grouped_top_10["percentage"].round(2)
-
-# Pivot the data so that each brand is a row, and each source is a column
-pivot = grouped_top_10.pivot(index="Brand", columns="Marketplace", values="percentage").fillna(0)
-
-# Sort the pivot table by the "auto.de" source in descending order
-pivot = pivot.sort_values(by="Auto.de", ascending=True)
-
-# Prepare the data for the first plot (only y-axis categories)
-with col1:
-    option1 = {
-          "title": {"text": "Auto.de",
-                    "x": "center"},
-        "tooltip": {"trigger": "axis"},
-        "xAxis": {
-            "type": "value",
-            "max": 40,
-            "name": "Brand (%)",
-            "nameLocation": "middle",  # Align axis title to the center of the axis
-            "nameGap": 30,
-        },
-        "yAxis": {
-            "type": "category",
-            "data": pivot.index.tolist(),
-            "show": True , # Hide y-axis labels
-            "axisLabel": {
-                "interval": 0,  # Show every label
-                "formatter": "{value}",  # Display the full label without truncation
-                "align": "right",  # Align labels properly
-                "padding": [0, 0, 0, 10]  # Add some padding if needed
-            }
-        },
-        "series": [{
-            "type": "bar",
-            "data": pivot['Auto.de'].tolist(),  # Replace 'source1' with your actual source column
-            "itemStyle": {"color": "#8da0cb"}
-        }],
-        "grid": {
-            "left": "25%",  # Decrease the plot size by reducing the space to the left
-        }
-    }
-    st_echarts(option1)
-
-# Prepare the data for the second plot (actual bar chart for source1)
-with col2:
-    option2 = {
-        "title": {"text": "Autoscout24.de",
-                  "x": "center"},
-        "tooltip": {"trigger": "axis"},
-        "xAxis": {
-            "type": "value",
-            "max": 20,
-            "name": "Brand (%)",
-            "nameLocation": "middle",  # Align axis title to the center of the axis
-            "nameGap": 30,
-        },
-        "yAxis": {
-            "type": "category",
-            "data": pivot.index.tolist(),
-            "show": True,  # Hide y-axis labels,
-            "axisLabel": {
-            "show": False,  # Hide the labels
-        }
-        },
-        "series": [{
-            "type": "bar",
-            "data": pivot['Autoscout24.de'].tolist(),  # Replace 'source1' with your actual source column
-            "itemStyle": {"color": "#fc8d62"}
-        }]
-    }
-    st_echarts(option2)
-
-# Prepare the data for the third plot (actual bar chart for source2)
-with col3:
-    option3 = {
-        "title": {"text": "Mobile.de",
-                  "x": "center"},
-        "tooltip": {"trigger": "axis"},
-        "xAxis": {
-            "type": "value",
-            "max": 60,
-            "name": "Brand (%)",
-            "nameLocation": "middle",  # Align axis title to the center of the axis
-            "nameGap": 30,
-        },
-        "yAxis": {
-            "type": "category",
-            "data": pivot.index.tolist(),
-            "show": True,  # Hide y-axis labels
-            "axisLabel": {
-            "show": False,  # Hide the labels
-        },
-            "axisTick": {
-            "show": True,  # Show the ticks on the y-axis
-        }
-        },
-        "series": [{
-            "type": "bar",
-            "data": pivot['Mobile.de'].tolist(),  # Replace 'source2' with your actual source column
-            "itemStyle": {"color": "#66c2a5"}
-        }]
-    }
-    st_echarts(option3)
+# Brand percentages per marketplace for the top 10 brands, sorted by Auto.de
+with profiler.section("brand share") as section:
+    section.rows = listings
+    for col, option in zip([col1, col2, col3], static_chart("brand_share", "brand_share", top_n=10)):
+        with col:
+            st_echarts(section.payload(option))
 
 st.markdown('''
             We can see that the distribution of percentage of car brands scraped differs from site to site. Volkswagen was scrapped the most in all three marketplaces but Mobile.de shows extrem results with over 50 percent of the scrapped cars being Volkswagen." 
     The second most scrapped brand was Mercedes-Benz but this is not the case for Auto.de, where we see Ford as the second most scrapped Brand. Next we can compare the approval year of cars scrapped from the three different marketplaces to inspect whether there are differences. ''')
 
 ###--------line plots 
-lines_df = df
-lines_df["YearMonth"] = pd.to_datetime(lines_df["YearMonth"])
-lines_df["Year"] = lines_df["YearMonth"].dt.year  
-
-# Define custom order for the 'Marketplace' column
-marketplace_order = ['Auto.de', 'Autoscout24.de', 'Mobile.de']
-
-# Group by Year and Marketplace, then count the occurrences
-lines_df_grouped = lines_df.groupby(['Year', 'Marketplace']).size().reset_index(name='Count')
-
-# Set the 'Marketplace' column to be a categorical type with the defined order
-lines_df_grouped['Marketplace'] = pd.Categorical(lines_df_grouped['Marketplace'], categories=marketplace_order, ordered=True)
-
-# Sort by 'Marketplace' and 'Year'
-lines_df_grouped = lines_df_grouped.sort_values(by=['Year'])
-x_axis = np.arange(min(lines_df_grouped['Year']), max(lines_df_grouped['Year']), step = 1)
-
-# Pivot the grouped data: rows = Marketplace, columns = Year, values = Count
-pivot_df = lines_df_grouped.pivot_table(
-    index='Marketplace',
-    columns='Year',
-    values='Count',
-    fill_value=0  # Fill missing year-marketplace combos with 0
-)
-
-# Optional: sort columns (years) if needed
-pivot_df = pivot_df.sort_index(axis=1)
-
-# Make sure x_axis is a list of years
-x_axis = list(np.arange(min(lines_df_grouped['Year']), max(lines_df_grouped['Year']) + 1, step=1))
-
-# Reindex pivot_df to ensure it has all years in x_axis, in correct order
-pivot_df = pivot_df.reindex(columns=x_axis, fill_value=0)
-
-# Prepare the series data as lists (ECharts expects lists, not Series)
-auto_de = pivot_df.loc['Auto.de'].tolist()
-autoscout = pivot_df.loc['Autoscout24.de'].tolist()
-mobile = pivot_df.loc['Mobile.de'].tolist()
-
-# Prepare ECharts config
-options = {
-    "title": {"text": "Initial Approval Year by Marketplace"},
-    "tooltip": {"trigger": "axis"},
-    "legend": {"data": ["Auto.de", "Autoscout24.de", "Mobile.de"]},
-    "grid": {"left": "3%", "right": "4%", "bottom": "3%", "containLabel": True},
-    "xAxis": {
-        "type": "category",
-        "boundaryGap": False,
-        "data": x_axis
-    },
-    "yAxis": {"type": "value",
-              "name": "count"},
-    "series": [
-        {
-            "name": "Auto.de",
-            "type": "line",
-            "data": auto_de,
-            "itemStyle": {"color": "#8da0cb"}
-        },
-        {
-            "name": "Autoscout24.de",
-            "type": "line",
-            "data": autoscout,
-            "itemStyle": {"color": "#fc8d62"}
-        },
-        {
-            "name": "Mobile.de",
-            "type": "line",
-            "data": mobile,
-            "itemStyle": {"color": "#66c2a5"}
-        },
-    ],
-}
-
-
-# Display with Streamlit ECharts
-st_echarts(options=options, height="400px")
+# Listing counts per marketplace and initial approval year
+with profiler.section("approval years") as section:
+    section.rows = listings
+    st_echarts(options=section.payload(static_chart("approval_year_counts", "approval_year_counts")),
+               height="400px")
 
 st.markdown('''
 We can see that Auto.de offers newer cars whereas Mobile.de offers the most cars from 2016 (of course our scrapped data is not a random sample from the different marketplaces but certain systematic differences are clearly visible. The oldest inital approval year on the Auto.de marketplace is 2016.)
@@ -246,461 +182,306 @@ st.markdown("### Price Difference between Markplaces")
 st.markdown("For our first research question we want to visually explore the question whether there are differences in car listing prices between marketplaces. Approaching this question, we first plot boxplots of the log of prices for each marketplace.")
 
 
-# Ensure no NaNs and only valid sources
-df_filtered = df[df['log_cleaned_price'].notna() & df['Marketplace'].isin(['Auto.de', 'Autoscout24.de', 'Mobile.de'])]
-
-# ECharts boxplot needs 5-number summary for each group
-box_data = []
-outliers = []
-x_labels = []
-color = ["#8da0cb","#fc8d62","#66c2a5"]
-
-for i, source in enumerate(['Auto.de', 'Autoscout24.de', 'Mobile.de']):
-    values = df_filtered[df_filtered['Marketplace'] == source]['log_cleaned_price'].sort_values()
-    q1 = np.percentile(values, 25)
-    q3 = np.percentile(values, 75)
-    iqr = q3 - q1
-    lower = q1 - 1.5 * iqr
-    upper = q3 + 1.5 * iqr
-
-    # box: [min, Q1, median, Q3, max] (excluding outliers)
-    normal_values = values[(values >= lower) & (values <= upper)]
-    box = [normal_values.min(), q1, values.median(), q3, normal_values.max()]
-    box_data.append(box)
-
-    # collect outliers with index for scatter plot
-    for val in values[(values < lower) | (values > upper)]:
-        outliers.append([i, val])
-
-    x_labels.append(source)
-
-option = {
-    "title": {
-        "text": "Boxplot of Log Price by Marketplace",
-        "left": "center"
-    },
-    "tooltip": {
-        "trigger": "item",
-        "axisPointer": {"type": "shadow"}
-    },
-    "grid": {
-        "left": "10%",
-        "right": "10%",
-        "bottom": "15%"
-    },
-    "xAxis": {
-        "type": "category",
-        "data": x_labels,
-        "boundaryGap": True,
-        "nameGap": 30,
-        "splitArea": {"show": False},
-        "splitLine": {"show": False}
-    },
-    "yAxis": {
-        "type": "value",
-        "name": "log(price)",
-        "splitArea": {"show": True}
-    },
-    "series": [
-        {
-            "name": "boxplot",
-            "type": "boxplot",
-            "data": box_data
-        },
-        {
-            "name": "outlier",
-            "type": "scatter",
-            "data": outliers
-        }
-    ]
-}
-st_echarts(option, height="500px")
+# Boxes per marketplace plus the outliers outside the Tukey fences
+with profiler.section("log-price boxplot") as section:
+    section.rows = listings
+    option = static_chart("log_price_boxplot", "boxplot_payload",
+                          "log_cleaned_price", "Boxplot of Log Price by Marketplace", "log(price)")
+    st_echarts(section.payload(option), height="500px")
 
 st.markdown("We can see that all marketplace have similar distribution of prices. Still Auto.de does have a higher median. The reason could be that Auto.de sells newer cars compared to autoscout.de and mobile.de. If we look at the outliers Auto.de seems to offer some cheaper cars. At the least in our the scarped dataset")
 
+# The interactive sections below query the data; its stack is imported here
+# so that the static charts above are on the page first
+if backend is None:
+    backend = query_backend()
+    version = backend.version()
+from aggregates import MARKETPLACE_ORDER
+import charts
+from comparables import price_spread
+import crawl_store
+import data_loader
+import depreciation
+from derived_columns import REFERENCE_DATE
+import feature_importance
+import fuel_costs
+import histograms
+import imputation_models
+
 st.markdown("### Next we can compare specific car models across marketplaces.")
 st.markdown("The example of VW Polo niceley represents our assumption that Auto.de in generlly has newer car listings with influences the price. First by manipulating the *Year range* we can see that Mobile.de and Autoscout24.de have older VW Polo listed. The price ranges is also larger. Multiple similar examples can be found and can be inspected by changing the brand and model of a car.")
 
 
-# Select a brand
-col1, col2= st.columns(2)
-
-brands = df['Brand'].unique()
-brands = df['Brand'].unique().tolist()
-try:
-    selected_brand = col1.selectbox("Select a Brand", brands,  index=brands.index("Volkswagen"), key = "col1_brand")
-
-    # Filter models based on brand
-    models = df[df['Brand'] == selected_brand]['Model'].unique()
-
-    selected_model = col1.selectbox("Select a Model", models,  key = "col1_model")
-
-    # Filter data for plotting
-    filtered_data = df[(df['Brand'] == selected_brand) & (df['Model'] == selected_model) & (df['YearMonth'].notna())]
+# The model comparison is a fragment: changing brand, model or year only reruns
+# this section, not the whole page
+@st.fragment
+def model_comparison():
+    with profiler.fragment_section("model drilldown") as section:
+        model_comparison_section(section)
 
-    filtered_data_2 = filtered_data
-    filtered_data_2["YearMonth"] = pd.to_datetime(filtered_data_2["YearMonth"])
-    filtered_data_2["Year"] = filtered_data_2["YearMonth"].dt.year    
-
-    years = filtered_data_2['Year'].unique()
-    print(years)
-    years.sort()
-
-
-
-    col2.markdown("Compare car model prices of different first approval years. Since Auto.de lists newer cars we would expect higher a price range compared to Autoscout24.de and Mobile.de")
-
-    selected_year = col2.select_slider("Select Year", years)
-    filtered_data_2 = filtered_data_2[filtered_data_2["Year"] == selected_year]
-    print(filtered_data_2.shape)
-except Exception as e:
-        print(f"An error occurred in start: {e}")
-
-
-# Plotting
-
-try:
-    col1.subheader(f"Prices for {selected_brand} - {selected_model}")
-    col2.subheader(f"{selected_year}: {selected_brand} - {selected_model}")
-except Exception as e:
-        print(f"An error occurred in col.subheader: {e}")
 
+def model_comparison_section(section):
+    # Select a brand
+    col1, col2= st.columns(2)
 
+    brands = drilldown_options(version, "brands")
+    try:
+        selected_brand = col1.selectbox("Select a Brand", brands,  index=brands.index("Volkswagen") if "Volkswagen" in brands else 0, key = "col1_brand")
 
+        # Filter models based on brand
+        models = drilldown_options(version, "models", selected_brand)
 
-# Custom order for marketplaces
-custom_order = ["Auto.de", "Autoscout24.de", "Mobile.de"]
+        selected_model = col1.selectbox("Select a Model", models,  key = "col1_model")
 
-# Get unique marketplaces
-marketplaces = filtered_data['Marketplace'].unique()
+        years = drilldown_options(version, "years", selected_brand, selected_model)
 
+        col2.markdown("Compare car model prices of different first approval years. Since Auto.de lists newer cars we would expect higher a price range compared to Autoscout24.de and Mobile.de")
 
-# Remove the marketplaces in the custom order from the original list, if they exist
-remaining_marketplaces = [m for m in marketplaces if m not in custom_order]
+        selected_year = col2.select_slider("Select Year", years)
+        section.rows = backend.row_count(Brand=selected_brand, Model=selected_model)
+        section.info(brand=selected_brand, model=selected_model, years=years, year=selected_year)
+    except Exception:
+        log.exception("model drilldown selection failed")
 
-# Combine the custom order with the remaining marketplaces, ensuring no duplicates
-marketplaces = custom_order + remaining_marketplaces
 
-# Filter custom_order to only those marketplaces that exist in the data
-available_marketplaces = [m for m in custom_order if m in filtered_data['Marketplace'].unique()]
+    # Plotting
 
-box_data = []
-for market in available_marketplaces:
     try:
-        prices = filtered_data[
-            (filtered_data['Marketplace'] == market) & 
-            (filtered_data['cleaned_Price'].notna())
-        ]['cleaned_Price'].tolist()
-        
-        if prices:  # only compute stats if there's data
-            stats = [
-                np.min(prices),
-                np.percentile(prices, 25),
-                np.median(prices),
-                np.percentile(prices, 75),
-                np.max(prices)
-            ]
-        else:
-            stats = [None] * 5  # or skip entirely if you prefer
-
-        box_data.append(stats)
-
-    except Exception as e:
-        print(f"An error occurred in box_data: {e}")
-available_marketplaces_2 = [m for m in custom_order if m in filtered_data_2['Marketplace'].unique()]
-
-box_data_2 = []
-for market in available_marketplaces_2:
+        col1.subheader(f"Prices for {selected_brand} - {selected_model}")
+        col2.subheader(f"{selected_year}: {selected_brand} - {selected_model}")
+    except Exception:
+        log.exception("model drilldown subheaders failed")
+
+    with col1:
+        try:
+            option = charts.model_price(backend, selected_brand, selected_model)
+            st_echarts(options=section.payload(option), height="500px", key="col1")
+        except Exception:
+            log.exception("model price boxplot failed")
+
+    with col2:
+        try:
+            option = charts.model_price(backend, selected_brand, selected_model, selected_year)
+            st_echarts(options=section.payload(option), height="500px", key="col2")
+        except Exception:
+            st.markdown("No data")
+
+    # Depreciation of the selected model per marketplace (depreciation.py)
     try:
-        prices = filtered_data_2[
-            (filtered_data_2['Marketplace'] == market) & 
-            (filtered_data_2['cleaned_Price'].notna())
-        ]['cleaned_Price'].tolist()
-
-        if prices:
-            stats = [
-                np.min(prices),
-                np.percentile(prices, 25),
-                np.median(prices),
-                np.percentile(prices, 75),
-                np.max(prices)
-            ]
-        else:
-            stats = [None] * 5
-
-        box_data_2.append(stats)
-    except Exception as e:
-        print(f"An error occurred in box_data_2: {e}")
-
-# ECharts boxplot config
-try: 
-    options = {
-        "title": {"text": f"{selected_model} Price Distribution"},
-        "xAxis": {
-            "type": "category",
-            "data": available_marketplaces,
-            "boundaryGap": True
-        },
-        "yAxis": {
-            "type": "value",
-            "name": "Price"
-        },
-        "series": [
-            {
-                "name": "Price Distribution",
-                "type": "boxplot",
-                "data": box_data,
-                "itemStyle": {
-                    "color": "#91cc75"
-                }
-            }
-        ]
-    }
-except:
-    print("no data")
-
-with col1:
-    try: 
-        st_echarts(options=options, height="500px", key="col1") 
-    except:
-        print("no data")
-   
-# ECharts boxplot config
-try:
-    options_2 = {
-        "title": {"text": f"{selected_year} Price Distribution"},
-        "xAxis": {
-            "type": "category",
-            "data": available_marketplaces_2,
-            "boundaryGap": True
-        },
-        "yAxis": {
-            "type": "value",
-            "name": "Price"
-        },
-        "series": [
-            {
-                "name": "Price Distribution",
-                "type": "boxplot",
-                "data": box_data_2,
-                "itemStyle": {
-                    "color": "#91cc75"
-                }
-            }
-        ]
-    }
-except Exception as e:
-    print(f"An error occurred in options_2: {e}")
-
-with col2:
+        option = charts.depreciation_curves(backend, selected_brand, selected_model)
+        fits = backend.depreciation()
+        fits = fits[(fits["Brand"] == selected_brand) & (fits["Model"] == selected_model)]
+    except Exception:
+        log.exception("depreciation fit failed")
+        return
+    col1, col2 = st.columns(2)
+    if option is None:
+        col1.markdown(f"Too few listings to fit a depreciation curve (at least {depreciation.MIN_LISTINGS} per marketplace).")
+    else:
+        with col1:
+            st_echarts(options=section.payload(option), height="400px", key="depreciation_curves")
+    col2.dataframe(
+        fits.set_index("Marketplace")[list(DEPRECIATION_COLUMNS)].rename(columns=DEPRECIATION_COLUMNS).round(1),
+        column_config={"Listings": st.column_config.NumberColumn(format="%d")})
+
+model_comparison()
+
+st.markdown("The curves are log-linear fits of the price on car age and mileage per marketplace. Comparing all models at their average age and mileage shows how much of the Auto.de premium is explained by its newer cars:")
+
+with profiler.section("depreciation gaps") as section:
+    section.rows = listings
+    st_echarts(section.payload(static_chart("depreciation_gaps", "depreciation_gaps")), height="400px")
+
+
+st.markdown("### Where is a similar car the cheapest?")
+st.markdown("Describe a car to find the most similar listings of the same model on each marketplace (by age, mileage and power) and compare their prices.")
+
+
+@st.fragment
+def comparable_listings():
+    with profiler.fragment_section("comparable listings") as section:
+        comparable_listings_section(section)
+
+
+def comparable_listings_section(section):
+    col1, col2 = st.columns(2)
+    brands = drilldown_options(version, "brands")
+    brand = col1.selectbox("Brand", brands, index=brands.index("Volkswagen") if "Volkswagen" in brands else 0,
+                           key="comparable_brand")
+    models = drilldown_options(version, "models", brand) if brand else []
+    model = col1.selectbox("Model", models, key="comparable_model")
+    first_registration = col1.date_input("First registration", datetime.date(2018, 1, 1),
+                                         min_value=datetime.date(1990, 1, 1),
+                                         max_value=REFERENCE_DATE.date(), key="comparable_date")
+    kilometer = col2.number_input("Kilometer", 0, 1_000_000, 80_000, step=5_000, key="comparable_km")
+    power = col2.number_input("Power (PS)", 1, 2_000, 110, step=5, key="comparable_power")
+    k = col2.slider("Listings per marketplace", 1, 20, 5, key="comparable_k")
+    if not model:
+        return
     try:
-        st_echarts(options=options_2, height="500px", key="col2")
-    except: 
+        result = backend.comparables(brand, model, first_registration.replace(day=1), kilometer, power, k)
+    except Exception:
+        log.exception("comparable listings lookup failed")
         st.markdown("No data")
-
+        return
+    section.rows = len(result)
+    section.info(brand=brand, model=model, k=k)
+    if not len(result):
+        st.markdown("No listings of this model.")
+        return
+    col1, col2 = st.columns([1, 2])
+    col1.dataframe(price_spread(result).round(0))
+    col2.dataframe(result, hide_index=True)
+
+comparable_listings()
+
+
+st.markdown("### How do prices move between crawls?")
+st.markdown("Median price per marketplace over every crawl in the crawl store (see crawl_store.py), and the listings whose price changed between two crawls. The sidebar filters do not apply here.")
+
+
+@st.fragment
+def price_trends():
+    with profiler.fragment_section("price trends") as section:
+        price_trends_section(section)
+
+
+def price_trends_section(section):
+    crawls = crawl_store.list_crawls()
+    if not crawls:
+        st.info("No crawls stored yet. Add one with `python crawl_store.py add imputed_output.csv --date YYYY-MM-DD`.")
+        return
+    trend = crawl_store.price_trend()
+    brands = sorted(b for b in trend["Brand"].unique() if b != crawl_store.ALL_BRANDS)
+    col1, col2, col3, col4 = st.columns(4)
+    brand = col1.selectbox("Brand", [crawl_store.ALL_BRANDS] + brands, format_func=lambda b: b or "All brands",
+                           key="trend_brand")
+    marketplace = col2.selectbox("Marketplace", [""] + list(MARKETPLACE_ORDER), format_func=lambda m: m or "All",
+                                 key="trend_marketplace")
+    before = col3.selectbox("From crawl", crawls, index=max(len(crawls) - 2, 0), key="trend_before")
+    after = col4.selectbox("To crawl", crawls, index=len(crawls) - 1, key="trend_after")
+    section.info(crawls=len(crawls), brand=brand, before=before, after=after)
+    title = f"Median price of {brand or 'all brands'} per crawl"
+    st_echarts(section.payload(charts.price_trend(crawl_store.median_prices(trend, brand), title)),
+               height="400px", key="price_trend")
+    if before == after:
+        return
+    selection = {"Brand": brand or None, "Marketplace": marketplace or None}
+    changes = crawl_store.price_changes(before, after, **selection)
+    section.rows = len(changes)
+    dropped = changes[changes["change_percent"] < 0]
+    st.markdown(f"{len(dropped):,} listings got cheaper and {len(changes) - len(dropped):,} more expensive "
+                f"from {before} to {after}.")
+    st.dataframe(dropped.round({"change_percent": 1}), hide_index=True)
+
+price_trends()
 
 
 st.title("2. How do fuel efficiency and CO₂ emissions differ between marketplaces?")
 
 
-# Ensure no NaNs and only valid sources
-df_filtered = df[df['Consumption'].notna() & df['Marketplace'].isin(['Auto.de', 'Autoscout24.de', 'Mobile.de'])]
-
-# ECharts boxplot needs 5-number summary for each group
-box_data = []
-outliers = []
-x_labels = []
-color = ["#8da0cb","#fc8d62","#66c2a5"]
-
-for i, source in enumerate(['Auto.de', 'Autoscout24.de', 'Mobile.de']):
-    values = df_filtered[df_filtered['Marketplace'] == source]['Consumption'].sort_values()
-    q1 = np.percentile(values, 25)
-    q3 = np.percentile(values, 75)
-    iqr = q3 - q1
-    lower = q1 - 1.5 * iqr
-    upper = q3 + 1.5 * iqr
-
-    # box: [min, Q1, median, Q3, max] (excluding outliers)
-    normal_values = values[(values >= lower) & (values <= upper)]
-    box = [normal_values.min(), q1, values.median(), q3, normal_values.max()]
-    box_data.append(box)
-
-    # collect outliers with index for scatter plot
-    for val in values[(values < lower) | (values > upper)]:
-        outliers.append([i, val])
-
-    x_labels.append(source)
-
-option = {
-    "title": {
-        "text": "Boxplot of Consumption by Marketplace",
-        "left": "center"
-    },
-    "tooltip": {
-        "trigger": "item",
-        "axisPointer": {"type": "shadow"}
-    },
-    "grid": {
-        "left": "10%",
-        "right": "10%",
-        "bottom": "15%"
-    },
-    "xAxis": {
-        "type": "category",
-        "data": x_labels,
-        "boundaryGap": True,
-        "nameGap": 30,
-        "splitArea": {"show": False},
-        "splitLine": {"show": False}
-    },
-    "yAxis": {
-        "type": "value",
-        "name": "l/km",
-        "splitArea": {"show": True}
-    },
-    "dataZoom": [
-        {
-            "type": "inside",
-            "yAxisIndex": 0
-        },
-        {
-            "type": "slider",
-            "yAxisIndex": 0,
-            "orient": "vertical",
-            "left": "left",
-            "start": 20,
-            "height": "80%"
-        }
-    ],
-    "series": [
-        {
-            "name": "boxplot",
-            "type": "boxplot",
-            "data": box_data
-        },
-        {
-            "name": "outlier",
-            "type": "scatter",
-            "data": outliers
-        }
-    ]
-}
-st_echarts(option, height="500px")
+# Boxes per marketplace plus the outliers outside the Tukey fences
+with profiler.section("consumption boxplot") as section:
+    section.rows = listings
+    option = static_chart("consumption_boxplot", "boxplot_payload",
+                          "Consumption", "Boxplot of Consumption by Marketplace", "l/km", zoom=True)
+    st_echarts(section.payload(option), height="500px")
 st.markdown("This plot suggests that Auto.de has higher consumption values with more variance compared to Autoscout24.de and Mobile.de. Thought as we already established Auto.de offers newer cars which tend to be more fuel efficiency in general. These results are likely wrong. The variance in comsuption values in Mobile.de and Autoscout24.de is very low. An explanation could be that Auto.de was had very little NA values after scraping consumption and therefore the imputed consumption values have less of an impact on the variance and median. With Mobile.de we weren't able to scrape any consumption values since these were not accessible on the main car listing site. Further scraping mechanism to scrape the detailed view of each individual car was not permited and failed. All the consumption values of Mobile.de very imputed using the machine learning model. The low variance of consumption values is soley attributed to imputed values by our model.")
 
 #-------Fuel type
 # Create three columns
 col1, col2, col3 = st.columns(3)
 
-# Group by "Marketplace" and "Fuel_Type" and count occurrences
-grouped = df.groupby(["Marketplace", "Fuel_Type"]).size().reset_index(name="count")
-
-# Calculate the total count per marketplace (not per fuel type)
-marketplace_totals = grouped.groupby("Marketplace")["count"].transform("sum")
-
-# Calculate percentage of each fuel type within each marketplace
-grouped["percentage"] = (grouped["count"] / marketplace_totals) * 100
-
-# Round the percentages to 2 decimal places
-grouped["percentage"] = grouped["percentage"].round(2)
-
-# Pivot the data so that each fuel type is a row, and each marketplace is a column
-pivot = grouped.pivot(index="Fuel_Type", columns="Marketplace", values="percentage").fillna(0)
-
-# Sort the pivot table by the "Auto.de" column in descending order
-pivot = pivot.sort_values(by="Auto.de", ascending=True)
-
-# Prepare the data for the first plot (Auto.de)
-with col1:
-    option1 = {
-        "title": {"text": "Auto.de", "x": "center"},
-        "tooltip": {"trigger": "axis"},
-        "xAxis": {
-            "type": "value",
-            "max": 60,
-            "name": "Brand (%)",
-            "nameLocation": "middle",
-            "nameGap": 30,
-        },
-        "yAxis": {
-            "type": "category",
-            "data": pivot.index.tolist(),
-            "show": True,
-            "axisLabel": {
-                "interval": 0,
-                "formatter": "{value}",
-                "align": "right",
-                "padding": [0, 0, 0, 10]
-            }
-        },
-        "series": [{
-            "type": "bar",
-            "data": pivot['Auto.de'].tolist(),
-            "itemStyle": {"color": "#8da0cb"}
-        }],
-        "grid": {"left": "30%"},
-    }
-    st_echarts(option1)
-
-# Prepare the data for the second plot (Autoscout24.de)
-with col2:
-    option2 = {
-        "title": {"text": "Autoscout24.de", "x": "center"},
-        "tooltip": {"trigger": "axis"},
-        "xAxis": {
-            "type": "value",
-            "max": 60,
-            "name": "Brand (%)",
-            "nameLocation": "middle",
-            "nameGap": 30,
-        },
-        "yAxis": {
-            "type": "category",
-            "data": pivot.index.tolist(),
-            "show": True,
-            "axisLabel": {"show": False}
-        },
-        "series": [{
-            "type": "bar",
-            "data": pivot['Autoscout24.de'].tolist(),
-            "itemStyle": {"color": "#fc8d62"}
-        }]
-    }
-    st_echarts(option2)
-
-# Prepare the data for the third plot (Mobile.de)
-with col3:
-    option3 = {
-        "title": {"text": "Mobile.de", "x": "center"},
-        "tooltip": {"trigger": "axis"},
-        "xAxis": {
-            "type": "value",
-            "max": 80,
-            "name": "Brand (%)",
-            "nameLocation": "middle",
-            "nameGap": 30,
-        },
-        "yAxis": {
-            "type": "category",
-            "data": pivot.index.tolist(),
-            "show": True,
-            "axisLabel": {"show": False},
-            "axisTick": {"show": True}
-        },
-        "series": [{
-            "type": "bar",
-            "data": pivot['Mobile.de'].tolist(),
-            "itemStyle": {"color": "#66c2a5"}
-        }]
-    }
-    st_echarts(option3)
+# Percentage of each fuel type within each marketplace, sorted by Auto.de
+with profiler.section("fuel types") as section:
+    section.rows = listings
+    for col, option in zip([col1, col2, col3], static_chart("fuel_type_share", "fuel_type_share")):
+        with col:
+            st_echarts(section.payload(option))
 
 st.markdown("We can see that most cars use Benzin and Diesel. Nearly 80 percent of cars scrapped from Mobile.de use Benzin.")
+
+st.markdown("### What-if: running costs")
+st.markdown("Fuel cost, CO₂ and total cost of ownership (listing price plus fuel) of every listing for your own fuel prices and annual mileage. Listings with other or unknown fuel types have no fuel cost.")
+
+
+@st.fragment
+def running_costs():
+    with profiler.fragment_section("running costs") as section:
+        running_costs_section(section)
+
+
+def running_costs_section(section):
+    inputs = st.columns(len(fuel_costs.DEFAULT_PRICES) + 2)
+    prices = tuple(
+        (fuel, col.number_input(f"{fuel} (€/l)", 0.0, 10.0, float(price), step=0.01, key=f"price_{fuel}"))
+        for col, (fuel, price) in zip(inputs, fuel_costs.DEFAULT_PRICES.items())
+    )
+    annual_km = inputs[-2].slider("Kilometres per year", 0, 60_000, fuel_costs.DEFAULT_ANNUAL_KM, step=500,
+                                  key="annual_km")
+    years = inputs[-1].slider("Years of ownership", 1, 15, fuel_costs.DEFAULT_YEARS, key="ownership_years")
+    section.rows = backend.row_count()
+    section.info(prices=dict(prices), annual_km=annual_km, years=years)
+    marketplace_option, brand_option = charts.running_costs(backend, prices, annual_km, years)
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        st_echarts(section.payload(marketplace_option), height="400px", key="running_costs_marketplace")
+    with col2:
+        st_echarts(section.payload(brand_option), height="400px", key="running_costs_brands")
+
+running_costs()
+
+st.markdown("### Explore the distributions")
+st.markdown("Histogram and density of a numeric column per marketplace, fuel type or brand (the ten largest). The middle 99% of the values are binned; the server only sends the bin counts.")
+
+
+@st.fragment
+def distribution_explorer():
+    with profiler.fragment_section("distribution explorer") as section:
+        distribution_explorer_section(section)
+
+
+def distribution_explorer_section(section):
+    col1, col2, col3, col4 = st.columns(4)
+    value_col = col1.selectbox("Column", list(DISTRIBUTION_COLUMNS), format_func=DISTRIBUTION_COLUMNS.get,
+                               key="distribution_column")
+    group_col = col2.selectbox("Group by", histograms.GROUP_COLUMNS, format_func=DISTRIBUTION_GROUPS.get,
+                               key="distribution_group")
+    bins = col3.slider("Bins", 10, 100, histograms.DEFAULT_BINS, step=5, key="distribution_bins")
+    share = col4.radio("Scale", ["% of listings", "Listings"], key="distribution_scale") == "% of listings"
+    section.rows = backend.row_count()
+    section.info(column=value_col, group=group_col, bins=bins)
+    option = charts.distribution(backend, value_col, group_col, bins, share, DISTRIBUTION_COLUMNS[value_col])
+    st_echarts(section.payload(option), height="450px", key="distribution")
+
+distribution_explorer()
 #----------Research Question 3
 
 st.title("3. How accurately can missing consumption values be predicted by ML models, and which vehicle characteristics have the greatest influence?")
 st.markdown("")
-st.markdown('''
+
+# Cross-validated scores of the imputation models, see imputation_models.py.
+# Falls back to the table from the original analysis until they are trained.
+with profiler.section("imputation models") as section:
+    model_results = {}
+    if imputation_models.sklearn_available():
+        model_version = data_loader.dataset_version()
+        model_results = imputation_models.cached_results(model_version)
+        if imputation_models.retrain_allowed() and st.button("Retrain imputation models"):
+            with st.spinner("Cross-validating the imputation models..."):
+                try:
+                    model_results = imputation_models.evaluate_models(
+                        data_loader.load_dataset(), model_version, refresh=True)
+                except Exception:
+                    log.exception("Retraining the imputation models failed")
+                    st.error("Retraining the imputation models failed, see the server log.")
+    section.info(models=len(model_results))
+if model_results:
+    st.markdown(f"{imputation_models.TARGET} on listings with scraped values, "
+                f"mean ± std over {next(iter(model_results.values()))['folds']} folds")
+    st.table(imputation_models.results_table(model_results))
+else:
+    st.markdown('''
 
 |Model |RMSE (Before) |R² (Before) |RMSE (After) |R² (After) |
 |:----|:----|:----|:----|:----|
@@ -715,6 +496,29 @@ st.markdown('''
 
             ''')
 
-st.image("importance.png", width=600)
-
-
+# Impurity and permutation importance of the cached Random Forest, see
+# feature_importance.py; the original plot until that model is trained
+with profiler.section("feature importance") as section:
+    importance = None
+    if model_results:
+        try:
+            importance = feature_importance.cached_importance(model_version)
+            if importance is None:
+                with st.spinner("Computing feature importance..."):
+                    importance = feature_importance.compute_importance(data_loader.load_dataset(), model_version)
+        except Exception:
+            log.exception("feature importance failed")
+    if importance is not None:
+        col1, col2 = st.columns(2)
+        if importance["impurity"]:
+            with col1:
+                st_echarts(section.payload(charts.feature_importance(
+                    importance["impurity"], f"Top 10 Feature Importances ({importance['model']})")),
+                    height="450px")
+        with col2:
+            st_echarts(section.payload(charts.feature_importance(
+                importance["permutation"], "Permutation Importance (drop in R²)")), height="450px")
+    else:
+        st.image("importance.png", width=600)
+
+profiler.render()
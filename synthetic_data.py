@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from data_loader import load_dataset
+from derived_columns import REFERENCE_DATE, add_derived_columns
+
+# Column order of imputed_output.csv (after the unnamed index column)
+CSV_COLUMNS = [
+    "Unnamed: 0", "Brand", "Model", "YearMonth", "cleaned_Price", "Kilometer",
+    "Gear_Type", "Fuel_Type", "Consumption", "CO2_g_km", "Power_PS",
+    "Price_per_km", "Fuel_Cost_per_100km", "Annual_Fuel_Cost", "CO2_per_year",
+    "CO2_Emission_Category", "Marketplace", "log_cleaned_price",
+    "log_price_per_km", "log_CO2_Emission", "log_CO2_per_year", "car_age",
+]
+
+# grams of CO2 per litre burnt, roughly
+CO2_PER_LITRE = {"Benzin": 23.1, "Diesel": 26.5, "Autogas (LPG)": 22.9, "Erdgas (CNG)": 23.4}
+
+
+def generate_listings(n, seed=0, template=None):
+    # n synthetic listings with the schema of imputed_output.csv.
+    #
+    # Categorical fields (Marketplace, Brand, Model, Fuel_Type, Gear_Type) are
+    # drawn jointly from the empirical distribution of the template (default:
+    # the real dataset), so brand/model/marketplace skew is preserved. Numeric
+    # fields follow simple models of age, mileage and power fitted by eye, and
+    # the derived columns are recomputed from them.
+    rng = np.random.default_rng(seed)
+    if template is None:
+        template = load_dataset()
+    keys = ["Marketplace", "Brand", "Model", "Fuel_Type", "Gear_Type"]
+    combos = template.groupby(keys, observed=True, dropna=False).size()
+    picks = rng.choice(len(combos), size=n, p=(combos / combos.sum()).to_numpy())
+    df = combos.index.to_frame(index=False).astype(object).iloc[picks].reset_index(drop=True)
+
+    # newer cars on Auto.de, as in the crawl
+    mean_age = df["Marketplace"].map({"Auto.de": 3.5, "Autoscout24.de": 7.0}).fillna(8.0).to_numpy()
+    age = np.clip(rng.gamma(4.0, mean_age / 4.0), 0.1, 20.0)
+    months = np.round(age * 12).astype(np.int64)
+    year_month = REFERENCE_DATE.to_period("M") - months
+    df["YearMonth"] = pd.PeriodIndex(year_month, freq="M").to_timestamp().strftime("%Y-%m-%d")
+
+    power = np.clip(rng.lognormal(np.log(150), 0.4, n), 40, 900).round()
+    km = np.clip(rng.normal(12_000, 5_000, n) * age, 0, 400_000).round()
+    log_price = 10.4 - 0.09 * age - 0.0000025 * km + 0.004 * (power - 150) + rng.normal(0, 0.3, n)
+    price = np.exp(log_price).round()
+    diesel = (df["Fuel_Type"] == "Diesel").to_numpy()
+    consumption = np.clip(4.0 + 0.02 * power - 1.0 * diesel + rng.normal(0, 1.0, n), 2.0, 25.0).round(1)
+    co2 = consumption * df["Fuel_Type"].map(CO2_PER_LITRE).astype(np.float64).to_numpy()
+
+    df["cleaned_Price"] = price
+    df["Kilometer"] = km
+    df["Consumption"] = consumption
+    df["CO2_g_km"] = co2.round()
+    df["Power_PS"] = power
+    df["CO2_Emission_Category"] = rng.random(n) < 0.96
+    df["Unnamed: 0"] = np.arange(n)
+    add_derived_columns(df)
+    return df[CSV_COLUMNS]
+
+
+def write_listings_csv(df, path):
+    # Same layout as imputed_output.csv: semicolon separated, unnamed index
+    df.to_csv(path, sep=";")
@@ -0,0 +1,46 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# the app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backends  # noqa: E402
+import data_loader  # noqa: E402
+from derived_columns import add_derived_columns  # noqa: E402
+from synthetic_data import generate_listings, write_listings_csv  # noqa: E402
+
+OTHER_MARKETPLACE = {"Auto.de": "Mobile.de", "Autoscout24.de": "Auto.de", "Mobile.de": "Autoscout24.de"}
+
+
+@pytest.fixture(scope="session")
+def listings_csv(tmp_path_factory):
+    # Synthetic listings in the imputed_output.csv layout; every 20th car is
+    # also listed on another marketplace with a bit more mileage and price
+    df = generate_listings(4000, seed=7)
+    copies = df.iloc[::20].copy()
+    copies["Marketplace"] = copies["Marketplace"].map(OTHER_MARKETPLACE)
+    copies["Kilometer"] = copies["Kilometer"] + 300
+    copies["cleaned_Price"] = (copies["cleaned_Price"] * 1.02).round()
+    add_derived_columns(copies)
+    df = pd.concat([df, copies], ignore_index=True)
+    df["Unnamed: 0"] = np.arange(len(df))
+    path = tmp_path_factory.mktemp("listings") / "listings.csv"
+    write_listings_csv(df, path)
+    return str(path)
+
+
+@pytest.fixture
+def backend_pair(listings_csv, tmp_path, monkeypatch):
+    # (pandas, duckdb) backends over the listings of listings_csv; the pandas
+    # backend reads them instead of imputed_output.csv, the duckdb backend
+    # scans their parquet cache
+    pytest.importorskip("duckdb")
+    store_dir = str(tmp_path / "store")
+    monkeypatch.setattr(backends, "load_dataset", lambda: data_loader.load_dataset(listings_csv, store_dir))
+    monkeypatch.setattr(backends, "dataset_version", lambda: data_loader.dataset_version(listings_csv, store_dir))
+    backends.load_dataset()  # writes the parquet cache
+    return backends.PandasBackend(), backends.DuckDBBackend([data_loader.cache_path(listings_csv)])
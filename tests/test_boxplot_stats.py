@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+from boxplot_stats import group_values, grouped_boxplot, sketch_boxplot
+from quantile_sketch import EXACT_LIMIT, build_sketches, merge_cells
+
+MARKETPLACES = ["Auto.de", "Autoscout24.de", "Mobile.de"]
+
+
+def _listings(rows_per_marketplace, seed=0):
+    # heavy-tailed values so every marketplace has plenty of outliers
+    rng = np.random.default_rng(seed)
+    n = rows_per_marketplace * len(MARKETPLACES)
+    return pd.DataFrame({
+        "Marketplace": pd.Categorical(np.repeat(MARKETPLACES, rows_per_marketplace)),
+        "Brand": pd.Categorical(rng.choice(["BMW", "Ford"], n)),
+        "Model": pd.Categorical(np.full(n, "X")),
+        "Year": pd.array(rng.integers(2010, 2020, n), dtype="Int16"),
+        "value": rng.standard_t(3, n) + np.repeat([0.0, 0.5, 1.0], rows_per_marketplace),
+    })
+
+
+def _sketch_stats(df, **selection):
+    sketches = build_sketches(df, "value")
+    values, codes = group_values(df, "value", "Marketplace", MARKETPLACES, **selection)
+    return sketch_boxplot([merge_cells(sketches, Marketplace=m, **selection) for m in MARKETPLACES],
+                          MARKETPLACES, values=values, codes=codes)
+
+
+def test_sketch_boxplot_matches_exact_on_compacted_sketches():
+    df = _listings(2 * EXACT_LIMIT)
+    exact = grouped_boxplot(df, "value", "Marketplace", order=MARKETPLACES)
+    approx = _sketch_stats(df)
+    assert max(approx["rank_error"]) > 0  # the sketches were compacted
+    exact_counts = np.bincount([i for i, _ in exact["outliers"]], minlength=3)
+    approx_counts = np.bincount([i for i, _ in approx["outliers"]], minlength=3)
+    assert exact_counts.min() > 1000
+    np.testing.assert_allclose(approx_counts, exact_counts, rtol=0.1)
+    assert exact["outlier_counts"] == exact_counts.tolist()
+    assert approx["outlier_counts"] == approx_counts.tolist()
+    for exact_box, approx_box in zip(exact["box_data"], approx["box_data"]):
+        np.testing.assert_allclose(approx_box, exact_box, atol=0.05)
+    assert approx["counts"] == exact["counts"]
+
+
+def test_sketch_boxplot_tails_are_exact_for_its_fences():
+    df = _listings(2 * EXACT_LIMIT, seed=1)
+    approx = _sketch_stats(df, Brand="BMW", Year=[2012, 2013, 2014])
+    for i, marketplace in enumerate(MARKETPLACES):
+        rows = (df["Marketplace"] == marketplace) & (df["Brand"] == "BMW") & df["Year"].isin([2012, 2013, 2014])
+        values = np.sort(df.loc[rows, "value"].to_numpy())
+        lower, upper = approx["fences"][i]
+        inside = values[(values >= lower) & (values <= upper)]
+        assert approx["box_data"][i][0] == inside.min()
+        assert approx["box_data"][i][4] == inside.max()
+        outliers = [v for g, v in approx["outliers"] if g == i]
+        assert outliers == values[(values < lower) | (values > upper)].tolist()
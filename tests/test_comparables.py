@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from comparables import ComparableIndex, car_age, price_spread
+
+
+def _model_listings():
+    # One model on two marketplaces; mileage and power are equal, so only the
+    # age differs: q-1.2, q-0.2, q+1.8, q+2.8 and q around the query age q
+    q = car_age("2020-01-01")
+    return pd.DataFrame({
+        "Marketplace": ["Auto.de", "Auto.de", "Mobile.de", "Mobile.de", "Auto.de"],
+        "Brand": "BMW",
+        "Model": "X1",
+        "YearMonth": ["2019-01-01", "2020-01-01", "2021-01-01", "2022-01-01", "2020-01-01"],
+        "car_age": [q - 1.2, q - 0.2, q + 1.8, q + 2.8, q],
+        "Kilometer": [50_000.0] * 5,
+        "Power_PS": [150.0] * 5,
+        # the closest listing has no price and is never returned
+        "cleaned_Price": [20_000.0, 21_000.0, 18_000.0, 17_000.0, np.nan],
+    })
+
+
+def test_find_returns_the_nearest_listings_per_marketplace():
+    result = ComparableIndex(_model_listings()).find("BMW", "X1", "2020-01-01", 50_000, 150, k=2)
+    assert result["Marketplace"].tolist() == ["Auto.de", "Auto.de", "Mobile.de", "Mobile.de"]
+    assert result["cleaned_Price"].tolist() == [21_000.0, 20_000.0, 18_000.0, 17_000.0]
+    # the age is scaled by its std over all five listings: offsets from their
+    # mean 0.64 are -1.84, -0.84, 1.16, 2.16, -0.64, variance 10.512 / 5
+    np.testing.assert_allclose(result["distance"], np.array([0.2, 1.2, 1.8, 2.8]) / np.sqrt(2.1024))
+
+
+def test_find_without_listings_of_the_model():
+    result = ComparableIndex(_model_listings()).find("BMW", "X3", "2020-01-01", 50_000, 150)
+    assert result.empty
+    assert price_spread(result).empty
+
+
+def test_price_spread_orders_marketplaces_by_median():
+    result = ComparableIndex(_model_listings()).find("BMW", "X1", "2020-01-01", 50_000, 150, k=2)
+    spread = price_spread(result)
+    assert spread.index.tolist() == ["Mobile.de", "Auto.de"]
+    assert spread.loc["Auto.de"].tolist() == [2, 20_000.0, 20_500.0, 21_000.0]
+
+
+def test_backends_find_the_same_comparables(backend_pair):
+    pandas_backend, duckdb_backend = backend_pair
+    for brand in pandas_backend.brands()[:3]:
+        model = pandas_backend.models(brand)[0]
+        expected = pandas_backend.comparables(brand, model, "2018-06-01", 60_000, 140, k=3)
+        result = duckdb_backend.comparables(brand, model, "2018-06-01", 60_000, 140, k=3)
+        assert len(expected)
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
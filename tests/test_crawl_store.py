@@ -0,0 +1,34 @@
+import pyarrow as pa
+
+import crawl_store
+from synthetic_data import generate_listings
+
+
+def _kept_row_groups(crawl_dir, crawls=None, **selection):
+    # (row groups left after pruning on partitions and statistics, all row groups)
+    dataset = crawl_store._dataset(crawl_dir)
+    expression = crawl_store._expression(crawls, selection)
+    total = sum(fragment.num_row_groups for fragment in dataset.get_fragments())
+    kept = sum(len(fragment.split_by_row_group(filter=expression, schema=dataset.schema))
+               for fragment in dataset.get_fragments(filter=expression))
+    return kept, total
+
+
+def test_marketplace_filter_skips_row_groups(tmp_path, monkeypatch):
+    monkeypatch.setattr(crawl_store, "ROW_GROUP_SIZE", 1000)
+    raw = generate_listings(9000, seed=0)
+    for crawl_date in ["2024-05-01", "2024-06-01"]:
+        crawl_store.add_crawl(raw, crawl_date, str(tmp_path))
+    schema = crawl_store._dataset(str(tmp_path)).schema
+    assert schema.field("Marketplace").type == pa.string()
+    assert schema.field("Brand").type == pa.string()
+
+    rows = int((raw["Marketplace"] == "Mobile.de").sum())
+    frame = crawl_store.read_crawls(["cleaned_Price"], ["2024-06-01"], str(tmp_path), Marketplace="Mobile.de")
+    assert len(frame) == rows
+    kept, total = _kept_row_groups(str(tmp_path), ["2024-06-01"], Marketplace="Mobile.de")
+    assert total == 18
+    # one partition of 9 row groups, sorted by marketplace: only the groups
+    # holding Mobile.de rows are read
+    assert kept <= rows // 1000 + 2
+    assert kept < 9
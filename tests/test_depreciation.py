@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+import depreciation
+from depreciation import KM_UNIT, MIN_LISTINGS, SUMS, fit, marketplace_gaps, merge_moments, moments
+
+
+def _listings():
+    # Exact log prices 10 - 0.1 * age - 0.05 * km / 10,000 on Auto.de, 0.1
+    # higher on Mobile.de (same ages and mileages), and a group too small to fit
+    ages = np.arange(10, dtype=np.float64)
+    km = np.array([3, 1, 4, 1, 5, 9, 2, 6, 5, 3], dtype=np.float64) * KM_UNIT
+    parts = []
+    for marketplace, level in (("Auto.de", 10.0), ("Mobile.de", 10.1)):
+        parts.append(pd.DataFrame({"Marketplace": marketplace, "car_age": ages, "Kilometer": km,
+                                   "log_cleaned_price": level - 0.1 * ages - 0.05 * km / KM_UNIT}))
+    small = parts[0].iloc[:MIN_LISTINGS - 1].assign(Marketplace="Autoscout24.de")
+    df = pd.concat(parts + [small], ignore_index=True)
+    df["Brand"], df["Model"] = "BMW", "X1"
+    # rows without a price are left out
+    df.loc[len(df)] = {"Marketplace": "Auto.de", "Brand": "BMW", "Model": "X1", "car_age": 1.0,
+                       "Kilometer": KM_UNIT, "log_cleaned_price": np.nan}
+    return df
+
+
+def test_fit_recovers_exact_coefficients():
+    fits = fit(moments(_listings())).set_index("Marketplace")
+    assert fits["listings"].tolist() == [10, 7, 10]
+    for marketplace, level in (("Auto.de", 10.0), ("Mobile.de", 10.1)):
+        row = fits.loc[marketplace]
+        np.testing.assert_allclose([row["intercept"], row["age_coef"], row["km_coef"], row["r2"]],
+                                   [level, -0.1, -0.05, 1.0], atol=1e-9)
+        np.testing.assert_allclose(row["yearly_depreciation"], (1 - np.exp(-0.1)) * 100)
+        np.testing.assert_allclose(row["depreciation_per_10000_km"], (1 - np.exp(-0.05)) * 100)
+    assert fits.loc["Autoscout24.de", ["intercept", "age_coef", "km_coef"]].isna().all()
+
+
+def test_adjusted_gap_compares_the_same_car():
+    fits = fit(moments(_listings())).set_index("Marketplace")
+    # both fits are evaluated at the model's mean age and mileage, so their
+    # adjusted gaps differ by exactly the 0.1 offset of the log prices
+    gap = np.log1p(fits.loc["Mobile.de", "adjusted_gap"] / 100) - np.log1p(fits.loc["Auto.de", "adjusted_gap"] / 100)
+    np.testing.assert_allclose(gap, 0.1)
+    gaps = marketplace_gaps(fits.reset_index())
+    assert gaps["models"].tolist() == [1, 0, 1]
+    assert np.isnan(gaps.loc["Autoscout24.de", "adjusted_gap"])
+
+
+def test_merged_moments_equal_the_moments_of_all_rows():
+    df = _listings()
+    merged = merge_moments(moments(df.iloc[:12]), moments(df.iloc[12:]))
+    whole = moments(df)
+    pd.testing.assert_frame_equal(merged[list(SUMS)], whole[list(SUMS)], check_dtype=False)
+    pd.testing.assert_frame_equal(merged[["age_min", "age_max"]], whole[["age_min", "age_max"]])
+
+
+def test_backends_fit_the_same_curves(backend_pair, monkeypatch):
+    monkeypatch.setattr(depreciation, "_cache", {})
+    pandas_backend, duckdb_backend = backend_pair
+    expected = pandas_backend.depreciation()
+    result = duckdb_backend.depreciation()
+    assert expected["intercept"].notna().any()
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, rtol=1e-6)
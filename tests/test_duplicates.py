@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import MARKETPLACE_ORDER
+import backends
+from duplicates import UNKNOWN, duplicate_groups, duplicate_mask
+from filter_index import COLLAPSE_DUPLICATES
+
+
+def _listings():
+    rows = [
+        # marketplace, year month, fuel, gear, km, power, price
+        ("Auto.de", "2019-01-01", "Diesel", "Automatik", 50_000, 150, 20_000),
+        # within 500 km, 1 PS and 900 EUR (< 5 % of 20,000) of row 0; an
+        # unknown gear type agrees with any other
+        ("Mobile.de", "2019-01-01", "Diesel", UNKNOWN, 50_500, 151, 20_900),
+        # 1,200 km away from row 0 but within tolerance of row 1: same group
+        ("Autoscout24.de", "2019-01-01", "Diesel", "Automatik", 51_200, 150, 21_500),
+        # price 3,000 EUR above row 0
+        ("Mobile.de", "2019-01-01", "Diesel", "Automatik", 50_100, 150, 23_000),
+        # another fuel type
+        ("Autoscout24.de", "2019-01-01", "Benzin", "Automatik", 50_000, 150, 20_000),
+        # another first registration month
+        ("Mobile.de", "2019-02-01", "Diesel", "Automatik", 50_000, 150, 20_000),
+        # no price
+        ("Autoscout24.de", "2019-01-01", "Diesel", "Automatik", 50_000, 150, np.nan),
+    ]
+    df = pd.DataFrame(rows, columns=["Marketplace", "YearMonth", "Fuel_Type", "Gear_Type",
+                                     "Kilometer", "Power_PS", "cleaned_Price"])
+    df["Brand"], df["Model"] = "BMW", "X1"
+    return df
+
+
+def test_duplicate_groups_by_hand():
+    df = _listings()
+    assert duplicate_groups(df).tolist() == [0, 0, 0, 3, 4, 5, 6]
+    assert duplicate_mask(df).tolist() == [False, True, True, False, False, False, False]
+
+
+def test_listings_of_one_marketplace_are_never_duplicates():
+    df = _listings()
+    df["Marketplace"] = "Auto.de"
+    assert not duplicate_mask(df).any()
+
+
+def test_collapsed_views_agree_across_backends(backend_pair):
+    pandas_backend, duckdb_backend = backend_pair
+    df = backends.load_dataset()
+    mask = duplicate_mask(df)
+    duplicates = int(mask.sum())
+    # the cars the fixture repeats on another marketplace (the last 200 rows)
+    # are found, except those without brand or model, which are never matched
+    repeated = df.iloc[-200:]
+    assert mask[-200:].sum() == (repeated["Brand"].notna() & repeated["Model"].notna()).sum()
+    spec = {COLLAPSE_DUPLICATES: True}
+    for m in MARKETPLACE_ORDER:
+        assert (pandas_backend.filtered(spec).row_count(Marketplace=m)
+                == duckdb_backend.filtered(spec).row_count(Marketplace=m))
+    assert pandas_backend.filtered(spec).row_count() == len(df) - duplicates
+    assert duckdb_backend.filtered(spec).row_count() == len(df) - duplicates
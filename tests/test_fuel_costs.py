@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+import fuel_costs
+from fuel_costs import cost_sums, listing_costs, summarize
+
+PRICES = {"Diesel": 2.0, "Benzin": 1.5}
+
+
+def _listings():
+    return pd.DataFrame({
+        "Marketplace": ["Auto.de", "Auto.de", "Mobile.de"],
+        "Brand": ["BMW", "BMW", "Audi"],
+        # "Keine Information" has no fuel price
+        "Fuel_Type": ["Diesel", "Benzin", "Keine Information"],
+        "Consumption": [5.0, 6.0, 7.0],
+        "CO2_g_km": [120.0, 140.0, np.nan],
+        "cleaned_Price": [20_000.0, 18_000.0, 15_000.0],
+    })
+
+
+def test_listing_costs_by_hand():
+    costs = listing_costs(_listings(), PRICES, annual_km=10_000, years=2)
+    np.testing.assert_allclose(costs["fuel_cost_per_100km"], [10.0, 9.0, np.nan])
+    np.testing.assert_allclose(costs["annual_fuel_cost"], [1_000.0, 900.0, np.nan])
+    np.testing.assert_allclose(costs["co2_per_year"], [1_200.0, 1_400.0, np.nan])
+    np.testing.assert_allclose(costs["total_cost"], [22_000.0, 19_800.0, np.nan])
+
+
+def test_listing_costs_of_categorical_fuel_types():
+    df = _listings()
+    df["Fuel_Type"] = pd.Categorical(["Diesel", np.nan, "Diesel"], categories=["Benzin", "Diesel"])
+    costs = listing_costs(df, PRICES, annual_km=10_000, years=2)
+    np.testing.assert_allclose(costs["fuel_cost_per_100km"], [10.0, np.nan, 14.0])
+
+
+def test_cost_sums_and_summary_by_hand():
+    sums = cost_sums(_listings(), PRICES, annual_km=10_000, years=2)
+    assert sums[["Marketplace", "Brand"]].values.tolist() == [["Auto.de", "BMW"], ["Mobile.de", "Audi"]]
+    assert sums["listings"].tolist() == [2, 1]
+    assert sums["fuel_n"].tolist() == [2, 0]
+    assert sums["annual_fuel_cost_sum"].tolist() == [1_900.0, 0.0]
+    assert sums["total_cost_sum"].tolist() == [41_800.0, 0.0]
+    assert sums["co2_per_year_sum"].tolist() == [2_600.0, 0.0]
+
+    marketplace, by_brand = summarize(sums, top_n=1)
+    assert marketplace["listings"].tolist() == [2, 0, 1]
+    assert marketplace.loc["Auto.de"].tolist() == [2, 950.0, 20_900.0, 1_300.0]
+    assert marketplace.loc[["Mobile.de", "Autoscout24.de"], "total_cost"].isna().all()
+    assert by_brand.index.tolist() == ["BMW"]
+    assert by_brand.loc["BMW", "Auto.de"] == 20_900.0
+    assert by_brand.loc["BMW", ["Mobile.de", "Autoscout24.de"]].isna().all()
+
+
+def test_backends_compute_the_same_costs(backend_pair):
+    pandas_backend, duckdb_backend = backend_pair
+    args = (fuel_costs.DEFAULT_PRICES, fuel_costs.DEFAULT_ANNUAL_KM, fuel_costs.DEFAULT_YEARS)
+    expected_marketplace, expected_brands = pandas_backend.fuel_costs(*args)
+    marketplace, brands = duckdb_backend.fuel_costs(*args)
+    assert expected_marketplace["listings"].sum() > 0
+    pd.testing.assert_frame_equal(marketplace, expected_marketplace, check_dtype=False, rtol=1e-9)
+    pd.testing.assert_frame_equal(brands, expected_brands, check_dtype=False, check_names=False, rtol=1e-9)
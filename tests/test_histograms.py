@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from histograms import GROUP_COLUMNS, bin_index, binned_counts, binned_kde, check_columns, show_groups
+
+
+def test_bin_index_by_hand():
+    index = bin_index(np.array([0.0, 0.5, 1.0, -1.0, 2.0]), 0.0, 1.0, 2)
+    # the upper edge falls into the last bin
+    assert index.tolist() == [0, 1, 1, -1, 2]
+
+
+def test_binned_kde_of_a_single_bin():
+    centers = np.arange(5) + 0.5
+    # no spread: the bandwidth is half a bin, i.e. a kernel of exp(-2 offset²)
+    kernel = np.exp(-2.0 * np.arange(-4, 5) ** 2)
+    kernel /= kernel.sum()
+    np.testing.assert_allclose(binned_kde([0, 0, 5, 0, 0], centers), 5 * kernel[2:7])
+    assert binned_kde([0, 1, 0, 0, 0], centers).tolist() == [0.0] * 5
+
+
+def test_show_groups():
+    assert show_groups("Marketplace", {"Mobile.de": 2, "Auto.de": 1, "Autoscout24.de": 0}) == ["Auto.de", "Mobile.de"]
+    assert show_groups("Brand", {"b": 3, "a": 3, "c": 5}, top_n=2) == ["c", "a"]
+
+
+def test_binned_counts_by_hand():
+    # 0, ..., 199 km: the clip quantiles are 0.995 and 198.005, so 0 is
+    # underflow, 199 overflow and bins of 49.2525 km hold 1-50, 51-99,
+    # 100-148 and 149-198; missing and infinite values are left out
+    km = np.concatenate([np.arange(200, dtype=np.float64), [np.nan, np.inf]])
+    df = pd.DataFrame({"Kilometer": km, "Marketplace": "Auto.de"})
+    result = binned_counts(df, "Kilometer", "Marketplace", bins=4)
+    assert result["groups"] == ["Auto.de"]
+    np.testing.assert_allclose(result["edges"], [0.995, 50.2475, 99.5, 148.7525, 198.005])
+    assert result["counts"] == [[50, 49, 49, 50]]
+    assert result["underflow"] == [1]
+    assert result["overflow"] == [1]
+    assert result["listings"] == [200]
+
+
+def test_unknown_columns_are_rejected():
+    with pytest.raises(ValueError):
+        check_columns("cleaned_Price", "Marketplace")
+    with pytest.raises(ValueError):
+        check_columns("Kilometer", "Model")
+
+
+@pytest.mark.parametrize("value_col", ["Kilometer", "Price_per_km", "car_age"])
+def test_backends_bin_the_same_listings(backend_pair, value_col):
+    pandas_backend, duckdb_backend = backend_pair
+    for group_col in GROUP_COLUMNS:
+        expected = pandas_backend.histogram(value_col, group_col, bins=20)
+        result = duckdb_backend.histogram(value_col, group_col, bins=20)
+        assert sum(expected["listings"]) > 0
+        for key in ("groups", "counts", "underflow", "overflow", "listings"):
+            assert result[key] == expected[key]
+        np.testing.assert_allclose(result["edges"], expected["edges"])
+        np.testing.assert_allclose(result["density"], expected["density"])
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from data_loader import prepare_frame
+from imputation import ConsumptionImputer
+from imputation_models import IMPUTED_FLAG, TARGET, feature_frame, make_pipeline, training_frame
+from synthetic_data import generate_listings
+
+pytest.importorskip("sklearn")
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_impute_fills_missing_consumption(dtype):
+    df = prepare_frame(generate_listings(2000, seed=3))
+    train = training_frame(df)
+    pipeline = make_pipeline("Ridge Regression").fit(feature_frame(train), train[TARGET])
+    df[TARGET] = df[TARGET].astype(dtype)
+    missing = np.zeros(len(df), dtype=bool)
+    missing[::10] = True
+    df.loc[missing, TARGET] = np.nan
+    known = df[TARGET].to_numpy(np.float64, na_value=np.nan)[~missing]
+
+    filled = ConsumptionImputer(pipeline).impute(df)
+
+    assert filled == missing.sum()
+    assert df[TARGET].dtype == dtype
+    assert df[TARGET].notna().all()
+    np.testing.assert_array_equal(df[TARGET].to_numpy(np.float64)[~missing], known)
+    np.testing.assert_array_equal(df[IMPUTED_FLAG].to_numpy(), missing)
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from data_loader import prepare_frame
+from filter_index import CATEGORY_FILTERS, FilterIndex
+from model_index import ModelIndex
+from synthetic_data import generate_listings
+
+
+def _grown_listings():
+    # listings followed by an appended batch with a brand, a model and a fuel
+    # type the first rows do not have; the split is not on a byte boundary
+    df = prepare_frame(generate_listings(20_000, seed=1))
+    batch = df.iloc[:301].copy()
+    batch["Brand"] = batch["Brand"].cat.add_categories(["Newbrand"])
+    batch["Model"] = batch["Model"].cat.add_categories(["Newmodel"])
+    batch["Fuel_Type"] = batch["Fuel_Type"].cat.add_categories(["Hydrogen"])
+    batch.iloc[:50, batch.columns.get_loc("Brand")] = "Newbrand"
+    batch.iloc[:50, batch.columns.get_loc("Model")] = "Newmodel"
+    batch.iloc[::7, batch.columns.get_loc("Fuel_Type")] = "Hydrogen"
+    batch["cleaned_Price"] = batch["cleaned_Price"] + 1
+    grown = pd.concat([df.iloc[:19_997], batch], ignore_index=True)
+    return grown, 19_997
+
+
+def test_extended_filter_index_equals_rebuild():
+    df, n = _grown_listings()
+    extended = FilterIndex(df, base=FilterIndex(df.iloc[:n]))
+    rebuilt = FilterIndex(df)
+    assert "Hydrogen" in rebuilt.options("Fuel_Type")
+    for col in CATEGORY_FILTERS:
+        assert extended.options(col) == rebuilt.options(col)
+        for value, bits in rebuilt._bitmaps[col].items():
+            np.testing.assert_array_equal(extended._bitmaps[col][value], bits)
+    for col, arrays in rebuilt._sorted.items():
+        for extended_array, rebuilt_array in zip(extended._sorted[col], arrays):
+            np.testing.assert_array_equal(extended_array, rebuilt_array)
+    spec = {"Fuel_Type": ["Hydrogen", "Diesel"], "cleaned_Price": (5000, 20000),
+            "collapse_duplicates": True}
+    np.testing.assert_array_equal(extended.select(spec), rebuilt.select(spec))
+
+
+def test_extended_model_index_equals_rebuild():
+    df, n = _grown_listings()
+    extended = ModelIndex(df, base=ModelIndex(df.iloc[:n]))
+    rebuilt = ModelIndex(df)
+    assert "Newbrand" in rebuilt.brands()
+    np.testing.assert_array_equal(extended.positions, rebuilt.positions)
+    pd.testing.assert_frame_equal(extended.frame, rebuilt.frame)
+    assert extended.brands() == rebuilt.brands()
+    for brand in rebuilt.brands():
+        assert extended.models(brand) == rebuilt.models(brand)
+        for model in rebuilt.models(brand):
+            assert extended.years(brand, model) == rebuilt.years(brand, model)
+            assert extended._ranges[(brand, model)] == rebuilt._ranges[(brand, model)]
+            assert extended._years[(brand, model)] == rebuilt._years[(brand, model)]
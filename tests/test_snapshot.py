@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+import snapshot
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    # a CSV with its parquet cache, one store batch and a separate parquet
+    # source, and a snapshot taken for the pandas backend
+    for name in ["imputed_output.csv", "imputed_output.parquet", "store/batch.parquet", "other/part.parquet"]:
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        (tmp_path / name).write_text(name)
+    monkeypatch.setattr(snapshot, "CSV_PATH", str(tmp_path / "imputed_output.csv"))
+    monkeypatch.setattr(snapshot, "STORE_DIR", str(tmp_path / "store"))
+    for name in snapshot.SETTINGS:
+        monkeypatch.delenv(name, raising=False)
+    path = tmp_path / "snapshot.json"
+    path.write_text(json.dumps({"rows": 1, "fingerprint": snapshot.fingerprint()}))
+    return tmp_path, str(path)
+
+
+def test_snapshot_is_rejected_after_switching_backend(data, monkeypatch):
+    _, path = data
+    assert snapshot.load_snapshot(path) is not None
+    monkeypatch.setenv("CAR_APP_BACKEND", "duckdb")
+    assert snapshot.load_snapshot(path) is None
+
+
+def test_snapshot_is_rejected_after_switching_source(data, monkeypatch):
+    tmp_path, path = data
+    monkeypatch.setenv("CAR_APP_BACKEND", "duckdb")
+    monkeypatch.setenv("CAR_APP_PARQUET", str(tmp_path / "other"))
+    with open(path, "w") as f:
+        json.dump({"rows": 1, "fingerprint": snapshot.fingerprint()}, f)
+    assert snapshot.load_snapshot(path) is not None
+    assert snapshot.data_files() == [str(tmp_path / "other" / "part.parquet")]
+    monkeypatch.setenv("CAR_APP_PARQUET", str(tmp_path / "store"))
+    assert snapshot.load_snapshot(path) is None
+
+
+def test_snapshot_is_rejected_when_a_file_of_the_source_changes(data, monkeypatch):
+    tmp_path, path = data
+    monkeypatch.setenv("CAR_APP_BACKEND", "duckdb")
+    monkeypatch.setenv("CAR_APP_PARQUET", str(tmp_path / "other"))
+    with open(path, "w") as f:
+        json.dump({"rows": 1, "fingerprint": snapshot.fingerprint()}, f)
+    (tmp_path / "imputed_output.csv").write_text("not read by this backend")
+    assert snapshot.load_snapshot(path) is not None
+    (tmp_path / "other" / "part.parquet").write_text("rewritten")
+    assert snapshot.load_snapshot(path) is None
@@ -0,0 +1,61 @@
+import logging
+import threading
+import time
+
+import snapshot
+
+# Background warm-up of a dashboard server process: imports the data stack,
+# loads the listings and fills the process-wide caches the interactive
+# sections use (aggregate cube, sketches, indexes, fits, default drilldown
+# charts), then rewrites the chart snapshot when it is stale. Started by the
+# first session of the process, so later visitors (and the rest of the first
+# one's page) find everything built.
+DEFAULT_BRAND = "Volkswagen"
+
+log = logging.getLogger("car_app.warmup")
+
+_started = False
+_lock = threading.Lock()
+
+
+def warm_caches():
+    from backends import get_backend
+    import charts
+    import fuel_costs
+
+    start = time.perf_counter()
+    backend = get_backend()
+    if snapshot.load_snapshot() is None:
+        snapshot.write_snapshot(backend)
+    else:
+        snapshot.build_snapshot(backend)  # fills the caches behind the static charts
+    brands = backend.brands()
+    brand = DEFAULT_BRAND if DEFAULT_BRAND in brands else brands[0]
+    model = backend.models(brand)[0]
+    years = backend.years(brand, model)
+    charts.model_price(backend, brand, model)
+    if years:
+        charts.model_price(backend, brand, model, years[0])
+    charts.depreciation_curves(backend, brand, model)
+    backend.comparables(brand, model, "2018-01-01", 80_000, 110)
+    charts.running_costs(backend, tuple(fuel_costs.DEFAULT_PRICES.items()),
+                         fuel_costs.DEFAULT_ANNUAL_KM, fuel_costs.DEFAULT_YEARS)
+    log.info("warm-up finished in %.1f s", time.perf_counter() - start)
+
+
+def _run():
+    try:
+        warm_caches()
+    except Exception:
+        log.exception("warm-up failed")
+
+
+def start():
+    # Start the warm-up thread once per process
+    global _started
+    with _lock:
+        if _started:
+            return False
+        _started = True
+    threading.Thread(target=_run, name="car-app-warmup", daemon=True).start()
+    return True